@@ -26,7 +26,7 @@ moment = Moment(app)
 mail = Mail(app)
 api = Api(app)
 jwt = JWTManager(app)
-cors = CORS(app, resources={r"/api/*": {"origins": ["http://localhost:3000", "https://trainingticks.com", "https://www.trainingticks.com"]}}, expose_headers=["x-auth-token"])
+cors = CORS(app, resources={r"/api/*": {"origins": ["http://localhost:3000", "https://trainingticks.com", "https://www.trainingticks.com"]}}, expose_headers=["x-auth-token", "ETag"])
 
 @app.before_request
 def before_request():
@@ -61,7 +61,7 @@ app.register_blueprint(auth_bp, url_prefix="/auth")
 from app.blog import bp as blog_bp
 app.register_blueprint(blog_bp, url_prefix="/blog")
 
-from app import routes, resources, models, errors, app_classes, dataviz, utils, analysis, ga, training_plan_utils
+from app import routes, resources, models, rollups, plan_occurrences, plan_expander, response_cache, chart_cache, errors, app_classes, dataviz, utils, analysis, ga, training_plan_utils, strava_fetch, stream_jobs, stream_archive, strava_webhooks, goal_jobs, commands
 
 # TODO: Would be good to have these as part of the auth blueprint still (or even their own blueprint) but don't want to deviate from tutorial too much!
 api.add_resource(auth.resources.UserLogin, "/api/login")
@@ -78,6 +78,9 @@ api.add_resource(resources.Monitoring, "/api/monitoring")
 api.add_resource(resources.AnnualStats, "/api/annual_stats")
 api.add_resource(resources.ActivityTypes, "/api/activity_types")
 api.add_resource(resources.CompletedActivities, "/api/completed_activities")
+api.add_resource(resources.StreamParseJobs, "/api/stream_parse_jobs")
+api.add_resource(resources.ChartData, "/api/chart_data/<chart_name>")
+api.add_resource(resources.StravaWebhook, "/api/strava_webhook")
 api.add_resource(resources.PlannedActivities, "/api/planned_activities")
 api.add_resource(resources.PlannedActivity, "/api/planned_activity/<planned_activity_id>")
 api.add_resource(resources.PlannedRaces, "/api/planned_races")
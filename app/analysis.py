@@ -1,244 +1,351 @@
-from flask import flash, redirect, url_for, request, session
+from flask import flash, redirect, url_for, request, session, has_request_context
 from flask_login import current_user
 from bokeh.embed import components
-from app import app, db, utils
-from app.models import TrainingGoal, ActivityCadenceAggregate, ActivityPaceAggregate, ActivityGradientAggregate, CalendarDay, Activity, Exercise, ExerciseType, ExerciseCategory
-from app.app_classes import TempCadenceAggregate, TempGradientAggregate, PlotComponentContainer
-from app.dataviz import generate_line_chart
-from sqlalchemy import func, or_
+from app import app, db, stream_store, bulk_utils, response_cache
+from app.models import TrainingGoal, ActivityCadenceAggregate, ActivityPaceAggregate, ActivityGradientAggregate, CalendarDay, Activity, Exercise, ExerciseType, StreamParseJob
+from app.app_classes import TempCadenceAggregate, TempGradientAggregate, WeeklyDistribution, PlotComponentContainer
+from app.dataviz import generate_line_chart_for_values
+from sqlalchemy import func, or_, case
+from sqlalchemy.orm import contains_eager, joinedload
 from stravalib.client import Client
-import pandas as pd
-import math
-from datetime import datetime, timedelta
+import numpy as np
+from datetime import datetime, date, timedelta
+
+RUN_GOAL_METRICS = ["Runs Completed Over Distance", "Weekly Distance", "Weekly Moving Time", "Weekly Elevation Gain"]
+STREAM_GOAL_METRICS = ["Time Spent Above Cadence", "Distance Climbing Above Gradient"]
+RUNNING_GOAL_METRICS = RUN_GOAL_METRICS + STREAM_GOAL_METRICS
 
 def evaluate_all_running_goals_for_current_week(user):
 	current_day = CalendarDay.query.filter(CalendarDay.calendar_date==datetime.date(datetime.today())).first()
 	current_week = current_day.calendar_week_start_date
-	evaluate_running_goals(week=current_week, goal_metric="Runs Completed Over Distance", user=user)
-	evaluate_running_goals(week=current_week, goal_metric="Weekly Distance", user=user)
-	evaluate_running_goals(week=current_week, goal_metric="Weekly Moving Time", user=user)
-	evaluate_running_goals(week=current_week, goal_metric="Weekly Elevation Gain", user=user)
-	evaluate_running_goals(week=current_week, goal_metric="Time Spent Above Cadence", calculate_weekly_aggregations_function=calculate_weekly_cadence_aggregations, user=user)
-	evaluate_running_goals(week=current_week, goal_metric="Distance Climbing Above Gradient", calculate_weekly_aggregations_function=calculate_weekly_gradient_aggregations, user=user)
-
-def evaluate_running_goals(week, goal_metric, calculate_weekly_aggregations_function=None, user=None):
+	evaluate_running_goals(week=current_week, user=user)
+
+def evaluate_running_goals(week, goal_metrics=RUNNING_GOAL_METRICS, user=None):
 	# Hack to handle parallel running of original approach and REST API
 	user = current_user if not user else user
 
-	# 1. Get the in-progress goals, or goals for the current week that have already been hit but might have got better
-	current_goals = user.training_goals.filter(or_(TrainingGoal.goal_start_date == week, TrainingGoal.goal_status == "In Progress")).filter_by(goal_metric=goal_metric).all()
-
-	weeks_to_evaluate = []
-	[weeks_to_evaluate.append(goal.goal_start_date) for goal in current_goals if goal.goal_start_date not in weeks_to_evaluate]
-
-	for week in weeks_to_evaluate:
-		run_activities = user.activities_filtered(activity_type="Run", week=week).all()
-		weekly_goals = user.training_goals.filter_by(goal_start_date=week).filter_by(goal_metric=goal_metric).all()
-
-		# 2. Ensure that all Run activities for the week have cadence calculated, bearing in mind that if user hasn't sync'ed for a few weeks we might need to look back at a historic week
-		for run in run_activities:
+	# 1. Get the in-progress goals, or goals for the current week that have already been hit but might have got better, along
+	# with the other goals for the same weeks. Every metric and week is evaluated together so each query below runs once
+	goal_weeks = db.session.query(TrainingGoal.goal_start_date
+		).filter(TrainingGoal.user_id == user.id
+		).filter(TrainingGoal.goal_metric.in_(goal_metrics)
+		).filter(or_(TrainingGoal.goal_start_date == week, TrainingGoal.goal_status == "In Progress"))
+	weekly_goals = user.training_goals.filter(TrainingGoal.goal_metric.in_(goal_metrics)).filter(TrainingGoal.goal_start_date.in_(goal_weeks.subquery())).all()
+
+	# A week's goals for a metric are only evaluated if at least one of them is current
+	current_goal_keys = set([(goal.goal_start_date, goal.goal_metric) for goal in weekly_goals if goal.goal_start_date == week or goal.goal_status == "In Progress"])
+	goals_to_evaluate = [goal for goal in weekly_goals if (goal.goal_start_date, goal.goal_metric) in current_goal_keys]
+	if len(goals_to_evaluate) == 0:
+		return
+
+	weeks_to_evaluate = sorted(set([goal.goal_start_date for goal in goals_to_evaluate]))
+	metrics_to_evaluate = set([goal.goal_metric for goal in goals_to_evaluate])
+	weekly_metric_values = {}
+
+	# 2. Queue up any Run activities for the weeks that don't have cadence calculated yet, bearing in mind that if user hasn't sync'ed for a few weeks we might need to look back at a historic week.
+	# The goals get evaluated again once the stream parsing jobs have finished
+	weekly_runs = weekly_run_activities(user, weeks_to_evaluate)
+	for run_week in weeks_to_evaluate:
+		for run in weekly_runs.get(run_week, []):
 			if not run.is_fully_parsed:
-				result = parse_streams(activity=run)
-				if result == "Not authorized":
+				enqueue_stream_parse(activity=run)
+				if user.strava_access_token is None and has_request_context():
 					flash("Some activities relevant to your goal may not be fully parsed.  Please Connect with Strava when you get chance.")
 					break
 
-		if goal_metric == "Runs Completed Over Distance":
-			for goal in weekly_goals:
-				# 3. Get the stats we need
-				distance_multiplier = 1609.344 if user.distance_uom_preference == "miles" else 1000
-				activities_over_distance = [activity for activity in run_activities if activity.distance >= int(goal.goal_dimension_value)*distance_multiplier]
-				# 4. Compare the current stats vs. goal where they're for the same cadence
-				goal.current_metric_value = len(activities_over_distance)
-				# 5. Set to success if the target has been hit and flash a congrats message
-				if goal.current_metric_value >= goal.goal_target:
-					goal.goal_status = "Successful"
-				# 6. Set to missed if if the time period has expired
-				if goal.goal_start_date + timedelta(days=7) < datetime.date(datetime.utcnow()) and goal.current_metric_value < goal.goal_target:
-					goal.goal_status = "Missed"
-
-		if goal_metric in (["Weekly Distance", "Weekly Moving Time", "Weekly Elevation Gain"]):
-			for goal in weekly_goals:
-				# 3. Get the stats we need
-				weekly_summary_stats = user.weekly_activity_type_stats(week=week).filter(Activity.activity_type=="Run").all()
-				# 4. Compare the current stats vs. goal where they're for the same cadence
-				for row in weekly_summary_stats: # Use a for loop to deal with it potentially being zero rows
-					if goal_metric == "Weekly Distance":
-						goal.current_metric_value = row.total_distance
-					elif goal_metric == "Weekly Moving Time":
-						goal.current_metric_value = row.total_moving_time.seconds
-					elif goal_metric == "Weekly Elevation Gain":
-						goal.current_metric_value = row.total_elevation_gain
-				# 5. Set to success if the target has been hit and flash a congrats message
+	# 3. Get the stats we need, with one query per family of metrics covering all of the weeks
+	if metrics_to_evaluate.intersection(STREAM_GOAL_METRICS):
+		if "Time Spent Above Cadence" in metrics_to_evaluate:
+			weekly_cadence_stats = group_by_week(user.weekly_cadence_stats().filter(Activity.week_start_date.in_(weeks_to_evaluate)).all())
+			for stats_week in weeks_to_evaluate:
+				weekly_aggregations = summarise_weekly_cadence_stats(weekly_cadence_stats.get(stats_week, []))
+				weekly_metric_values[(stats_week, "Time Spent Above Cadence")] = weekly_aggregations["summary"]
+		if "Distance Climbing Above Gradient" in metrics_to_evaluate:
+			weekly_gradient_stats = group_by_week(user.weekly_gradient_stats().filter(Activity.week_start_date.in_(weeks_to_evaluate)).all())
+			for stats_week in weeks_to_evaluate:
+				weekly_aggregations = summarise_weekly_gradient_stats(weekly_gradient_stats.get(stats_week, []))
+				weekly_metric_values[(stats_week, "Distance Climbing Above Gradient")] = weekly_aggregations["summary"]
+
+	# 4. Compare the current stats vs. goal, 5. set to success if the target has been hit and 6. set to missed if the time period has expired
+	distance_multiplier = 1609.344 if user.distance_uom_preference == "miles" else 1000
+	for goal in goals_to_evaluate:
+		runs = weekly_runs.get(goal.goal_start_date, [])
+
+		if goal.goal_metric == "Runs Completed Over Distance":
+			goal.current_metric_value = len([run for run in runs if run.distance >= int(goal.goal_dimension_value)*distance_multiplier])
+			if goal.current_metric_value >= goal.goal_target:
+				goal.goal_status = "Successful"
+
+		elif goal.goal_metric in ["Weekly Distance", "Weekly Moving Time", "Weekly Elevation Gain"]:
+			# Left as it was if there are no runs for the week
+			if len(runs) > 0:
+				if goal.goal_metric == "Weekly Distance":
+					goal.current_metric_value = sum([run.distance for run in runs if run.distance is not None])
+				elif goal.goal_metric == "Weekly Moving Time":
+					goal.current_metric_value = int(sum([run.moving_time for run in runs if run.moving_time is not None], timedelta()).total_seconds())
+				elif goal.goal_metric == "Weekly Elevation Gain":
+					goal.current_metric_value = sum([run.total_elevation_gain for run in runs if run.total_elevation_gain is not None])
+			if goal.current_metric_value >= goal.goal_target:
+				goal.goal_status = "Successful"
+
+		elif goal.goal_metric in STREAM_GOAL_METRICS:
+			metric_value = weekly_metric_values[(goal.goal_start_date, goal.goal_metric)].value_above(int(goal.goal_dimension_value))
+			if metric_value is not None:
+				goal.current_metric_value = metric_value
 				if goal.current_metric_value >= goal.goal_target:
 					goal.goal_status = "Successful"
-				# 6. Set to missed if if the time period has expired
-				if goal.goal_start_date + timedelta(days=7) < datetime.date(datetime.utcnow()) and goal.current_metric_value < goal.goal_target:
-					goal.goal_status = "Missed"
-
-		elif goal_metric in (["Time Spent Above Cadence", "Distance Climbing Above Gradient"]):
-			# 3. Get weekly stats as for the graph
-			weekly_aggregations = calculate_weekly_aggregations_function(week, user)
-			
-			for goal in weekly_goals:
-				goal_dimension_value = int(goal.goal_dimension_value)
-				# 4. Compare the current stats vs. goal where they're for the same cadence
-				for aggregate in weekly_aggregations["summary"]:
-					if aggregate.get_dimension_value() == goal_dimension_value:
-						goal.current_metric_value = aggregate.get_metric_value()
-						# 5. Set to success if the target has been hit and flash a congrats message
-						if goal.current_metric_value >= goal.goal_target:
-							goal.goal_status = "Successful"
-				# 6. Set to missed if if the time period has expired
-				if goal.goal_start_date + timedelta(days=7) < datetime.date(datetime.utcnow()) and goal.current_metric_value < goal.goal_target:
-					goal.goal_status = "Missed"
+
+		if goal.goal_start_date + timedelta(days=7) < datetime.date(datetime.utcnow()) and goal.current_metric_value < goal.goal_target:
+			goal.goal_status = "Missed"
 
 	db.session.commit()
 
+def group_by_week(weekly_stats):
+	stats_by_week = {}
+	for row in weekly_stats:
+		stats_by_week.setdefault(row.calendar_week_start_date, []).append(row)
+	return stats_by_week
+
+
+def weekly_run_activities(user, weeks):
+	weekly_runs = {}
+	for run in Activity.query.filter(Activity.owner == user
+			).filter(Activity.activity_type == "Run"
+			).filter(Activity.week_start_date.in_(weeks)
+			).all():
+		weekly_runs.setdefault(run.week_start_date, []).append(run)
+
+	return weekly_runs
+
+
+# Streams where the sample just takes the value at the data point, e.g. add "heartrate" here for heart rate aggregations
+POINT_VALUE_STREAMS = ["cadence"]
+STREAM_SAMPLE_FIELDS = ["start_time", "duration", "distance_travelled", "elevation_gained", "pace_seconds", "gradient"] + POINT_VALUE_STREAMS
 
-def aggregate_stream_data(data_points_df, groupby_field, sort_order="DESC"):
-	duration_aggregation = data_points_df.groupby([groupby_field])["duration"].sum()
-	distance_aggregation = data_points_df.groupby([groupby_field])["distance_travelled"].sum().round(decimals=1)
-	grouped_data = list(zip(duration_aggregation.index, duration_aggregation, distance_aggregation))
+def stream_samples(stream_data):
+	# Columnar version of walking the streams one data point at a time. Each sample covers the movement between a data point
+	# and the one before it, and as before we start from the 3rd data point. Missing values are NaN rather than None.
+	time_data = np.asarray(stream_data["time"], dtype=np.int64)
 
-	if sort_order == "DESC":
-		grouped_data.reverse()
-	
-	return grouped_data
+	if len(time_data) < 3:
+		return {field: np.empty(0) for field in STREAM_SAMPLE_FIELDS}
+
+	current_points = slice(2, None)
+	previous_points = slice(1, -1)
+	sample_time = time_data[current_points]
+	sample_count = len(sample_time)
+
+	duration = sample_time - time_data[previous_points]
+	distance_data = np.asarray(stream_data["distance"], dtype=np.float64)
+	distance_travelled = distance_data[current_points] - distance_data[previous_points]
+
+	if "altitude" in stream_data:
+		altitude_data = np.asarray(stream_data["altitude"], dtype=np.float64)
+		elevation_gained = altitude_data[current_points] - altitude_data[previous_points]
+		# Extra cleansing of elevation to deal with dodgy values during barometer calibration
+		is_calibration_error = (elevation_gained != 0) & (((sample_time < 60) & (elevation_gained > 1)) | (elevation_gained < 0))
+		elevation_gained[is_calibration_error] = np.nan
+	else:
+		elevation_gained = np.full(sample_count, np.nan)
+
+	pace_seconds = np.full(sample_count, np.nan)
+	if "velocity_smooth" in stream_data:
+		velocity = np.asarray(stream_data["velocity_smooth"], dtype=np.float64)[current_points]
+		is_moving = velocity > 0
+		# Truncate to whole seconds per km in the same way as utils.convert_mps_to_km_pace, then round up into 5 second buckets
+		pace_seconds[is_moving] = np.ceil(np.trunc(1 / (velocity[is_moving] / 1000)) / 5) * 5
+
+	if "grade_smooth" in stream_data:
+		gradient = np.floor(np.asarray(stream_data["grade_smooth"], dtype=np.float64)[current_points])
+		# Extra cleansing of gradient to deal with dodgy value during barometer calibration
+		gradient[(sample_time < 60) & (gradient > 10)] = np.nan
+	else:
+		gradient = np.full(sample_count, np.nan)
+
+	# Discard anything more than 10 seconds that probably relates to stopping
+	is_moving_sample = duration <= 10
+
+	samples = dict(start_time=time_data[previous_points],
+				   duration=duration,
+				   distance_travelled=distance_travelled,
+				   elevation_gained=elevation_gained,
+				   pace_seconds=pace_seconds,
+				   gradient=gradient)
+
+	for stream_type in POINT_VALUE_STREAMS:
+		if stream_type in stream_data:
+			samples[stream_type] = np.asarray(stream_data[stream_type], dtype=np.float64)[current_points]
+		else:
+			samples[stream_type] = np.full(sample_count, np.nan)
+
+	return {field: values[is_moving_sample] for field, values in samples.items()}
+
+
+# Each aggregation bins the samples by a dimension and records the time (and optionally distance) at and above each bin,
+# i.e. above means faster than for pace. Bins with less than min_seconds are grouped into the next aggregate as outliers.
+STREAM_AGGREGATIONS = [
+	dict(stream="cadence",
+		 sample_field="cadence",
+		 model=ActivityCadenceAggregate,
+		 relationship="activity_cadence_aggregates",
+		 sort_order="DESC",
+		 dimension_multiplier=2, # Strava gives cadence for one foot
+		 min_seconds=10,
+		 stop_below=None,
+		 columns=dict(dimension="cadence",
+					  seconds_at="total_seconds_at_cadence",
+					  seconds_above="total_seconds_above_cadence")),
+	dict(stream="velocity_smooth",
+		 sample_field="pace_seconds",
+		 model=ActivityPaceAggregate,
+		 relationship="activity_pace_aggregates",
+		 sort_order="ASC",
+		 dimension_multiplier=1,
+		 min_seconds=10,
+		 stop_below=None,
+		 columns=dict(dimension="pace_seconds",
+					  seconds_at="total_seconds_at_pace",
+					  seconds_above="total_seconds_above_pace")),
+	dict(stream="grade_smooth",
+		 sample_field="gradient",
+		 model=ActivityGradientAggregate,
+		 relationship="activity_gradient_aggregates",
+		 sort_order="DESC",
+		 dimension_multiplier=1,
+		 min_seconds=5,
+		 stop_below=2, # We don't care about anything < 2% as it's not going to be significant enough
+		 columns=dict(dimension="gradient",
+					  seconds_at="total_seconds_at_gradient",
+					  seconds_above="total_seconds_above_gradient",
+					  metres_at="total_metres_at_gradient",
+					  metres_above="total_metres_above_gradient")),
+]
+
+def stream_histogram(samples, aggregation):
+	dimension_values = samples[aggregation["sample_field"]]
+	is_present = ~np.isnan(dimension_values)
+	bins, bin_index = np.unique(dimension_values[is_present], return_inverse=True)
+	seconds = np.bincount(bin_index, weights=samples["duration"][is_present], minlength=len(bins)).astype(np.int64)
+	metres = np.round(np.bincount(bin_index, weights=samples["distance_travelled"][is_present], minlength=len(bins)), decimals=1)
+
+	if aggregation["sort_order"] == "DESC":
+		bins, seconds, metres = bins[::-1], seconds[::-1], metres[::-1]
+
+	# Convert back to plain python numbers so that they can be passed straight through to the DB
+	return list(zip(bins.astype(np.int64).tolist(), seconds.tolist(), np.cumsum(seconds).tolist(), metres.tolist(), np.cumsum(metres).tolist()))
+
+def stream_aggregate_values(samples, aggregation):
+	columns = aggregation["columns"]
+	aggregate_values = []
+	this_aggregate_seconds = 0
+	this_aggregate_metres = 0
+
+	for dimension_value, seconds, seconds_above, metres, metres_above in stream_histogram(samples, aggregation):
+		this_aggregate_seconds += seconds
+		this_aggregate_metres += metres
+
+		if aggregation["stop_below"] is not None and dimension_value < aggregation["stop_below"]:
+			break
+
+		if this_aggregate_seconds > aggregation["min_seconds"]:
+			values = {columns["dimension"]: dimension_value*aggregation["dimension_multiplier"],
+					  columns["seconds_at"]: this_aggregate_seconds,
+					  columns["seconds_above"]: seconds_above}
+			if "metres_at" in columns:
+				values[columns["metres_at"]] = this_aggregate_metres
+				values[columns["metres_above"]] = metres_above
+
+			aggregate_values.append(values)
+			this_aggregate_seconds = 0
+			this_aggregate_metres = 0
+
+	return aggregate_values
+
+def insert_stream_aggregates(activity, samples, stream_aggregations):
+	# One multi-row insert per aggregate table rather than an INSERT per aggregate
+	if activity.id is None:
+		db.session.flush()
+
+	for aggregation in stream_aggregations:
+		bulk_utils.insert_rows(aggregation["model"], [dict(activity_id=activity.id, **values) for values in stream_aggregate_values(samples, aggregation)])
+	response_cache.mark_users_changed([activity.user_id])
+
+
+PENDING_STREAM_PARSE_STATUSES = ["Queued", "Running", "Retrying"]
+
+def enqueue_stream_parse(activity):
+	# Jobs use the owner's stored Strava tokens when they run, so nothing about the token is kept with the job. Nothing
+	# to do if there's already a job on the go for the activity
+	if activity.id is not None:
+		existing_job = activity.stream_parse_jobs.filter(StreamParseJob.status.in_(PENDING_STREAM_PARSE_STATUSES)).first()
+		if existing_job is not None:
+			return existing_job
+
+	job = StreamParseJob(owner=activity.owner,
+						 activity=activity,
+						 status="Queued",
+						 attempts=0,
+						 next_attempt_datetime=datetime.utcnow())
+	db.session.add(job)
+
+	return job
 
 
 def parse_streams(activity, strava_access_token = None):
 	if activity.activity_type != "Run":
 		return "Invalid activity type"
 
-	strava_client = Client()
-
-	if not (session.get("strava_access_token") or strava_access_token):
-		return "Not authorized"
-
-	access_token = session["strava_access_token"] if strava_access_token is None else strava_access_token
-	strava_client.access_token = access_token
-
-	stream_types = ["time", "cadence", "velocity_smooth", "distance", "altitude", "grade_smooth"]
-
-	try:
-		activity_streams = strava_client.get_activity_streams(activity.external_id, types=stream_types)
-	except:
-		return "Not authorized"
-
-	if activity_streams is not None:
-		#cadence_records = []
-		data_points_df = pd.DataFrame(columns=["start_time", "duration", "distance_travelled", "elevation_gained", "pace_seconds", "cadence", "gradient"])
-		dp_ind = 0
-		df_ind = 0
-
-		# construct a data frame.  We can probably do this more efficiently by constructing a list first then only putting into the data frame once
-		for time_data_point in activity_streams["time"].data:
-			if dp_ind > 1:
-				duration = (time_data_point - activity_streams["time"].data[dp_ind-1])
-				distance_travelled = (activity_streams["distance"].data[dp_ind] - activity_streams["distance"].data[dp_ind-1])
-				elevation_gained = (activity_streams["altitude"].data[dp_ind] - activity_streams["altitude"].data[dp_ind-1]) if "altitude" in activity_streams else None
-				pace_seconds = math.ceil(utils.convert_mps_to_km_pace(activity_streams["velocity_smooth"].data[dp_ind]).total_seconds() / 5) * 5 if "velocity_smooth" in activity_streams and activity_streams["velocity_smooth"].data[dp_ind] > 0 else None
-				gradient = math.floor(activity_streams["grade_smooth"].data[dp_ind]) if "grade_smooth" in activity_streams else None
-
-				# Extra cleansing of gradient to deal with dodgy value during barometer calibration
-				gradient = None if time_data_point < 60 and gradient > 10 else gradient
-				elevation_gained = None if elevation_gained and ((time_data_point < 60 and elevation_gained > 1) or elevation_gained < 0) else elevation_gained
-
-				if duration <= 10: # Discard anything more than 10 seconds that probably relates to stopping
-					data_points_df.loc[df_ind] = [activity_streams["time"].data[dp_ind-1],
-												  duration,
-												  distance_travelled,
-												  elevation_gained,
-												  pace_seconds,
-												  activity_streams["cadence"].data[dp_ind] if "cadence" in activity_streams else None,
-												  gradient]
-					df_ind += 1
-			dp_ind += 1
+	# Use the streams we already have stored if possible so that re-parsing doesn't need to go back to Strava
+	stream_data = stream_store.load_activity_streams(activity)
+
+	if not stream_data:
+		strava_client = Client()
+
+		# Stream parsing jobs run outside of a request so can only use the token they were given
+		if strava_access_token is None and has_request_context():
+			strava_access_token = session.get("strava_access_token")
+
+		if not strava_access_token:
+			return "Not authorized"
+
+		access_token = strava_access_token
+		strava_client.access_token = access_token
+
+		stream_types = ["time", "cadence", "velocity_smooth", "distance", "altitude", "grade_smooth"]
+
+		try:
+			activity_streams = strava_client.get_activity_streams(activity.external_id, types=stream_types)
+		except:
+			return "Not authorized"
+
+		if activity_streams is None:
+			return "No activity streams available"
+
+		# Always aggregate from the stored types so we get the same results when re-aggregating later
+		stream_data = stream_store.save_activity_streams(activity, {stream_type: stream.data for stream_type, stream in activity_streams.items()})
+
+	if stream_data:
+		samples = stream_samples(stream_data)
 
 		# Test if we corrected for calibration such that it's worth overwriting the Strava elevation gain. Note that
 		# Strava tends to come up with a lower number normally (probably due to smoothing) so we only use this if it's a lower number
-		total_elevation_gain = data_points_df["elevation_gained"].sum()
-		if total_elevation_gain < activity.total_elevation_gain:
+		total_elevation_gain = float(np.nansum(samples["elevation_gained"]))
+		if activity.total_elevation_gain is not None and total_elevation_gain < activity.total_elevation_gain:
 			activity.total_elevation_gain = total_elevation_gain
 			activity.is_overwritten_elevation_gain = True
-			flash("Bad elevation gain detected on activity. Overwritten in Training Ticks based on calibration errors detected.")
-
-		# Perform aggregations for cadence if needed
-		if not activity.activity_cadence_aggregates.first() and "cadence" in activity_streams:
-			cadence_data = aggregate_stream_data(data_points_df, groupby_field="cadence")
-
-			running_total = 0
-			this_aggregate_total = 0
-
-			for cadence_group in cadence_data:
-				running_total += cadence_group[1]
-				this_aggregate_total += cadence_group[1]
-				
-				# Group up any outliers with seconds < 10 seconds into the next aggregate
-				if this_aggregate_total > 10:
-					activity_cadence_aggregate = ActivityCadenceAggregate(activity=activity,
-																		  cadence=cadence_group[0]*2,
-																		  total_seconds_at_cadence=this_aggregate_total,
-																		  total_seconds_above_cadence=running_total)
-					db.session.add(activity_cadence_aggregate)
-					this_aggregate_total = 0
-
-			activity.median_cadence = data_points_df["cadence"].median()*2
-
-		# Perform aggregations for pace if needed
-		if not activity.activity_pace_aggregates.first() and "velocity_smooth" in activity_streams:
-			pace_data = aggregate_stream_data(data_points_df, groupby_field="pace_seconds", sort_order="ASC")
-			
-			running_total = 0
-			this_aggregate_total = 0
-
-			for pace_group in pace_data:
-				running_total += pace_group[1]
-				this_aggregate_total += pace_group[1]
-				
-				# Group up any outliers with seconds < 10 seconds into the next aggregate
-				if this_aggregate_total > 10:
-					activity_pace_aggregate = ActivityPaceAggregate(activity=activity,
-																	pace_seconds=pace_group[0],
-																	total_seconds_at_pace=this_aggregate_total,
-																	total_seconds_above_pace=running_total)
-					db.session.add(activity_pace_aggregate)
-					this_aggregate_total = 0
-
-		# Perform aggregations for gradient if needed
-		if not activity.activity_gradient_aggregates.first() and "grade_smooth" in activity_streams:
-			gradient_data = aggregate_stream_data(data_points_df, groupby_field="gradient")
-
-			running_total_duration = 0
-			running_total_distance = 0
-			this_aggregate_total_duration = 0
-			this_aggregate_total_distance = 0
-
-			for gradient_group in gradient_data:
-				running_total_duration += gradient_group[1]
-				running_total_distance += gradient_group[2]
-				this_aggregate_total_duration += gradient_group[1]
-				this_aggregate_total_distance += gradient_group[2]
-				
-				# We don't care about anything < 2% as it's not going to be significant enough
-				if gradient_group[0] < 2:
-					break
+			if has_request_context():
+				flash("Bad elevation gain detected on activity. Overwritten in Training Ticks based on calibration errors detected.")
 
-				# Group up any outliers with seconds < 5 seconds into the next aggregate
-				if this_aggregate_total_duration > 5:
-					activity_gradient_aggregate = ActivityGradientAggregate(activity=activity,
-																			gradient=gradient_group[0],
-																			total_seconds_at_gradient=this_aggregate_total_duration,
-																			total_seconds_above_gradient=running_total_duration,
-																			total_metres_at_gradient=this_aggregate_total_distance,
-																			total_metres_above_gradient=running_total_distance)
-					db.session.add(activity_gradient_aggregate)
-					this_aggregate_total_duration = 0
-					this_aggregate_total_distance = 0
+		# Perform aggregations for each dimension that's available and hasn't already been done
+		stream_aggregations = [aggregation for aggregation in STREAM_AGGREGATIONS
+								   if aggregation["stream"] in stream_data and not getattr(activity, aggregation["relationship"]).first()]
+		insert_stream_aggregates(activity, samples, stream_aggregations)
 
-		
-		flash("Processed detailed activity data for {activity}".format(activity=activity.name))
+		if "cadence" in [aggregation["sample_field"] for aggregation in stream_aggregations]:
+			activity.median_cadence = float(np.nanmedian(samples["cadence"]))*2
+
+		if has_request_context():
+			flash("Processed detailed activity data for {activity}".format(activity=activity.name))
 
 		activity.is_fully_parsed = True
 		db.session.commit()
@@ -247,38 +354,23 @@ def parse_streams(activity, strava_access_token = None):
 		return "No activity streams available"
 
 
-def calculate_weekly_cadence_aggregations(week, user=None):
+def calculate_weekly_cadence_aggregations(week, user=None, last_week=None):
 	# Hack to handle parallel running of original approach and REST API
 	user = current_user if user is None else user
 
-	weekly_cadence_stats = user.weekly_cadence_stats(week=week).all()
-	min_significant_cadence = 30
-	max_significant_cadence = 300
-	previous_cadence = 0
-	weekly_running_total = 0
-
-	weekly_cadence_summary = []
-
-	# For the lower range in graph look for aything more than 5 minutes
-	for cadence_aggregate in weekly_cadence_stats:
-		# Fill in any gaps
-		if cadence_aggregate.cadence < previous_cadence - 2:
-			gap_cadence = previous_cadence - 2
-			while gap_cadence > cadence_aggregate.cadence:
-				weekly_cadence_summary.append(TempCadenceAggregate(cadence=gap_cadence,
-														   		   total_seconds_above_cadence=weekly_running_total))
-				gap_cadence -= 2
-
-		# Now get on with adding the current cadence
-		weekly_running_total += cadence_aggregate.total_seconds_at_cadence
-		if cadence_aggregate.total_seconds_at_cadence >= 60 and max_significant_cadence==300: # only overwrite the max once (we're iterating in descing order)
-			max_significant_cadence = cadence_aggregate.cadence 
-		if cadence_aggregate.total_seconds_at_cadence >= 300: # keep overwriting until we get to the end and have the min
-			min_significant_cadence = cadence_aggregate.cadence
-		weekly_cadence_summary.append(TempCadenceAggregate(cadence=cadence_aggregate.cadence,
-														   total_seconds_above_cadence=weekly_running_total))
-		# Set the previous_cadence so we can detect gaps
-		previous_cadence = cadence_aggregate.cadence
+	# Given a last_week, everything from week up to the end of that week is summarised together
+	if last_week is None:
+		return summarise_weekly_cadence_stats(user.weekly_cadence_stats(week=week).all())
+	return summarise_weekly_cadence_stats(user.weekly_cadence_stats().filter(Activity.week_start_date.between(week, last_week)).all())
+
+
+def summarise_weekly_cadence_stats(weekly_cadence_stats):
+	weekly_cadence_summary = WeeklyDistribution(dimension_values=[cadence_aggregate.cadence for cadence_aggregate in weekly_cadence_stats],
+												values_at=[cadence_aggregate.total_seconds_at_cadence for cadence_aggregate in weekly_cadence_stats],
+												step=2, aggregate_class=TempCadenceAggregate)
+
+	# For the lower range in graph look for aything more than 5 minutes, and the upper anything more than a minute
+	min_significant_cadence, max_significant_cadence = weekly_cadence_summary.significant_range(min_value_at=300, max_value_at=60, default_min=30, default_max=300)
 
 	weekly_cadence_aggregations = dict(summary = weekly_cadence_summary,
 									   min_significant_cadence = min_significant_cadence,
@@ -286,38 +378,23 @@ def calculate_weekly_cadence_aggregations(week, user=None):
 	return weekly_cadence_aggregations
 
 
-def calculate_weekly_gradient_aggregations(week, user=None):
+def calculate_weekly_gradient_aggregations(week, user=None, last_week=None):
 	# Hack to handle parallel running of original approach and REST API
 	user = current_user if user is None else user
 
-	weekly_gradient_stats = user.weekly_gradient_stats(week=week).all()
-	min_significant_gradient = 1
-	max_significant_gradient = 100
-	previous_gradient = 0
-	weekly_running_total = 0
-
-	weekly_gradient_summary = []
-
-	# For the lower range in graph look for aything more than 5 minutes
-	for gradient_aggregate in weekly_gradient_stats:
-		# Fill in any gaps
-		if gradient_aggregate.gradient < previous_gradient - 1:
-			gap_gradient = previous_gradient - 1
-			while gap_gradient > gradient_aggregate.gradient:
-				weekly_gradient_summary.append(TempGradientAggregate(gradient=gap_gradient,
-														   		     total_metres_above_gradient=weekly_running_total))
-				gap_gradient -= 1
-
-		# Now get on with adding the current gradient
-		weekly_running_total += gradient_aggregate.total_metres_at_gradient
-		if gradient_aggregate.total_metres_at_gradient >= 100 and max_significant_gradient==100: # only overwrite the max once (we're iterating in descing order)
-			max_significant_gradient = gradient_aggregate.gradient 
-		if gradient_aggregate.total_metres_at_gradient >= 100: # keep overwriting until we get to the end and have the min
-			min_significant_gradient = gradient_aggregate.gradient
-		weekly_gradient_summary.append(TempGradientAggregate(gradient=gradient_aggregate.gradient,
-														   	 total_metres_above_gradient=weekly_running_total))
-		# Set the previous_gradient so we can detect gaps
-		previous_gradient = gradient_aggregate.gradient
+	# Given a last_week, everything from week up to the end of that week is summarised together
+	if last_week is None:
+		return summarise_weekly_gradient_stats(user.weekly_gradient_stats(week=week).all())
+	return summarise_weekly_gradient_stats(user.weekly_gradient_stats().filter(Activity.week_start_date.between(week, last_week)).all())
+
+
+def summarise_weekly_gradient_stats(weekly_gradient_stats):
+	weekly_gradient_summary = WeeklyDistribution(dimension_values=[gradient_aggregate.gradient for gradient_aggregate in weekly_gradient_stats],
+												 values_at=[gradient_aggregate.total_metres_at_gradient for gradient_aggregate in weekly_gradient_stats],
+												 step=1, aggregate_class=TempGradientAggregate)
+
+	# Anything with at least 100m climbed counts towards both ends of the range
+	min_significant_gradient, max_significant_gradient = weekly_gradient_summary.significant_range(min_value_at=100, max_value_at=100, default_min=1, default_max=100)
 
 	weekly_gradient_aggregations = dict(summary = weekly_gradient_summary,
 									    min_significant_gradient = min_significant_gradient,
@@ -326,37 +403,66 @@ def calculate_weekly_gradient_aggregations(week, user=None):
 
 
 def get_cadence_goal_history_charts(week):
-	weekly_cadence_goals = current_user.training_goals.filter_by(goal_start_date=week).filter_by(goal_metric="Time Spent Above Cadence").all()
+	return get_goal_history_charts(week=week, goal_metric="Time Spent Above Cadence")
 
-	cadence_goal_plot_containers = []
 
-	run_category = current_user.exercise_categories.filter_by(category_name="Run").first()
-	if run_category is not None:
-		line_color = run_category.line_color
-	else:
-		line_color = None
-
-	for goal in weekly_cadence_goals:
-		goal_history = db.session.query(
-				CalendarDay.calendar_week_start_date,
-				func.sum(ActivityCadenceAggregate.total_seconds_at_cadence).label("total_seconds_above_cadence")
-			).join(ActivityCadenceAggregate.activity
-			).join(CalendarDay, func.date(Activity.start_datetime)==CalendarDay.calendar_date
-			).filter(Activity.owner == current_user
-			).filter(ActivityCadenceAggregate.cadence >= int(goal.goal_dimension_value)
-			).filter(Activity.start_datetime >= (week - timedelta(days=365))
-			).filter(Activity.start_datetime < (week + timedelta(days=7))
-			).group_by(CalendarDay.calendar_week_start_date
-			).order_by(CalendarDay.calendar_week_start_date).all()
-
-		plot_name = "Historic {metric} of {dimension_value}".format(metric=goal.goal_metric , dimension_value=goal.goal_dimension_value)
-		cadence_goal_history_plot = generate_line_chart(dataset=goal_history, plot_height=100, dimension_name="calendar_week_start_date", measure_name="total_seconds_above_cadence", line_color=line_color,
-											y_tick_function_code="return parseInt(tick / 60);")
-		cadence_goal_history_plot_script, cadence_goal_history_plot_div = components(cadence_goal_history_plot)
-		cadence_goal_plot_container = PlotComponentContainer(name=plot_name, plot_div=cadence_goal_history_plot_div, plot_script=cadence_goal_history_plot_script)
-		cadence_goal_plot_containers.append(cadence_goal_plot_container)
-
-	return cadence_goal_plot_containers
+def weekly_activity_dataset(week, user=None):
+	# Everything the days of the weekly activity page show, in the same number of queries however much history there is.
+	# Only the week's exercises and activities are loaded, along with what the page reads from them, and then grouped up
+	# by day and category.
+	user = current_user if user is None else user
+	days = CalendarDay.query.filter_by(calendar_week_start_date=week).order_by(CalendarDay.calendar_date.desc()).all()
+	categories = user.exercise_categories.all()
+
+	week_exercises = Exercise.query.join(ExerciseType, (ExerciseType.id == Exercise.exercise_type_id)
+		).options(contains_eager(Exercise.type).joinedload(ExerciseType.exercise_category), joinedload(Exercise.scheduled_exercise)
+		).filter(ExerciseType.owner == user
+		).filter(Exercise.week_start_date == week
+		).order_by(Exercise.exercise_datetime.desc()).all()
+	week_activities = Activity.query.options(joinedload(Activity.category)
+		).filter(Activity.owner == user
+		).filter(Activity.week_start_date == week).all()
+
+	exercises_by_day_and_category = {}
+	for exercise in week_exercises:
+		exercises_by_day_and_category.setdefault((exercise.exercise_date, exercise.type.exercise_category_id), []).append(exercise)
+	activities_by_day = {}
+	for activity in week_activities:
+		activities_by_day.setdefault(activity.activity_date, []).append(activity)
+
+	future_days = [day.day_of_week for day in days if day.calendar_date > date.today()]
+	scheduled_activities_by_day = {}
+	scheduled_exercise_categories_by_day = {}
+	if len(future_days) > 0:
+		for scheduled_activity in user.scheduled_activities_for_days(future_days).all():
+			scheduled_activities_by_day.setdefault(scheduled_activity.scheduled_day, []).append(scheduled_activity)
+		for scheduled_exercise_category in user.scheduled_exercise_categories_for_days(future_days).all():
+			scheduled_exercise_categories_by_day.setdefault(scheduled_exercise_category.scheduled_day, []).append(scheduled_exercise_category)
+
+	week_dataset = []
+	week_activity_count = 0 # for plotting the current week indicator at the right height on the graph
+
+	for day in days:
+		exercises_by_category = []
+		# Categorised exercises first, then uncategorised
+		for category in categories + [None]:
+			category_exercises = exercises_by_day_and_category.get((day.calendar_date, category.id if category is not None else None), [])
+			if len(category_exercises) > 0:
+				exercises_by_category.append(dict(category=category,
+												  exercise_count=len(category_exercises),
+												  exercises=category_exercises))
+				week_activity_count += 1
+		day_activities = activities_by_day.get(day.calendar_date, [])
+		week_activity_count += len(day_activities)
+
+		is_future_day = day.calendar_date > date.today()
+		week_dataset.append(dict(day=day,
+								 exercises_by_category=exercises_by_category,
+								 activities=day_activities,
+								 scheduled_activities=scheduled_activities_by_day.get(day.day_of_week, []) if is_future_day else [],
+								 scheduled_exercise_categories=scheduled_exercise_categories_by_day.get(day.day_of_week, []) if is_future_day else []))
+
+	return week_dataset, week_activity_count
 
 
 def evaluate_exercise_set_goals(week):
@@ -379,80 +485,103 @@ def evaluate_exercise_set_goals(week):
 	db.session.commit()
 
 
-def get_goal_history_charts(week, goal_metric):
-	weekly_goals = current_user.training_goals.filter_by(goal_start_date=week).filter_by(goal_metric=goal_metric).all()
+def goal_history_series(user, week, goal_metric, dimension_values):
+	# The weekly history of the year up to week for every goal of a metric in one query, with a conditional aggregate for
+	# each goal dimension value. Weeks where nothing counted towards a goal come back as NULL and are left out of its
+	# series, the same as when each goal had its own query. Returns a (week start dates, values) pair per dimension value.
+	if goal_metric == "Time Spent Above Cadence":
+		week_start_date = Activity.week_start_date
+		measures = [func.sum(case([(ActivityCadenceAggregate.cadence >= int(dimension_value), ActivityCadenceAggregate.total_seconds_at_cadence)]))
+					for dimension_value in dimension_values]
+		goal_history = db.session.query(week_start_date, *measures
+			).join(ActivityCadenceAggregate.activity
+			).filter(Activity.owner == user
+			).filter(ActivityCadenceAggregate.cadence >= min([int(dimension_value) for dimension_value in dimension_values])
+			).filter(Activity.activity_date >= (week - timedelta(days=365))
+			).filter(Activity.activity_date < (week + timedelta(days=7)))
+
+	elif goal_metric == "Distance Climbing Above Gradient":
+		week_start_date = Activity.week_start_date
+		measures = [func.sum(case([(ActivityGradientAggregate.gradient >= int(dimension_value), ActivityGradientAggregate.total_metres_at_gradient)]))
+					for dimension_value in dimension_values]
+		goal_history = db.session.query(week_start_date, *measures
+			).join(ActivityGradientAggregate.activity
+			).filter(Activity.owner == user
+			).filter(ActivityGradientAggregate.gradient >= min([int(dimension_value) for dimension_value in dimension_values])
+			).filter(Activity.activity_date >= (week - timedelta(days=365))
+			).filter(Activity.activity_date < (week + timedelta(days=7)))
+
+	elif goal_metric == "Exercise Sets Completed":
+		# A dimension value of "None" is a goal for sets of any category
+		week_start_date = Exercise.week_start_date
+		measures = [func.sum(case([(ExerciseType.exercise_category_id == int(dimension_value), 1)])) if dimension_value != "None" else func.count(Exercise.id)
+					for dimension_value in dimension_values]
+		goal_history = db.session.query(week_start_date, *measures
+			).join(Exercise.type
+			).filter(ExerciseType.owner == user
+			).filter(Exercise.exercise_date >= (week - timedelta(days=365))
+			).filter(Exercise.exercise_date < (week + timedelta(days=7)))
+
+	goal_history = goal_history.group_by(week_start_date).order_by(week_start_date).all()
+
+	series = {}
+	for measure_index, dimension_value in enumerate(dimension_values):
+		weeks_with_values = [row for row in goal_history if row[measure_index + 1] is not None]
+		series[dimension_value] = ([row[0] for row in weeks_with_values], [row[measure_index + 1] for row in weeks_with_values])
+	return series
+
+
+def get_goal_history_charts(week, goal_metric, user=None):
+	user = current_user if user is None else user
+	weekly_goals = user.training_goals.filter_by(goal_start_date=week).filter_by(goal_metric=goal_metric).all()
+	if len(weekly_goals) == 0:
+		return []
 
-	goal_plot_containers = []
+	dimension_values = []
+	for goal in weekly_goals:
+		if goal.goal_dimension_value not in dimension_values:
+			dimension_values.append(goal.goal_dimension_value)
+	goal_history_by_dimension_value = goal_history_series(user, week, goal_metric, dimension_values)
 
 	# Set line colors for runs, which we'll override for Exercise Sets goals
-	run_category = current_user.exercise_categories.filter_by(category_name="Run").first()
+	categories = user.exercise_categories.all()
+	run_category = next((category for category in categories if category.category_name == "Run"), None)
 	if run_category is not None:
 		line_color = run_category.line_color
 	else:
 		line_color = None
 
+	goal_plot_containers = []
+
 	for goal in weekly_goals:
-		if goal_metric == "Time Spent Above Cadence":
-			goal_history = db.session.query(
-					CalendarDay.calendar_week_start_date,
-					func.sum(ActivityCadenceAggregate.total_seconds_at_cadence).label("total_seconds_above_cadence")
-				).join(ActivityCadenceAggregate.activity
-				).join(CalendarDay, func.date(Activity.start_datetime)==CalendarDay.calendar_date
-				).filter(Activity.owner == current_user
-				).filter(ActivityCadenceAggregate.cadence >= int(goal.goal_dimension_value)
-				).filter(Activity.start_datetime >= (week - timedelta(days=365))
-				).filter(Activity.start_datetime < (week + timedelta(days=7))
-				).group_by(CalendarDay.calendar_week_start_date
-				).order_by(CalendarDay.calendar_week_start_date).all()
+		week_start_dates, measure_values = goal_history_by_dimension_value[goal.goal_dimension_value]
+		if len(week_start_dates) == 0:
+			continue
 
+		if goal_metric == "Time Spent Above Cadence":
 			plot_name = "Historic {metric} of {dimension_value}".format(metric=goal.goal_metric , dimension_value=goal.goal_dimension_value)
-			goal_history_plot = generate_line_chart(dataset=goal_history, plot_height=100, dimension_name="calendar_week_start_date", measure_name="total_seconds_above_cadence", line_color=line_color,
+			goal_history_plot = generate_line_chart_for_values(week_start_dates, measure_values, plot_height=100, line_color=line_color,
 											y_tick_function_code="return parseInt(tick / 60);")
 
 		elif goal_metric == "Distance Climbing Above Gradient":
-			goal_history = db.session.query(
-					CalendarDay.calendar_week_start_date,
-					func.sum(ActivityGradientAggregate.total_metres_at_gradient).label("total_metres_above_gradient")
-				).join(ActivityGradientAggregate.activity
-				).join(CalendarDay, func.date(Activity.start_datetime)==CalendarDay.calendar_date
-				).filter(Activity.owner == current_user
-				).filter(ActivityGradientAggregate.gradient >= int(goal.goal_dimension_value)
-				).filter(Activity.start_datetime >= (week - timedelta(days=365))
-				).filter(Activity.start_datetime < (week + timedelta(days=7))
-				).group_by(CalendarDay.calendar_week_start_date
-				).order_by(CalendarDay.calendar_week_start_date).all()
-
 			plot_name = "Historic {metric} of {dimension_value}%".format(metric=goal.goal_metric , dimension_value=goal.goal_dimension_value)
-			goal_history_plot = generate_line_chart(dataset=goal_history, plot_height=100, dimension_name="calendar_week_start_date", measure_name="total_metres_above_gradient", line_color=line_color,
+			goal_history_plot = generate_line_chart_for_values(week_start_dates, measure_values, plot_height=100, line_color=line_color,
 											y_tick_function_code="return parseInt(tick / 1000);")
 
 		elif goal_metric == "Exercise Sets Completed":
-			if goal.goal_dimension_value == "None":
-				line_color = "#292b2c"
+			goal_category = next((category for category in categories if str(category.id) == goal.goal_dimension_value), None)
+			if goal_category is None:
+				goal_line_color = "#292b2c"
 				goal_category_name = "Uncategorised"
 			else:
-				goal_category = ExerciseCategory.query.get(int(goal.goal_dimension_value))
-				line_color = goal_category.line_color
+				goal_line_color = goal_category.line_color
 				goal_category_name = goal_category.category_name
 
-			goal_history = db.session.query(
-					CalendarDay.calendar_week_start_date,
-					func.count(Exercise.id).label("exercise_sets_completed")
-				).join(Exercise.type
-				).join(CalendarDay, func.date(Exercise.exercise_datetime)==CalendarDay.calendar_date
-				).filter(ExerciseType.owner == current_user
-				).filter(or_(ExerciseType.exercise_category_id == int(goal.goal_dimension_value), goal.goal_dimension_value == "None")
-				).filter(Exercise.exercise_datetime >= (week - timedelta(days=365))
-				).filter(Exercise.exercise_datetime < (week + timedelta(days=7))
-				).group_by(CalendarDay.calendar_week_start_date
-				).order_by(CalendarDay.calendar_week_start_date).all()
-		
-			measure_name = "exercise_sets_completed"
 			plot_name = "Historic {metric} of {dimension_value}".format(metric=goal.goal_metric , dimension_value=goal_category_name)
-			goal_history_plot = generate_line_chart(dataset=goal_history, plot_height=100, dimension_name="calendar_week_start_date", measure_name=measure_name, line_color=line_color)
+			goal_history_plot = generate_line_chart_for_values(week_start_dates, measure_values, plot_height=100, line_color=goal_line_color)
 		
 		goal_history_plot_script, goal_history_plot_div = components(goal_history_plot)
 		goal_plot_container = PlotComponentContainer(name=plot_name, plot_div=goal_history_plot_div, plot_script=goal_history_plot_script)
 		goal_plot_containers.append(goal_plot_container)
 
-	return goal_plot_containers
\ No newline at end of file
+	return goal_plot_containers
@@ -1,3 +1,5 @@
+import numpy as np
+
 class TempCadenceAggregate():
 	cadence = None
 	total_seconds_above_cadence = None
@@ -32,6 +34,61 @@ class TempGradientAggregate():
 	def get_metric_value(self):
 		return self.total_metres_above_gradient
 
+class WeeklyDistribution():
+	# Totals recorded at each cadence or gradient, with the running total above each one and the gaps between them filled in
+	# every step, held as arrays in descending order. Values recorded more than once, e.g. for several weeks, are added up.
+	# Iterating gives aggregate_class rows for charting.
+	def __init__(self, dimension_values, values_at, step, aggregate_class):
+		recorded_dimension_values, positions = np.unique(np.asarray(dimension_values, dtype=np.int64), return_inverse=True)
+		summed_values_at = np.zeros(len(recorded_dimension_values), dtype=np.int64)
+		np.add.at(summed_values_at, positions, np.asarray(values_at, dtype=np.int64))
+
+		self.step = step
+		self.aggregate_class = aggregate_class
+		self.recorded_dimension_values = recorded_dimension_values[::-1]
+		self.values_at = summed_values_at[::-1]
+		self.dimension_values, self.values_above = self.gap_filled_running_totals()
+
+	def __repr__(self):
+		return "<WeeklyDistribution of {count} values>".format(count=len(self))
+
+	def __len__(self):
+		return len(self.dimension_values)
+
+	def __iter__(self):
+		for dimension_value, value_above in zip(self.dimension_values.tolist(), self.values_above.tolist()):
+			yield self.aggregate_class(dimension_value, value_above)
+
+	def gap_filled_running_totals(self):
+		if len(self.recorded_dimension_values) == 0:
+			return self.recorded_dimension_values, self.values_at
+
+		running_totals = np.cumsum(self.values_at)
+		# Each recorded value comes after the ones between it and the value before (starting from 0) that are a whole
+		# number of steps below that previous value, which carry the previous running total
+		previous_dimension_values = np.concatenate([[0], self.recorded_dimension_values[:-1]])
+		previous_running_totals = np.concatenate([[0], running_totals[:-1]])
+		gap_counts = np.maximum(np.ceil((previous_dimension_values - self.recorded_dimension_values) / self.step).astype(np.int64) - 1, 0)
+
+		gap_positions = np.repeat(np.arange(len(gap_counts)), gap_counts)
+		gap_steps = np.arange(len(gap_positions)) - np.repeat(np.cumsum(gap_counts) - gap_counts, gap_counts) + 1
+		dimension_values = np.concatenate([self.recorded_dimension_values, previous_dimension_values[gap_positions] - gap_steps * self.step])
+		values_above = np.concatenate([running_totals, previous_running_totals[gap_positions]])
+
+		order = np.argsort(-dimension_values, kind="stable")
+		return dimension_values[order], values_above[order]
+
+	def value_above(self, dimension_value):
+		positions = np.flatnonzero(self.dimension_values == dimension_value)
+		return self.values_above[positions[0]].item() if len(positions) > 0 else None
+
+	def significant_range(self, min_value_at, max_value_at, default_min, default_max):
+		# The lowest value with at least min_value_at recorded at it and the highest with at least max_value_at
+		min_candidates = self.recorded_dimension_values[self.values_at >= min_value_at]
+		max_candidates = self.recorded_dimension_values[self.values_at >= max_value_at]
+		return (min_candidates[-1].item() if len(min_candidates) > 0 else default_min,
+				max_candidates[0].item() if len(max_candidates) > 0 else default_max)
+
 class PlotComponentContainer():
 	name = None
 	plot_div = None
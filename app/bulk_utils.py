@@ -0,0 +1,37 @@
+from datetime import datetime
+from sqlalchemy import func
+
+from app import app, db
+from app.models import User
+
+# Keeps each statement a sensible size, an activity rarely has more than a couple of hundred aggregates per table
+INSERT_BATCH_SIZE = 1000
+
+def insert_rows(model, rows):
+	if len(rows) == 0:
+		return 0
+
+	# Set created_datetime explicitly so that every row in the statement gets the same value without relying on per-row defaults
+	if "created_datetime" in model.__table__.columns:
+		created_datetime = datetime.utcnow()
+		rows = [dict(row, created_datetime=row.get("created_datetime", created_datetime)) for row in rows]
+
+	for i in range(0, len(rows), INSERT_BATCH_SIZE):
+		db.session.execute(model.__table__.insert().values(rows[i:i + INSERT_BATCH_SIZE]))
+
+	return len(rows)
+
+def replace_activity_rows(model, activity_ids, rows):
+	# Delete and insert go through the session's transaction so they're only committed together
+	db.session.execute(model.__table__.delete().where(model.__table__.c.activity_id.in_(activity_ids)))
+	return insert_rows(model, rows)
+
+def user_id_ranges(chunk_size):
+	# (first, last) user IDs covering every user in chunks, for jobs that work through all users a chunk at a time
+	max_user_id = db.session.query(func.max(User.id)).scalar() or 0
+	return [(first_user_id, first_user_id + chunk_size - 1) for first_user_id in range(1, max_user_id + 1, chunk_size)]
+
+def dispose_engine():
+	# Connections can't be shared with the parent process, so each worker process (or Pool initializer) starts with its own pool
+	with app.app_context():
+		db.engine.dispose()
@@ -0,0 +1,65 @@
+from collections import namedtuple
+from sqlalchemy import event
+from sqlalchemy.orm import Session, attributes
+
+# Collects what's changed on a session as it's flushed so that data derived from it (the weekly rollup, plan occurrences
+# and users' data versions) can be brought up to date just before the transaction commits. Each tracker registers how
+# to start an empty set of changes, how to add what an instance changed to it and how to apply it. Trackers are applied
+# in ascending order, the same in every transaction, whatever order their modules were imported in.
+Tracker = namedtuple("Tracker", ["name", "order", "new_changes", "collect_instance_changes", "apply_changes"])
+
+trackers = []
+
+def register(name, order, new_changes, collect_instance_changes, apply_changes):
+	trackers.append(Tracker(name, order, new_changes, collect_instance_changes, apply_changes))
+	trackers.sort(key=lambda tracker: tracker.order)
+
+
+def pending_changes(session, name):
+	tracker = next(tracker for tracker in trackers if tracker.name == name)
+	return session.info.setdefault("tracked_changes", {}).setdefault(name, tracker.new_changes())
+
+
+def has_changes(instance, attribute_names):
+	return any([attributes.get_history(instance, attribute_name).has_changes() for attribute_name in attribute_names])
+
+
+def collect_instance_changes(session, instance, is_update):
+	for tracker in trackers:
+		tracker.collect_instance_changes(pending_changes(session, tracker.name), instance, is_update)
+
+
+# Deletions are picked up before the flush while the rows can still be loaded, and everything else afterwards once new
+# rows have their foreign keys filled in
+@event.listens_for(Session, "before_flush")
+def collect_deletions(session, flush_context, instances):
+	for instance in session.deleted:
+		collect_instance_changes(session, instance, is_update=False)
+
+
+@event.listens_for(Session, "after_flush")
+def collect_changes(session, flush_context):
+	for instance in session.new:
+		collect_instance_changes(session, instance, is_update=False)
+	for instance in session.dirty:
+		# Instances that were only touched, e.g. goals re-evaluated to the same value, don't count as changed
+		if session.is_modified(instance):
+			collect_instance_changes(session, instance, is_update=True)
+
+
+@event.listens_for(Session, "before_commit")
+def apply_changes(session):
+	# Trackers apply their changes with Core statements, so nothing they do needs flushing again
+	session.flush()
+	changes = session.info.pop("tracked_changes", None)
+	if changes is None:
+		return
+
+	for tracker in trackers:
+		if tracker.name in changes:
+			tracker.apply_changes(session, changes[tracker.name])
+
+
+@event.listens_for(Session, "after_rollback")
+def discard_changes(session):
+	session.info.pop("tracked_changes", None)
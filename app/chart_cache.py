@@ -0,0 +1,26 @@
+from app import app
+from app.response_cache import ResponseCache, LRUCacheBackend
+
+# Bokeh script and div pairs for the charts on the analysis pages, or the series for those drawn in the browser (see
+# chart_data), kept in each process. Like the response cache the key includes the user's data_version, which moves on
+# whenever their activities, stream aggregates, categories or goals change, so a past week or a finished activity is
+# only ever drawn once. Units are in the key too as they end up in the labels and tooltips.
+chart_cache = ResponseCache(LRUCacheBackend(app.config.get("CHART_CACHE_MAX_ENTRIES", 2000), app.config.get("CHART_CACHE_TTL_SECONDS", 24*60*60)))
+
+def chart_key(user, chart_kind, scope):
+	return "chart:{user_id}:{data_version}:{distance_uom}:{elevation_uom}:{chart_kind}:{scope}".format(user_id=user.id,
+																									 data_version=user.data_version or 0,
+																									 distance_uom=user.distance_uom_preference,
+																									 elevation_uom=user.elevation_uom_preference,
+																									 chart_kind=chart_kind,
+																									 scope=scope)
+
+
+def cached_charts(user, chart_kind, scope, render):
+	# render does any queries the chart needs as well as calling components(), and returns (None, None) rather than None
+	# when there's nothing to draw so that's remembered too
+	return chart_cache.get_or_compute(chart_key(user, chart_kind, scope), chart_kind, render)
+
+
+def cache_stats():
+	return chart_cache.stats()
@@ -0,0 +1,138 @@
+import calendar
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from app import utils
+from app.models import ExerciseCategory, ActivityPaceAggregate
+
+# The series behind the activity analysis charts that dataviz draws with Bokeh, as plain columns that can go out as
+# JSON and be drawn by static/charts.js in the browser. Dates and datetimes are sent as milliseconds since the epoch,
+# which is what a datetime axis works in. The weekly activity page still draws its charts with dataviz.
+
+NO_CATEGORY_COLOR = "#292b2c"
+
+def epoch_ms(value):
+	return calendar.timegm(value.timetuple()) * 1000
+
+
+def json_value(value):
+	if isinstance(value, Decimal):
+		return float(value)
+	elif isinstance(value, (date, datetime)):
+		return epoch_ms(value)
+	elif isinstance(value, timedelta):
+		return value.total_seconds() * 1000
+	return value
+
+
+def json_values(values):
+	return [json_value(value) for value in values]
+
+
+def bar_chart_data(dataset, dimension_name, measure_name, measure_label_name=None, measure_label_function=None, fill_color=None, line_color=None,
+		dimension_type="continuous", max_dimension_range=None, dimension_interval=2):
+	# Mirrors dataviz.generate_bar, including assuming that data is ordered descending by dimension values
+	dimension_values = []
+	dimension_labels = []
+	measure_values = []
+	measure_labels = []
+	fill_colors = []
+	line_colors = []
+
+	if measure_label_name is None:
+		measure_label_name = measure_name
+
+	for row in dataset:
+		if dimension_type == "timedelta":
+			dimension_values.append(utils.seconds_to_datetime(getattr(row, dimension_name)))
+			dimension_labels.append(utils.convert_seconds_to_minutes_formatted(getattr(row, dimension_name)))
+		else:
+			dimension_values.append(getattr(row, dimension_name))
+			dimension_labels.append(getattr(row, dimension_name))
+
+		measure_values.append(getattr(row, measure_name))
+
+		if measure_label_function is None:
+			measure_labels.append(getattr(row, measure_label_name))
+		else:
+			measure_labels.append(measure_label_function(getattr(row, measure_label_name)))
+
+		if fill_color is not None:
+			fill_colors.append(fill_color)
+			line_colors.append(line_color)
+		else:
+			fill_colors.append(NO_CATEGORY_COLOR)
+			line_colors.append(NO_CATEGORY_COLOR)
+
+	if len(dimension_values) == 0:
+		return None
+
+	if max_dimension_range is None:
+		dimension_range_min = dimension_values[-1]
+		dimension_range_max = dimension_values[0]
+	else:
+		dimension_range_min = dimension_values[-1] if dimension_values[-1] > max_dimension_range[0] else max_dimension_range[0]
+		dimension_range_max = dimension_values[0] if dimension_values[0] < max_dimension_range[1] else max_dimension_range[1]
+
+	if dimension_type == "continuous":
+		dimension_range = [dimension_range_min-1, dimension_range_max+1]
+		bar_height = 0.6 * dimension_interval
+	else:
+		dimension_range = [dimension_range_max+timedelta(seconds=2.5), dimension_range_min-timedelta(seconds=2.5)]
+		bar_height = 0.6 * dimension_interval
+
+	return dict(kind="bar",
+				dimension_type=dimension_type,
+				dimension=json_values(dimension_values),
+				dimension_label=json_values(dimension_labels),
+				measure=json_values(measure_values),
+				measure_label=measure_labels,
+				fill_color=fill_colors,
+				line_color=line_colors,
+				dimension_range=json_values(dimension_range),
+				measure_range=[-1, float(max(measure_values))*1.3],
+				bar_height=bar_height,
+				dimension_tick_interval=2*dimension_interval)
+
+
+def run_colors(user):
+	run_category = ExerciseCategory.query.filter(ExerciseCategory.owner == user).filter(ExerciseCategory.category_name == "Run").first()
+	if run_category is None:
+		return None, None
+	return run_category.fill_color, run_category.line_color
+
+
+def activity_analysis_chart_data(activity):
+	fill_color, line_color = run_colors(activity.owner)
+	charts = dict(at_cadence=None, above_cadence=None, at_pace=None, above_pace=None, at_gradient=None, above_gradient=None)
+
+	if activity.median_cadence:
+		# Keep the graph tidy if there's any bit of walking or other outliers by excluding them
+		max_dimension_range = (int(activity.median_cadence-30), int(activity.median_cadence+30))
+		cadence_aggregates = activity.activity_cadence_aggregates.all()
+		charts["at_cadence"] = bar_chart_data(cadence_aggregates, dimension_name="cadence", measure_name="total_seconds_at_cadence",
+											  measure_label_name="total_seconds_at_cadence_formatted", max_dimension_range=max_dimension_range,
+											  fill_color=fill_color, line_color=line_color)
+		charts["above_cadence"] = bar_chart_data(cadence_aggregates, dimension_name="cadence", measure_name="total_seconds_above_cadence",
+												 measure_label_name="total_seconds_above_cadence_formatted", max_dimension_range=max_dimension_range,
+												 fill_color=fill_color, line_color=line_color)
+
+	pace_aggregates = activity.activity_pace_aggregates.order_by(ActivityPaceAggregate.pace_seconds.desc()).all()
+	if len(pace_aggregates) > 0:
+		max_dimension_range = (utils.seconds_to_datetime(0), utils.seconds_to_datetime(utils.convert_mps_to_km_pace(activity.average_speed).total_seconds() + 60))
+		charts["at_pace"] = bar_chart_data(pace_aggregates, dimension_name="pace_seconds", measure_name="total_seconds_at_pace", dimension_type="timedelta",
+										   dimension_interval=5000, measure_label_name="total_seconds_at_pace_formatted", max_dimension_range=max_dimension_range,
+										   fill_color=fill_color, line_color=line_color)
+		charts["above_pace"] = bar_chart_data(pace_aggregates, dimension_name="pace_seconds", measure_name="total_seconds_above_pace", dimension_type="timedelta",
+											  dimension_interval=5000, measure_label_name="total_seconds_above_pace_formatted", max_dimension_range=max_dimension_range,
+											  fill_color=fill_color, line_color=line_color)
+
+	gradient_aggregates = activity.activity_gradient_aggregates.all()
+	if len(gradient_aggregates) > 0:
+		charts["at_gradient"] = bar_chart_data(gradient_aggregates, dimension_name="gradient", measure_name="total_metres_at_gradient", dimension_interval=1,
+											   measure_label_name="total_metres_at_gradient_formatted", fill_color=fill_color, line_color=line_color)
+		charts["above_gradient"] = bar_chart_data(gradient_aggregates, dimension_name="gradient", measure_name="total_metres_above_gradient", dimension_interval=1,
+												  measure_label_name="total_metres_above_gradient_formatted", fill_color=fill_color, line_color=line_color)
+
+	return charts
+
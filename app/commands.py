@@ -0,0 +1,120 @@
+import click
+from stravalib.client import Client
+
+from app import app, db, stream_jobs, stream_archive, strava_webhooks, goal_jobs, rollups, plan_occurrences
+from app.models import StravaWebhookEvent
+
+@app.cli.command("parse_stream_jobs", help="Work through the queue of stream parsing jobs using a pool of worker processes.")
+@click.option("--processes", type=int, default=None, help="Number of worker processes, defaults to STREAM_PARSE_WORKER_PROCESSES.")
+@click.option("--exit-when-empty", is_flag=True, help="Stop once there are no jobs ready to run rather than polling for more.")
+def parse_stream_jobs(processes, exit_when_empty):
+	reset_count = stream_jobs.reset_stale_jobs()
+	if reset_count > 0:
+		click.echo("Put {count} stale jobs back on the queue".format(count=reset_count))
+
+	stream_jobs.run_workers(processes=processes, exit_when_empty=exit_when_empty)
+
+
+@app.cli.command("pack_stream_archive", help="Pack every stored activity stream into a memory-mapped archive at PATH (PATH.dat and PATH.idx.npy).")
+@click.argument("path")
+def pack_stream_archive(path):
+	stream_count, byte_count = stream_archive.pack_archive(path)
+	click.echo("Packed {streams} streams into {megabytes:.1f}MB".format(streams=stream_count, megabytes=byte_count / (1024 * 1024)))
+
+
+@app.cli.command("reaggregate_stream_archive", help="Rebuild the cadence, pace and gradient aggregates of every activity in the archive at PATH.")
+@click.argument("path")
+@click.option("--processes", type=int, default=None, help="Number of worker processes, defaults to STREAM_PARSE_WORKER_PROCESSES.")
+@click.option("--chunk-size", type=int, default=200, help="Number of activities each worker re-aggregates and writes in one transaction.")
+def reaggregate_stream_archive(path, processes, chunk_size):
+	activity_count, aggregate_count = stream_archive.reaggregate_archive(path, processes=processes, chunk_size=chunk_size)
+	click.echo("Re-aggregated {activities} activities into {aggregates} aggregates".format(activities=activity_count, aggregates=aggregate_count))
+
+
+@app.cli.command("process_strava_webhook_events", help="Apply queued Strava webhook events, fetching just the activities that changed.")
+@click.option("--exit-when-empty", is_flag=True, help="Stop once there are no events ready to apply rather than polling for more.")
+def process_strava_webhook_events(exit_when_empty):
+	reset_count = strava_webhooks.reset_stale_events()
+	if reset_count > 0:
+		click.echo("Put {count} stale events back on the queue".format(count=reset_count))
+
+	processed_count = strava_webhooks.work(exit_when_empty=exit_when_empty)
+	click.echo("Applied {count} events".format(count=processed_count))
+
+
+@app.cli.command("create_strava_webhook_subscription", help="Subscribe to Strava webhook events, sent to CALLBACK_URL.")
+@click.argument("callback_url")
+def create_strava_webhook_subscription(callback_url):
+	subscription = Client().create_subscription(client_id=app.config["STRAVA_OAUTH2_CLIENT_ID"],
+												client_secret=app.config["STRAVA_OAUTH2_CLIENT_SECRET"],
+												callback_url=callback_url,
+												verify_token=app.config["STRAVA_WEBHOOK_VERIFY_TOKEN"])
+	click.echo("Created subscription {id}, set STRAVA_WEBHOOK_SUBSCRIPTION_ID to this".format(id=subscription.id))
+
+
+@app.cli.command("simulate_strava_webhook", help="Post Strava style webhook events to the local endpoint, for trying out the event queue without Strava.")
+@click.option("--athlete-id", type=int, required=True, help="Strava athlete ID of a user that has connected to Strava.")
+@click.option("--object-id", type=int, required=True, help="Strava activity ID, or the athlete ID again for athlete events.")
+@click.option("--aspect-type", type=click.Choice(["create", "update", "delete"]), default="create")
+@click.option("--object-type", type=click.Choice(["activity", "athlete"]), default="activity")
+@click.option("--repeat", type=int, default=1, help="Number of times to send the event, to see them coalesce in the queue.")
+@click.option("--apply", is_flag=True, help="Apply the queued events straight away.")
+def simulate_strava_webhook(athlete_id, object_id, aspect_type, object_type, repeat, apply):
+	if not app.config.get("STRAVA_WEBHOOK_SUBSCRIPTION_ID"):
+		click.echo("Set STRAVA_WEBHOOK_SUBSCRIPTION_ID first, the webhook rejects every event until it's set")
+		return
+
+	updates = {"authorized": "false"} if object_type == "athlete" else {}
+	test_client = app.test_client()
+
+	for i in range(repeat):
+		response = test_client.post("/api/strava_webhook", json=strava_webhooks.simulated_event(athlete_id, object_id, aspect_type, object_type, updates))
+		if response.status_code != 200:
+			click.echo("Webhook returned {status}".format(status=response.status_code))
+			return
+
+	queued_event = StravaWebhookEvent.query.filter(StravaWebhookEvent.status == "Queued"
+		).filter(StravaWebhookEvent.object_type == object_type
+		).filter(StravaWebhookEvent.object_id == object_id
+		).first()
+	if queued_event:
+		click.echo("Queued {aspect_type} for {object_type} {object_id} from {count} events".format(aspect_type=queued_event.aspect_type,
+																							   object_type=object_type,
+																							   object_id=object_id,
+																							   count=queued_event.received_count))
+	db.session.remove()
+
+	if apply:
+		click.echo("Applied {count} events".format(count=strava_webhooks.work(exit_when_empty=True)))
+
+
+@app.cli.command("evaluate_goals", help="Bring every user's open goals up to date. Intended to be run nightly.")
+@click.option("--processes", type=int, default=None, help="Number of worker processes, defaults to GOAL_EVALUATION_PROCESSES.")
+@click.option("--chunk-size", type=int, default=1000, help="Number of user IDs each worker evaluates in one transaction.")
+def evaluate_goals(processes, chunk_size):
+	goal_count, seconds = goal_jobs.evaluate_all_goals(processes=processes, chunk_size=chunk_size)
+	click.echo("Evaluated {goals} goals in {seconds:.1f}s ({rate:.0f} goals/sec)".format(goals=goal_count, seconds=seconds, rate=goal_count / seconds if seconds > 0 else 0))
+
+
+@app.cli.command("rebuild_weekly_rollups", help="Recalculate the weekly rollup of every user's activities and exercises from scratch.")
+@click.option("--chunk-size", type=int, default=500, help="Number of user IDs rebuilt in one transaction.")
+def rebuild_weekly_rollups(chunk_size):
+	rollups.rebuild_rollups(chunk_size=chunk_size)
+	click.echo("Rebuilt the weekly rollup")
+
+
+@app.cli.command("check_weekly_rollups", help="Check that the weekly rollup matches the activities and exercises it summarises.")
+@click.option("--chunk-size", type=int, default=500, help="Number of user IDs checked at a time.")
+@click.option("--fix", is_flag=True, help="Recalculate any weeks that don't match.")
+def check_weekly_rollups(chunk_size, fix):
+	inconsistent_user_weeks = rollups.check_rollups(chunk_size=chunk_size, fix=fix)
+	for user_id, week in inconsistent_user_weeks:
+		click.echo("User {user_id}, week starting {week}".format(user_id=user_id, week=week))
+	click.echo("{count} inconsistent weeks{fixed}".format(count=len(inconsistent_user_weeks), fixed=", now fixed" if fix and len(inconsistent_user_weeks) > 0 else ""))
+
+
+@app.cli.command("extend_plan_occurrences", help="Expand every user's recurring plans up to PLAN_OCCURRENCE_HORIZON_WEEKS ahead. Intended to be run nightly.")
+@click.option("--chunk-size", type=int, default=1000, help="Number of user IDs extended in one transaction.")
+def extend_plan_occurrences(chunk_size):
+	extended_user_count, removed_count = plan_occurrences.extend_all_occurrences(chunk_size=chunk_size)
+	click.echo("Extended the plans of {users} users and removed {removed} past occurrences".format(users=extended_user_count, removed=removed_count))
@@ -1,12 +1,11 @@
 from flask import redirect, flash
 from flask_login import current_user
 from datetime import datetime, timedelta
-import pandas as pd
 from bokeh.core.properties import value
 from bokeh.models import ColumnDataSource, HoverTool, TapTool, Plot, DatetimeTickFormatter, OpenURL, LabelSet, SingleIntervalTicker, LinearAxis, CustomJS, Arrow, NormalHead, CategoricalAxis, FuncTickFormatter
 from bokeh.plotting import figure
 import bokeh.layouts
-from app import utils
+from app import utils, pivot_utils
 
 def generate_stacked_bar_for_categories(dataset_query, user_categories, dimension, measure, dimension_type, plot_height, bar_direction="vertical", measure_units="", granularity="day", show_grid=True, show_yaxis=True):
 	# Colour mappings - TODO: Switch to using the colours in the DB for each category
@@ -17,11 +16,9 @@ def generate_stacked_bar_for_categories(dataset_query, user_categories, dimensio
 	category_name_mappings.append(("Uncategorised", "Uncategorised"))
 
 	# Reshape the data
-	df = pd.read_sql(dataset_query.statement, dataset_query.session.bind)
-	pivot_df = df.pivot(index=dimension, columns="category_key", values=measure)
-	pivot_df = pivot_df.fillna(value=0)
-	categories = df["category_key"].unique()
-	dimension_list = pivot_df.index.values
+	pivot = pivot_utils.pivot_query(dataset_query, index=dimension, columns="category_key", values=measure)
+	categories = list(pivot.columns.keys())
+	dimension_list = pivot.index
 
 	data = {dimension : dimension_list}
 	colors = []
@@ -29,7 +26,7 @@ def generate_stacked_bar_for_categories(dataset_query, user_categories, dimensio
 	names = []
 
 	for category in categories:
-		data[category] = pivot_df[category].values
+		data[category] = pivot.columns[category]
 		category_index =  available_categories.index(category) if category in available_categories else 8
 		colors.append(available_colors[category_index])
 		line_colors.append(available_line_colors[category_index]) #TODO: Need to assign the undefinned category if it can't be matched
@@ -280,6 +277,10 @@ def generate_line_chart(dataset, plot_height, dimension_name, measure_name, meas
 		dimension_values.append(getattr(row, dimension_name))
 		measure_values.append(getattr(row, measure_name))
 
+	return generate_line_chart_for_values(dimension_values, measure_values, plot_height, line_color=line_color, y_tick_function_code=y_tick_function_code)
+
+
+def generate_line_chart_for_values(dimension_values, measure_values, plot_height, line_color=None, y_tick_function_code=None):
 	source=ColumnDataSource(dict(dimension=dimension_values,
 								 measure=measure_values))
 
@@ -321,15 +322,9 @@ def generate_line_chart_for_categories(dataset_query, dimension, measure, dimens
 	category_name_mappings.append(("Uncategorised", "Uncategorised"))
 
 	# Reshape the data
-	df = pd.read_sql(dataset_query.statement, dataset_query.session.bind)
-	pivot_df = df.pivot(index=dimension, columns="category_key", values=measure)
-	pivot_df = pivot_df.fillna(value=0)
-
-	if line_type == "cumulative":
-		pivot_df = pivot_df.cumsum()
-
-	categories = df["category_key"].unique()
-	dimension_list = pivot_df.index.values
+	pivot = pivot_utils.pivot_query(dataset_query, index=dimension, columns="category_key", values=measure, cumulative=(line_type == "cumulative"))
+	categories = list(pivot.columns.keys())
+	dimension_list = pivot.index
 
 	data = {dimension : dimension_list}
 	colors = {}
@@ -338,7 +333,7 @@ def generate_line_chart_for_categories(dataset_query, dimension, measure, dimens
 	names = {}
 
 	for category in categories:
-		data[category] = pivot_df[category].values
+		data[category] = pivot.columns[category]
 		category_index =  available_categories.index(category) if category in available_categories else 8
 		colors[category] = available_colors[category_index]
 		line_colors[category] = available_line_colors[category_index] #TODO: Need to assign the undefinned category if it can't be matched
@@ -0,0 +1,135 @@
+from datetime import date, timedelta
+from multiprocessing import Pool
+from sqlalchemy import func, and_, or_, case, cast, extract, Integer
+import logging
+import os
+import time
+
+from app import app, db, bulk_utils, response_cache
+from app.analysis import RUNNING_GOAL_METRICS
+from app.models import User, TrainingGoal, Activity, ActivityCadenceAggregate, ActivityGradientAggregate, Exercise, ExerciseType
+
+# Set-based versions of analysis.evaluate_running_goals and evaluate_exercise_set_goals that bring every open goal for a
+# range of users up to date with a handful of UPDATE ... FROM statements, rather than one user at a time in Python
+GOAL_METRICS = RUNNING_GOAL_METRICS + ["Exercise Sets Completed"]
+
+# Only cast dimension values that are numbers, as the planner is free to evaluate the join conditions before the metric filter
+goal_dimension_integer = case([(TrainingGoal.goal_dimension_value.op("~")("^[0-9]+$"), cast(TrainingGoal.goal_dimension_value, Integer))])
+
+def open_goals(query, goal_metrics, first_user_id, last_user_id):
+	return query.filter(TrainingGoal.goal_status == "In Progress"
+		).filter(TrainingGoal.goal_metric.in_(goal_metrics)
+		).filter(TrainingGoal.user_id.between(first_user_id, last_user_id))
+
+
+def changed_user_ids(update_statement):
+	# Each update only touches goals whose values actually change, and hands back whose goals they were
+	return set([row.user_id for row in db.session.execute(update_statement.returning(TrainingGoal.__table__.c.user_id)).fetchall()])
+
+
+def update_goal_values(goal_values_query):
+	goal_values = goal_values_query.subquery()
+	goal_table = TrainingGoal.__table__
+	return changed_user_ids(goal_table.update().values(current_metric_value=goal_values.c.value
+		).where(goal_table.c.id == goal_values.c.goal_id
+		).where(goal_table.c.current_metric_value.is_distinct_from(goal_values.c.value)))
+
+
+def update_runs_over_distance_goals(first_user_id, last_user_id):
+	distance_multiplier = case([(User.distance_uom_preference == "miles", 1609.344)], else_=1000)
+	return update_goal_values(open_goals(db.session.query(TrainingGoal.id.label("goal_id"), func.count(Activity.id).label("value")
+		).join(User, User.id == TrainingGoal.user_id
+		).outerjoin(Activity, and_(Activity.user_id == TrainingGoal.user_id,
+								   Activity.week_start_date == TrainingGoal.goal_start_date,
+								   Activity.activity_type == "Run",
+								   Activity.distance >= goal_dimension_integer * distance_multiplier)
+		), ["Runs Completed Over Distance"], first_user_id, last_user_id
+		).group_by(TrainingGoal.id))
+
+
+def update_weekly_total_goals(first_user_id, last_user_id):
+	# Goals for weeks without any runs are left as they are
+	weekly_total = case([(TrainingGoal.goal_metric == "Weekly Distance", func.sum(Activity.distance)),
+						 (TrainingGoal.goal_metric == "Weekly Moving Time", extract("epoch", func.sum(Activity.moving_time)))],
+						else_=func.coalesce(func.sum(Activity.total_elevation_gain), 0))
+	return update_goal_values(open_goals(db.session.query(TrainingGoal.id.label("goal_id"), weekly_total.label("value")
+		).join(Activity, and_(Activity.user_id == TrainingGoal.user_id,
+							  Activity.week_start_date == TrainingGoal.goal_start_date,
+							  Activity.activity_type == "Run")
+		), ["Weekly Distance", "Weekly Moving Time", "Weekly Elevation Gain"], first_user_id, last_user_id
+		).group_by(TrainingGoal.id, TrainingGoal.goal_metric))
+
+
+def update_weekly_aggregate_goals(first_user_id, last_user_id, goal_metric, aggregate_model, dimension, metric_at, dimension_step):
+	# The weekly summaries in analysis fill any gaps between the highest and lowest dimension recorded for the week in steps
+	# of dimension_step, so a goal only gets a value when its dimension falls in that range
+	return update_goal_values(open_goals(db.session.query(TrainingGoal.id.label("goal_id"),
+														  func.sum(case([(dimension >= goal_dimension_integer, metric_at)], else_=0)).label("value")
+		).join(Activity, and_(Activity.user_id == TrainingGoal.user_id, Activity.week_start_date == TrainingGoal.goal_start_date)
+		).join(aggregate_model, aggregate_model.activity_id == Activity.id
+		), [goal_metric], first_user_id, last_user_id
+		).group_by(TrainingGoal.id, TrainingGoal.goal_dimension_value
+		).having(and_(func.max(dimension) >= goal_dimension_integer,
+					  func.min(dimension) <= goal_dimension_integer,
+					  (func.max(dimension) - goal_dimension_integer) % dimension_step == 0)))
+
+
+def update_exercise_set_goals(first_user_id, last_user_id):
+	return update_goal_values(open_goals(db.session.query(TrainingGoal.id.label("goal_id"), func.count(Exercise.id).label("value")
+		).outerjoin(ExerciseType, and_(ExerciseType.user_id == TrainingGoal.user_id,
+									   or_(TrainingGoal.goal_dimension_value == "None", ExerciseType.exercise_category_id == goal_dimension_integer))
+		).outerjoin(Exercise, and_(Exercise.exercise_type_id == ExerciseType.id, Exercise.week_start_date == TrainingGoal.goal_start_date)
+		), ["Exercise Sets Completed"], first_user_id, last_user_id
+		).group_by(TrainingGoal.id))
+
+
+def update_goal_statuses(first_user_id, last_user_id):
+	goal_table = TrainingGoal.__table__
+	is_successful = goal_table.c.current_metric_value >= goal_table.c.goal_target
+	is_missed = goal_table.c.goal_start_date < date.today() - timedelta(days=7)
+	return changed_user_ids(goal_table.update().values(goal_status=case([(is_successful, "Successful"), (is_missed, "Missed")])
+		).where(goal_table.c.goal_status == "In Progress"
+		).where(goal_table.c.goal_metric.in_(GOAL_METRICS)
+		).where(goal_table.c.user_id.between(first_user_id, last_user_id)
+		).where(or_(is_successful, is_missed)))
+
+
+def evaluate_user_range(first_user_id, last_user_id):
+	goal_count = open_goals(TrainingGoal.query, GOAL_METRICS, first_user_id, last_user_id).count()
+
+	user_ids = set()
+	user_ids.update(update_runs_over_distance_goals(first_user_id, last_user_id))
+	user_ids.update(update_weekly_total_goals(first_user_id, last_user_id))
+	user_ids.update(update_weekly_aggregate_goals(first_user_id, last_user_id, "Time Spent Above Cadence", ActivityCadenceAggregate,
+												  ActivityCadenceAggregate.cadence, ActivityCadenceAggregate.total_seconds_at_cadence, dimension_step=2))
+	user_ids.update(update_weekly_aggregate_goals(first_user_id, last_user_id, "Distance Climbing Above Gradient", ActivityGradientAggregate,
+												  ActivityGradientAggregate.gradient, ActivityGradientAggregate.total_metres_at_gradient, dimension_step=1))
+	user_ids.update(update_exercise_set_goals(first_user_id, last_user_id))
+	user_ids.update(update_goal_statuses(first_user_id, last_user_id))
+	# Goal values feed the goal charts on the weekly activity page, so only users whose goals moved need a new data_version
+	if len(user_ids) > 0:
+		response_cache.bump_data_versions(db.session, User.id.in_(user_ids))
+	db.session.commit()
+
+	return goal_count
+
+
+def evaluate_chunk(first_user_id, last_user_id):
+	with app.app_context():
+		goal_count = evaluate_user_range(first_user_id, last_user_id)
+		db.session.remove()
+	return goal_count
+
+
+def evaluate_all_goals(processes=None, chunk_size=1000):
+	processes = app.config.get("GOAL_EVALUATION_PROCESSES", os.cpu_count()) if processes is None else processes
+	chunks = bulk_utils.user_id_ranges(chunk_size)
+	db.session.remove()
+	start_time = time.time()
+
+	with Pool(processes, initializer=bulk_utils.dispose_engine) as pool:
+		goal_count = sum(pool.starmap(evaluate_chunk, chunks))
+
+	seconds = time.time() - start_time
+	logging.info("Evaluated {goals} goals in {seconds:.1f}s ({rate:.0f} goals/sec)".format(goals=goal_count, seconds=seconds, rate=goal_count / seconds if seconds > 0 else 0))
+	return goal_count, seconds
@@ -3,7 +3,7 @@ from time import time
 from flask import Markup
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
-from sqlalchemy import func, literal, desc, and_, or_, null, extract, distinct, cast, Date, case
+from sqlalchemy import func, literal, desc, and_, or_, null, extract, cast, event
 from markdown import markdown
 from itertools import groupby
 from passlib.hash import pbkdf2_sha256 as sha256
@@ -32,6 +32,8 @@ class User(UserMixin, db.Model):
 	scheduled_activities = db.relationship("ScheduledActivity", backref="owner", lazy="dynamic")
 	scheduled_races = db.relationship("ScheduledRace", backref="owner", lazy="dynamic")
 	blog_posts = db.relationship("BlogPost", backref="author", lazy="dynamic")
+	stream_parse_jobs = db.relationship("StreamParseJob", backref="owner", lazy="dynamic")
+	strava_sync_checkpoint = db.relationship("StravaSyncCheckpoint", backref="owner", uselist=False)
 	last_login_datetime = db.Column(db.DateTime, default=datetime.utcnow)
 	is_exercises_user = db.Column(db.Boolean, default=False)
 	is_strava_user = db.Column(db.Boolean, default=False)
@@ -43,6 +45,12 @@ class User(UserMixin, db.Model):
 	distance_uom_preference = db.Column(db.String(10), default="km")
 	elevation_uom_preference = db.Column(db.String(10), default="m")
 	has_weekly_flexible_planning_enabled = db.Column(db.Boolean, default=False)
+	strava_athlete_id = db.Column(db.BigInteger, index=True, unique=True) # matches webhook events to the user
+	strava_access_token = db.Column(db.String(100))
+	strava_refresh_token = db.Column(db.String(100))
+	strava_access_token_expires_datetime = db.Column(db.DateTime)
+	plan_occurrences_until = db.Column(db.Date) # last date that PlanOccurrence has been generated up to for the user
+	data_version = db.Column(db.Integer, default=0) # bumped whenever the user's data changes, see app.response_cache
 
 	def __repr__(self):
 		return "<User {email}>".format(email=self.email)
@@ -120,14 +128,11 @@ class User(UserMixin, db.Model):
 
 		planned_activities = db.session.query(
 											ScheduledActivity.id,
-											CalendarDay.calendar_date.label("planned_date")
-				).join(CalendarDay, or_(ScheduledActivity.scheduled_date==CalendarDay.calendar_date, ScheduledActivity.scheduled_day==CalendarDay.day_of_week)
-				).outerjoin(ScheduledActivitySkippedDate, and_(ScheduledActivity.id==ScheduledActivitySkippedDate.scheduled_activity_id, CalendarDay.calendar_date==ScheduledActivitySkippedDate.skipped_date)
-				).filter(ScheduledActivity.owner == self
+											PlanOccurrence.planned_date
+				).join(PlanOccurrence, PlanOccurrence.scheduled_activity_id == ScheduledActivity.id
+				).filter(PlanOccurrence.user_id == self.id
 				).filter(ScheduledActivity.planning_period == "day"
-				).filter(ScheduledActivity.is_removed == False
-				).filter(ScheduledActivitySkippedDate.id == None
-				).filter(CalendarDay.calendar_date == selected_date)
+				).filter(PlanOccurrence.planned_date == selected_date)
 		
 		has_planned_activity_for_day = True if planned_activities.count() > 0 else False
 		
@@ -145,16 +150,11 @@ class User(UserMixin, db.Model):
 		if not has_planned_activity_for_day:
 			planned_exercises = db.session.query(
 											ScheduledExercise.id,
-											CalendarDay.calendar_date.label("planned_date")																											
-				).join(ExerciseType, ScheduledExercise.exercise_type_id == ExerciseType.id
-				).join(CalendarDay, or_(ScheduledExercise.scheduled_date==CalendarDay.calendar_date, ScheduledExercise.scheduled_day == CalendarDay.day_of_week)
-				).outerjoin(ScheduledExerciseSkippedDate, and_(ScheduledExercise.id==ScheduledExerciseSkippedDate.scheduled_exercise_id, CalendarDay.calendar_date==ScheduledExerciseSkippedDate.skipped_date)
-				).filter(ExerciseType.owner == self
+											PlanOccurrence.planned_date
+				).join(PlanOccurrence, PlanOccurrence.scheduled_exercise_id == ScheduledExercise.id
+				).filter(PlanOccurrence.user_id == self.id
 				).filter(ScheduledExercise.planning_period == "day"
-				).filter(ScheduledExercise.is_removed == False
-				).filter(ScheduledExerciseSkippedDate.id == None
-				).filter(CalendarDay.calendar_date == selected_date)
-			print(planned_exercises.count())
+				).filter(PlanOccurrence.planned_date == selected_date)
 			has_planned_activity_for_day = True if planned_exercises.count() > 0 else False
 		
 		return has_planned_activity_for_day
@@ -199,17 +199,17 @@ class User(UserMixin, db.Model):
 
 	def current_year_activity_stats(self):
 		current_year_activity_stats = db.session.query(
-						Activity.activity_type,
-						func.coalesce(ExerciseCategory.category_key, Activity.activity_type).label("category_key"),
-						func.sum(Activity.distance).label("total_distance")
-				).join(CalendarDay, func.date(Activity.start_datetime)==CalendarDay.calendar_date
-				).outerjoin(ExerciseCategory, and_(Activity.activity_type==ExerciseCategory.category_name, ExerciseCategory.user_id==Activity.user_id)
-				).filter(Activity.owner == self
-				).filter(Activity.activity_type.in_(["Run", "Ride", "Swim"])
-				).filter(CalendarDay.calendar_year == datetime.today().year
+						UserWeeklyRollup.activity_type,
+						func.coalesce(ExerciseCategory.category_key, UserWeeklyRollup.activity_type).label("category_key"),
+						func.sum(UserWeeklyRollup.total_distance).label("total_distance")
+				).outerjoin(ExerciseCategory, and_(UserWeeklyRollup.activity_type==ExerciseCategory.category_name, ExerciseCategory.user_id==UserWeeklyRollup.user_id)
+				).filter(UserWeeklyRollup.user_id == self.id
+				).filter(UserWeeklyRollup.source == "Activity"
+				).filter(UserWeeklyRollup.activity_type.in_(["Run", "Ride", "Swim"])
+				).filter(UserWeeklyRollup.calendar_year == datetime.today().year
 				).group_by(
 						ExerciseCategory.category_key,
-						Activity.activity_type
+						UserWeeklyRollup.activity_type
 				)
 
 		return current_year_activity_stats
@@ -218,12 +218,11 @@ class User(UserMixin, db.Model):
 		current_year_exercise_stats = db.session.query(
 						func.coalesce(ExerciseCategory.category_name, "Uncategorised").label("category_name"),
 						func.coalesce(ExerciseCategory.category_key, "Uncategorised").label("category_key"),
-						func.count(Exercise.id).label("total_sets")
-				).join(ExerciseType.exercises
-				).outerjoin(ExerciseType.exercise_category
-				).join(CalendarDay, func.date(Exercise.exercise_datetime)==CalendarDay.calendar_date
-				).filter(ExerciseType.owner == self
-				).filter(CalendarDay.calendar_year == datetime.today().year
+						func.sum(UserWeeklyRollup.activities_completed).label("total_sets")
+				).outerjoin(ExerciseCategory, UserWeeklyRollup.exercise_category_id==ExerciseCategory.id
+				).filter(UserWeeklyRollup.user_id == self.id
+				).filter(UserWeeklyRollup.source == "Exercise"
+				).filter(UserWeeklyRollup.calendar_year == datetime.today().year
 				).group_by(
 						ExerciseCategory.category_key,
 						ExerciseCategory.category_name
@@ -237,17 +236,15 @@ class User(UserMixin, db.Model):
 
 	def exercises_filtered(self, exercise_category_id=None, week=None):
 		return Exercise.query.join(ExerciseType, (ExerciseType.id == Exercise.exercise_type_id)
-			).join(CalendarDay, (func.date(Exercise.exercise_datetime) == CalendarDay.calendar_date)
 			).filter(ExerciseType.owner == self
 			).filter(or_(ExerciseType.exercise_category_id == exercise_category_id, exercise_category_id is None)
-			).filter(or_(CalendarDay.calendar_week_start_date == week, week is None)
+			).filter(or_(Exercise.week_start_date == week, week is None)
 			)
 
 	def activities_filtered(self, activity_type=None, week=None):
-		return Activity.query.join(CalendarDay, (func.date(Activity.start_datetime) == CalendarDay.calendar_date)
-			).filter(Activity.owner == self
+		return Activity.query.filter(Activity.owner == self
 			).filter(or_(Activity.activity_type == activity_type, activity_type is None)
-			).filter(or_(CalendarDay.calendar_week_start_date == week, week is None)
+			).filter(or_(Activity.week_start_date == week, week is None)
 			)
 
 	def exercise_types_active(self):
@@ -262,7 +259,7 @@ class User(UserMixin, db.Model):
 						literal("Exercise").label("source"),
 						Exercise.created_datetime.label("created_datetime"),
 						Exercise.exercise_datetime.label("activity_datetime"),
-						func.date(Exercise.exercise_datetime).label("activity_date"),
+						Exercise.exercise_date.label("activity_date"),
 						ExerciseType.name,
 						Exercise.scheduled_exercise_id,
 						null().label("is_race"),
@@ -279,7 +276,7 @@ class User(UserMixin, db.Model):
 						func.coalesce(Activity.external_source, "Activity").label("source"),
 						Activity.created_datetime.label("created_datetime"),
 						Activity.start_datetime.label("activity_datetime"),
-						func.date(Activity.start_datetime).label("activity_date"),
+						Activity.activity_date,
 						Activity.name,
 						Activity.scheduled_activity_id.label("scheduled_exercise_id"),
 						Activity.is_race,
@@ -302,7 +299,10 @@ class User(UserMixin, db.Model):
 		return uncategorised_activity_types
 
 	def scheduled_activities_filtered(self, scheduled_day):
-		scheduled_activities_filtered = db.session.query(
+		return self.scheduled_activities_for_days([scheduled_day])
+
+	def scheduled_activities_for_days(self, scheduled_days):
+		scheduled_activities_for_days = db.session.query(
 											ScheduledActivity.id,
 											ScheduledActivity.activity_type,
 											ScheduledActivity.scheduled_day,
@@ -312,36 +312,33 @@ class User(UserMixin, db.Model):
 				).outerjoin(ExerciseCategory, and_(ScheduledActivity.activity_type==ExerciseCategory.category_name, ExerciseCategory.user_id==ScheduledActivity.user_id)
 				).filter(ScheduledActivity.owner == self
 				).filter(ScheduledActivity.is_removed==False
-				).filter(ScheduledActivity.scheduled_day==scheduled_day)
-		return scheduled_activities_filtered
+				).filter(ScheduledActivity.scheduled_day.in_(scheduled_days))
+		return scheduled_activities_for_days
 
 	def planned_activities_filtered(self, startDate, endDate, activityType=None, planningPeriod=None):
 		planned_activities_filtered = db.session.query(
 											ScheduledActivity.id,
 											ScheduledActivity.planning_period,
 											ScheduledActivity.recurrence,
-											CalendarDay.calendar_date.label("planned_date"),
+											PlanOccurrence.planned_date,
 											ScheduledActivity.activity_type,
 											ScheduledActivity.activity_subtype,
 											ScheduledActivity.scheduled_day,
 											ScheduledActivity.description,
 											ScheduledActivity.planned_distance,
 											ExerciseCategory.category_key
-				).join(CalendarDay, or_(ScheduledActivity.scheduled_date==CalendarDay.calendar_date, ScheduledActivity.scheduled_day==CalendarDay.day_of_week)
+				).join(PlanOccurrence, PlanOccurrence.scheduled_activity_id == ScheduledActivity.id
 				).outerjoin(ExerciseCategory, and_(ScheduledActivity.activity_type==ExerciseCategory.category_name, ExerciseCategory.user_id==ScheduledActivity.user_id)
-				).outerjoin(ScheduledActivitySkippedDate, and_(ScheduledActivity.id==ScheduledActivitySkippedDate.scheduled_activity_id, CalendarDay.calendar_date==ScheduledActivitySkippedDate.skipped_date)
 				).outerjoin(Activity, and_((ScheduledActivity.id == Activity.scheduled_activity_id),
-										   or_(Activity.start_datetime.cast(Date) == CalendarDay.calendar_date,
-										   		and_(ScheduledActivity.planning_period=="week", Activity.start_datetime.cast(Date) >= CalendarDay.calendar_week_start_date)))
-				).filter(ScheduledActivity.owner == self
-				).filter(ScheduledActivity.is_removed == False
-				).filter(ScheduledActivitySkippedDate.id == None
+										   or_(Activity.activity_date == PlanOccurrence.planned_date,
+										   		and_(ScheduledActivity.planning_period=="week", Activity.activity_date >= PlanOccurrence.week_start_date)))
+				).filter(PlanOccurrence.user_id == self.id
 				).filter(or_(ScheduledActivity.planning_period == planningPeriod, planningPeriod == None)
 				).filter(or_(ScheduledActivity.activity_type == activityType, activityType == None)
 				).filter(Activity.id == None
-				).filter(or_(CalendarDay.calendar_date >= date.today(), and_(ScheduledActivity.planning_period=="week", CalendarDay.calendar_date >= (date.today() - timedelta(days=6))))
-				).filter(CalendarDay.calendar_date >= startDate
-				).filter(CalendarDay.calendar_date <= endDate
+				).filter(or_(PlanOccurrence.planned_date >= date.today(), and_(ScheduledActivity.planning_period=="week", PlanOccurrence.planned_date >= (date.today() - timedelta(days=6))))
+				).filter(PlanOccurrence.planned_date >= startDate
+				).filter(PlanOccurrence.planned_date <= endDate
 				).order_by(ScheduledActivity.id)
 
 		return planned_activities_filtered
@@ -350,7 +347,7 @@ class User(UserMixin, db.Model):
 		completed_activities_filtered = db.session.query(
 											Activity.id,
 											Activity.name,
-											Activity.start_datetime.cast(Date).label("activity_date"),
+											Activity.activity_date,
 											Activity.activity_type,
 											Activity.distance,
 											Activity.moving_time,
@@ -366,8 +363,8 @@ class User(UserMixin, db.Model):
 											ExerciseCategory.category_key
 				).outerjoin(ExerciseCategory, and_(Activity.activity_type==ExerciseCategory.category_name, ExerciseCategory.user_id==Activity.user_id)
 				).filter(Activity.owner == self
-				).filter(Activity.start_datetime.cast(Date) >= startDate
-				).filter(Activity.start_datetime.cast(Date) <= endDate
+				).filter(Activity.activity_date >= startDate
+				).filter(Activity.activity_date <= endDate
 				).order_by(Activity.id)
 
 		return completed_activities_filtered
@@ -386,7 +383,7 @@ class User(UserMixin, db.Model):
 											ExerciseCategory.category_key
 				).outerjoin(ExerciseCategory, and_(ScheduledRace.race_type==ExerciseCategory.category_name, ExerciseCategory.user_id==ScheduledRace.user_id)
 				).outerjoin(Activity, and_((ScheduledRace.user_id == Activity.user_id),
-										   Activity.start_datetime.cast(Date) == ScheduledRace.scheduled_date)
+										   Activity.activity_date == ScheduledRace.scheduled_date)
 				).filter(ScheduledRace.owner == self
 				).filter(ScheduledRace.is_removed == False
 				).filter(Activity.id == None
@@ -404,7 +401,7 @@ class User(UserMixin, db.Model):
 											ExerciseType.name.label("exercise_name"),
 											ScheduledExercise.planning_period,
 											ScheduledExercise.recurrence,
-											CalendarDay.calendar_date.label("planned_date"),
+											PlanOccurrence.planned_date,
 											func.coalesce(ExerciseCategory.category_name, "Uncategorised").label("category_name"),
 											ScheduledExercise.scheduled_day,
 											ScheduledExercise.sets,
@@ -413,26 +410,23 @@ class User(UserMixin, db.Model):
 											ScheduledExercise.seconds,
 											func.coalesce(ExerciseCategory.category_key, "uncategorised").label("category_key"),
 											func.count(Exercise.id).label("completed_sets")																													
-				).join(CalendarDay, or_(ScheduledExercise.scheduled_date==CalendarDay.calendar_date, ScheduledExercise.scheduled_day == CalendarDay.day_of_week)
+				).join(PlanOccurrence, PlanOccurrence.scheduled_exercise_id == ScheduledExercise.id
 				).join(ExerciseType, (ExerciseType.id == ScheduledExercise.exercise_type_id)
 				).outerjoin(ExerciseCategory, ExerciseCategory.id == ExerciseType.exercise_category_id
-				).outerjoin(ScheduledExerciseSkippedDate, and_(ScheduledExercise.id==ScheduledExerciseSkippedDate.scheduled_exercise_id, CalendarDay.calendar_date==ScheduledExerciseSkippedDate.skipped_date)
 				).outerjoin(Exercise, and_((ScheduledExercise.id == Exercise.scheduled_exercise_id),
-										   Exercise.exercise_datetime.cast(Date) >= CalendarDay.calendar_date,
-										   Exercise.exercise_datetime.cast(Date) <= CalendarDay.calendar_date + timedelta(days=6)) # in the same week handles both week and day planning period given recurrence options
-				).filter(ExerciseType.owner == self
-				).filter(ScheduledExercise.is_removed == False
-				).filter(ScheduledExerciseSkippedDate.id == None
-				).filter(or_(CalendarDay.calendar_date >= date.today(), and_(ScheduledExercise.planning_period=="week", CalendarDay.calendar_date >= (date.today() - timedelta(days=6))))
-				).filter(CalendarDay.calendar_date >= startDate
-				).filter(CalendarDay.calendar_date <= endDate
+										   Exercise.exercise_date >= PlanOccurrence.planned_date,
+										   Exercise.exercise_date <= PlanOccurrence.planned_date + timedelta(days=6)) # in the same week handles both week and day planning period given recurrence options
+				).filter(PlanOccurrence.user_id == self.id
+				).filter(or_(PlanOccurrence.planned_date >= date.today(), and_(ScheduledExercise.planning_period=="week", PlanOccurrence.planned_date >= (date.today() - timedelta(days=6))))
+				).filter(PlanOccurrence.planned_date >= startDate
+				).filter(PlanOccurrence.planned_date <= endDate
 				).group_by(
 						ScheduledExercise.id,
 						ScheduledExercise.exercise_type_id,
 						ExerciseType.name,
 						ScheduledExercise.planning_period,
 						ScheduledExercise.recurrence,
-						CalendarDay.calendar_date,
+						PlanOccurrence.planned_date,
 						ExerciseCategory.category_name,
 						ScheduledExercise.scheduled_day,
 						ScheduledExercise.sets,
@@ -450,7 +444,7 @@ class User(UserMixin, db.Model):
 											Exercise.id,
 											Exercise.exercise_type_id,
 											Exercise.exercise_datetime,
-											Exercise.exercise_datetime.cast(Date).label("exercise_date"),
+											Exercise.exercise_date,
 											ExerciseType.name.label("exercise_name"),
 											func.coalesce(ExerciseCategory.category_name, "Uncategorised").label("category_name"),
 											ExerciseType.measured_by,
@@ -460,8 +454,8 @@ class User(UserMixin, db.Model):
 				).join(ExerciseType, (ExerciseType.id == Exercise.exercise_type_id)
 				).outerjoin(ExerciseCategory, ExerciseCategory.id == ExerciseType.exercise_category_id
 				).filter(ExerciseType.owner == self
-				).filter(Exercise.exercise_datetime.cast(Date) >= startDate
-				).filter(Exercise.exercise_datetime.cast(Date) <= endDate
+				).filter(Exercise.exercise_date >= startDate
+				).filter(Exercise.exercise_date <= endDate
 				).order_by(Exercise.id)
 
 		return completed_exercises_filtered
@@ -475,6 +469,9 @@ class User(UserMixin, db.Model):
 			).order_by(ExerciseType.name)
 
 	def scheduled_exercise_categories(self, scheduled_day):
+		return self.scheduled_exercise_categories_for_days([scheduled_day])
+
+	def scheduled_exercise_categories_for_days(self, scheduled_days):
 		return db.session.query(
 					ScheduledExercise.scheduled_day,
 					ExerciseCategory.category_name,
@@ -484,7 +481,7 @@ class User(UserMixin, db.Model):
 			).outerjoin(ExerciseCategory, ExerciseCategory.id == ExerciseType.exercise_category_id
 			).filter(ExerciseType.owner == self
 			).filter(ScheduledExercise.is_removed == False
-			).filter(ScheduledExercise.scheduled_day == scheduled_day
+			).filter(ScheduledExercise.scheduled_day.in_(scheduled_days)
 			).group_by(ScheduledExercise.scheduled_day,
 					   ExerciseCategory.category_name,
 					   ExerciseCategory.category_key)
@@ -511,7 +508,7 @@ class User(UserMixin, db.Model):
 				).join(ScheduledExercise.exercise_scheduled_today
 				).outerjoin(ExerciseType.exercise_category
 				).outerjoin(Exercise, and_((ScheduledExercise.id == Exercise.scheduled_exercise_id),
-										   (func.date(Exercise.exercise_datetime) == date.today()))
+										   (Exercise.exercise_date == date.today()))
 				).filter(ExerciseType.owner == self
 				).group_by(
 					ScheduledExercise.id,
@@ -543,7 +540,7 @@ class User(UserMixin, db.Model):
 				).join(ScheduledActivity.activity_scheduled_today
 				).outerjoin(ExerciseCategory, and_(ScheduledActivity.activity_type==ExerciseCategory.category_name, ExerciseCategory.user_id==ScheduledActivity.user_id)
 				).outerjoin(Activity, and_((ScheduledActivity.id == Activity.scheduled_activity_id),
-										   (func.date(Activity.start_datetime) == date.today()))
+										   (Activity.activity_date == date.today()))
 				).filter(ScheduledActivity.owner == self
 				).filter(or_(ScheduledActivity.activity_type == activity_type, activity_type is None)
 				).group_by(
@@ -561,42 +558,41 @@ class User(UserMixin, db.Model):
 		exercises = db.session.query(
 						func.coalesce(ExerciseCategory.category_name, "Uncategorised").label("category_name"),
 						func.coalesce(ExerciseCategory.category_key, "Uncategorised").label("category_key"),
-						CalendarDay.calendar_week_start_date.label("week_start_date"),
-						func.count(distinct(func.date(Exercise.exercise_datetime))).label("total_activities"),
-						func.count(Exercise.id).label("total_sets"),
-						func.sum(Exercise.reps).label("total_reps"),
-						func.sum(Exercise.seconds).label("total_seconds"),
+						UserWeeklyRollup.week_start_date.label("week_start_date"),
+						func.sum(UserWeeklyRollup.active_days).label("total_activities"),
+						func.sum(UserWeeklyRollup.activities_completed).label("total_sets"),
+						func.sum(UserWeeklyRollup.total_reps).label("total_reps"),
+						func.sum(UserWeeklyRollup.total_seconds).label("total_seconds"),
 						null().label("total_distance")
-				).join(ExerciseType.exercises
-				).outerjoin(ExerciseType.exercise_category
-				).join(CalendarDay, func.date(Exercise.exercise_datetime)==CalendarDay.calendar_date
-				).filter(ExerciseType.owner == self
-				).filter(or_(CalendarDay.calendar_year == year, year is None)
-				).filter(or_(CalendarDay.calendar_week_start_date == week, week is None)
+				).outerjoin(ExerciseCategory, UserWeeklyRollup.exercise_category_id==ExerciseCategory.id
+				).filter(UserWeeklyRollup.user_id == self.id
+				).filter(UserWeeklyRollup.source == "Exercise"
+				).filter(or_(UserWeeklyRollup.calendar_year == year, year is None)
+				).filter(or_(UserWeeklyRollup.week_start_date == week, week is None)
 				).group_by(
-						CalendarDay.calendar_week_start_date,
+						UserWeeklyRollup.week_start_date,
 						ExerciseCategory.category_key,
 						ExerciseCategory.category_name
 				)
 
 		activities = db.session.query(
-						Activity.activity_type.label("category_name"),
-						func.coalesce(ExerciseCategory.category_key, Activity.activity_type).label("category_key"),
-						CalendarDay.calendar_week_start_date.label("week_start_date"),
-						func.count(distinct(func.date(Activity.start_datetime))).label("total_activities"),
-						func.count(Activity.id).label("total_sets"),
+						UserWeeklyRollup.activity_type.label("category_name"),
+						func.coalesce(ExerciseCategory.category_key, UserWeeklyRollup.activity_type).label("category_key"),
+						UserWeeklyRollup.week_start_date.label("week_start_date"),
+						func.sum(UserWeeklyRollup.active_days).label("total_activities"),
+						func.sum(UserWeeklyRollup.activities_completed).label("total_sets"),
 						null().label("total_reps"),
-						extract("epoch", func.sum(Activity.moving_time)).label("total_seconds"),
-						func.sum(Activity.distance).label("total_distance")
-				).join(CalendarDay, func.date(Activity.start_datetime)==CalendarDay.calendar_date
-				).outerjoin(ExerciseCategory, and_(Activity.activity_type==ExerciseCategory.category_name, ExerciseCategory.user_id==Activity.user_id)
-				).filter(Activity.owner == self
-				).filter(or_(CalendarDay.calendar_year == year, year is None)
-				).filter(or_(CalendarDay.calendar_week_start_date == week, week is None)
+						extract("epoch", func.sum(UserWeeklyRollup.total_moving_time)).label("total_seconds"),
+						func.sum(UserWeeklyRollup.total_distance).label("total_distance")
+				).outerjoin(ExerciseCategory, and_(UserWeeklyRollup.activity_type==ExerciseCategory.category_name, ExerciseCategory.user_id==UserWeeklyRollup.user_id)
+				).filter(UserWeeklyRollup.user_id == self.id
+				).filter(UserWeeklyRollup.source == "Activity"
+				).filter(or_(UserWeeklyRollup.calendar_year == year, year is None)
+				).filter(or_(UserWeeklyRollup.week_start_date == week, week is None)
 				).group_by(
-					CalendarDay.calendar_week_start_date,
+						UserWeeklyRollup.week_start_date,
 						ExerciseCategory.category_key,
-						Activity.activity_type.label("category_name")
+						UserWeeklyRollup.activity_type
 				)
 
 		weekly_activity_summary = exercises.union(activities)
@@ -605,45 +601,45 @@ class User(UserMixin, db.Model):
 	def weekly_activity_type_stats(self, week):
 		# For now just return 1 row with run stats for the week, but in due course we can open it to rides and swims
 		weekly_activity_type_stats = db.session.query(
-						Activity.activity_type,
-						func.coalesce(ExerciseCategory.category_key, Activity.activity_type).label("category_key"),
-						func.count(Activity.id).label("activities_completed"),
-						func.sum(Activity.distance).label("total_distance"),
-						func.sum(Activity.moving_time).label("total_moving_time"),
-						func.sum(Activity.total_elevation_gain).label("total_elevation_gain"),
-						func.max(Activity.distance).label("longest_distance")
-				).join(CalendarDay, func.date(Activity.start_datetime)==CalendarDay.calendar_date
-				).outerjoin(ExerciseCategory, and_(Activity.activity_type==ExerciseCategory.category_name, ExerciseCategory.user_id==Activity.user_id)
-				).filter(Activity.owner == self
-				).filter(Activity.activity_type.in_(["Run"]) # We'll change this later on but for now focusing on this to enable running goals
-				).filter(CalendarDay.calendar_week_start_date == week
+						UserWeeklyRollup.activity_type,
+						func.coalesce(ExerciseCategory.category_key, UserWeeklyRollup.activity_type).label("category_key"),
+						func.sum(UserWeeklyRollup.activities_completed).label("activities_completed"),
+						func.sum(UserWeeklyRollup.total_distance).label("total_distance"),
+						func.sum(UserWeeklyRollup.total_moving_time).label("total_moving_time"),
+						func.sum(UserWeeklyRollup.total_elevation_gain).label("total_elevation_gain"),
+						func.max(UserWeeklyRollup.longest_distance).label("longest_distance")
+				).outerjoin(ExerciseCategory, and_(UserWeeklyRollup.activity_type==ExerciseCategory.category_name, ExerciseCategory.user_id==UserWeeklyRollup.user_id)
+				).filter(UserWeeklyRollup.user_id == self.id
+				).filter(UserWeeklyRollup.source == "Activity"
+				).filter(UserWeeklyRollup.activity_type.in_(["Run"]) # We'll change this later on but for now focusing on this to enable running goals
+				).filter(UserWeeklyRollup.week_start_date == week
 				).group_by(
 						ExerciseCategory.category_key,
-						Activity.activity_type
+						UserWeeklyRollup.activity_type
 				)
 
 		return weekly_activity_type_stats
 
 	def activity_summary_by_week(self, start_date, end_date):
 		activity_summary_by_week = db.session.query(
-						Activity.activity_type,
-						CalendarDay.calendar_week_start_date,
-						func.coalesce(ExerciseCategory.category_key, Activity.activity_type).label("category_key"),
-						func.count(Activity.id).label("activities_completed"),
-						func.sum(Activity.distance).label("total_distance"),
-						func.sum(Activity.moving_time).label("total_moving_time"),
-						func.sum(case([(Activity.is_bad_elevation_data == False, Activity.total_elevation_gain)])).label("total_elevation_gain"),
-						func.max(Activity.distance).label("longest_distance")
-				).join(CalendarDay, func.date(Activity.start_datetime)==CalendarDay.calendar_date
-				).outerjoin(ExerciseCategory, and_(Activity.activity_type==ExerciseCategory.category_name, ExerciseCategory.user_id==Activity.user_id)
-				).filter(Activity.owner == self
-				).filter(Activity.activity_type.in_(["Run", "Ride", "Swim"])
-				).filter(CalendarDay.calendar_week_start_date >= start_date
-				).filter(CalendarDay.calendar_week_start_date <= end_date
+						UserWeeklyRollup.activity_type,
+						UserWeeklyRollup.week_start_date.label("calendar_week_start_date"),
+						func.coalesce(ExerciseCategory.category_key, UserWeeklyRollup.activity_type).label("category_key"),
+						func.sum(UserWeeklyRollup.activities_completed).label("activities_completed"),
+						func.sum(UserWeeklyRollup.total_distance).label("total_distance"),
+						func.sum(UserWeeklyRollup.total_moving_time).label("total_moving_time"),
+						func.sum(UserWeeklyRollup.total_reliable_elevation_gain).label("total_elevation_gain"),
+						func.max(UserWeeklyRollup.longest_distance).label("longest_distance")
+				).outerjoin(ExerciseCategory, and_(UserWeeklyRollup.activity_type==ExerciseCategory.category_name, ExerciseCategory.user_id==UserWeeklyRollup.user_id)
+				).filter(UserWeeklyRollup.user_id == self.id
+				).filter(UserWeeklyRollup.source == "Activity"
+				).filter(UserWeeklyRollup.activity_type.in_(["Run", "Ride", "Swim"])
+				).filter(UserWeeklyRollup.week_start_date >= start_date
+				).filter(UserWeeklyRollup.week_start_date <= end_date
 				).group_by(
-						CalendarDay.calendar_week_start_date,
+						UserWeeklyRollup.week_start_date,
 						ExerciseCategory.category_key,
-						Activity.activity_type
+						UserWeeklyRollup.activity_type
 				)
 
 		return activity_summary_by_week
@@ -652,17 +648,16 @@ class User(UserMixin, db.Model):
 	def weekly_cadence_stats(self, week=None):
 		weekly_cadence_stats = db.session.query(
 						ActivityCadenceAggregate.cadence,
-						CalendarDay.calendar_week_start_date,
+						Activity.week_start_date.label("calendar_week_start_date"),
 						func.sum(ActivityCadenceAggregate.total_seconds_at_cadence).label("total_seconds_at_cadence"),
 						func.sum(ActivityCadenceAggregate.total_seconds_above_cadence).label("total_seconds_above_cadence"),
 						literal("").label("total_seconds_above_cadence_formatted")
 				).join(ActivityCadenceAggregate.activity
-				).join(CalendarDay, func.date(Activity.start_datetime)==CalendarDay.calendar_date
 				).filter(Activity.owner == self
-				).filter(or_(CalendarDay.calendar_week_start_date == week, week is None)
+				).filter(or_(Activity.week_start_date == week, week is None)
 				).group_by(
 						ActivityCadenceAggregate.cadence,
-						CalendarDay.calendar_week_start_date
+						Activity.week_start_date
 				).order_by(ActivityCadenceAggregate.cadence.desc()) # Descending to support running total calcs
 
 		return weekly_cadence_stats
@@ -670,17 +665,16 @@ class User(UserMixin, db.Model):
 	def weekly_gradient_stats(self, week=None):
 		weekly_gradient_stats = db.session.query(
 						ActivityGradientAggregate.gradient,
-						CalendarDay.calendar_week_start_date,
+						Activity.week_start_date.label("calendar_week_start_date"),
 						func.sum(ActivityGradientAggregate.total_metres_at_gradient).label("total_metres_at_gradient"),
 						func.sum(ActivityGradientAggregate.total_metres_above_gradient).label("total_seconds_above_gradient"),
 						literal("").label("total_metres_above_gradient_formatted")
 				).join(ActivityGradientAggregate.activity
-				).join(CalendarDay, func.date(Activity.start_datetime)==CalendarDay.calendar_date
 				).filter(Activity.owner == self
-				).filter(or_(CalendarDay.calendar_week_start_date == week, week is None)
+				).filter(or_(Activity.week_start_date == week, week is None)
 				).group_by(
 						ActivityGradientAggregate.gradient,
-						CalendarDay.calendar_week_start_date
+						Activity.week_start_date
 				).order_by(ActivityGradientAggregate.gradient.desc()) # Descending to support running total calcs
 
 		return weekly_gradient_stats
@@ -691,7 +685,7 @@ class User(UserMixin, db.Model):
 					ExerciseType.name,
 					literal("Exercise").label("source"),
 					ExerciseType.measured_by,
-					func.date(Exercise.exercise_datetime).label("activity_date"),
+					Exercise.exercise_date.label("activity_date"),
 					null().label("is_race"),
 					func.sum(Exercise.reps).label("total_reps"),
 					func.sum(Exercise.seconds).label("total_seconds"),
@@ -703,7 +697,7 @@ class User(UserMixin, db.Model):
 					ExerciseType.id,
 					ExerciseType.name,
 					ExerciseType.measured_by,
-					func.date(Exercise.exercise_datetime)
+					Exercise.exercise_date
 				).order_by(ExerciseType.measured_by, func.sum(Exercise.reps).desc(), func.sum(Exercise.seconds).desc(), ExerciseType.name)
 
 		activities = db.session.query(
@@ -711,7 +705,7 @@ class User(UserMixin, db.Model):
 						Activity.name,
 						func.coalesce(Activity.external_source, "Activity").label("source"),
 						literal("distance").label("measured_by"),
-						func.date(Activity.start_datetime).label("activity_date"),
+						Activity.activity_date,
 						Activity.is_race,
 						null().label("total_reps"),
 						null().label("total_seconds"),
@@ -725,18 +719,17 @@ class User(UserMixin, db.Model):
 
 	def exercises_by_category_and_day(self, week=None):
 		exercises_by_category_and_day = db.session.query(
-					func.date(Exercise.exercise_datetime).label("exercise_date"),
+					Exercise.exercise_date,
 					func.coalesce(ExerciseCategory.category_key, "Uncategorised").label("category_key"),
 					func.count(Exercise.id).label("exercise_sets_count"),
 					func.sum(Exercise.reps).label("total_reps"),
 					func.sum(Exercise.seconds).label("total_seconds")
 				).join(ExerciseType.exercises
-				).join(CalendarDay, func.date(Exercise.exercise_datetime)==CalendarDay.calendar_date
 				).outerjoin(ExerciseType.exercise_category
 				).filter(ExerciseType.owner == self
-				).filter(or_(CalendarDay.calendar_week_start_date == week, week is None)
+				).filter(or_(Exercise.week_start_date == week, week is None)
 				).group_by(
-					func.date(Exercise.exercise_datetime).label("exercise_date"),
+					Exercise.exercise_date,
 					ExerciseCategory.category_name,
 					ExerciseCategory.category_key
 				)
@@ -827,7 +820,7 @@ class User(UserMixin, db.Model):
 
 class ExerciseCategory(db.Model):
 	id = db.Column(db.Integer, primary_key=True)
-	user_id = db.Column(db.Integer, db.ForeignKey("user.id"))
+	user_id = db.Column(db.Integer, db.ForeignKey("user.id"), index=True)
 	category_key = db.Column(db.String(25))
 	category_name = db.Column(db.String(25))
 	created_datetime = db.Column(db.DateTime, default=datetime.utcnow)
@@ -843,8 +836,8 @@ class ExerciseType(db.Model):
 	id = db.Column(db.Integer, primary_key=True)
 	name = db.Column(db.String(100), index=True)
 	measured_by = db.Column(db.String(50))
-	user_id = db.Column(db.Integer, db.ForeignKey("user.id"))
-	exercise_category_id = db.Column(db.Integer, db.ForeignKey("exercise_category.id"))
+	user_id = db.Column(db.Integer, db.ForeignKey("user.id"), index=True)
+	exercise_category_id = db.Column(db.Integer, db.ForeignKey("exercise_category.id"), index=True)
 	default_reps = db.Column(db.Integer)
 	default_seconds = db.Column(db.Integer)
 	created_datetime = db.Column(db.DateTime, default=datetime.utcnow)
@@ -861,9 +854,13 @@ class Activity(db.Model):
 	external_source = db.Column(db.String(50))
 	external_id = db.Column(db.String(50)) # string in case we ever use anyting other than Strava
 	user_id = db.Column(db.Integer, db.ForeignKey("user.id"))
-	scheduled_activity_id = db.Column(db.Integer, db.ForeignKey("scheduled_activity.id"))
+	scheduled_activity_id = db.Column(db.Integer, db.ForeignKey("scheduled_activity.id"), index=True)
 	name = db.Column(db.String(500))
 	start_datetime = db.Column(db.DateTime)
+	# Stored copies of the date parts of start_datetime so queries can filter and group by them without joining to CalendarDay
+	activity_date = db.Column(db.Date)
+	week_start_date = db.Column(db.Date)
+	calendar_year = db.Column(db.Integer)
 	activity_type = db.Column(db.String(50))
 	is_race = db.Column(db.Boolean, default=False)
 	distance = db.Column(db.Numeric())
@@ -882,19 +879,20 @@ class Activity(db.Model):
 	activity_cadence_aggregates = db.relationship("ActivityCadenceAggregate", backref="activity", lazy="dynamic")
 	activity_pace_aggregates = db.relationship("ActivityPaceAggregate", backref="activity", lazy="dynamic")
 	activity_gradient_aggregates = db.relationship("ActivityGradientAggregate", backref="activity", lazy="dynamic")
+	stream_parse_jobs = db.relationship("StreamParseJob", backref="activity", lazy="dynamic")
+	activity_streams = db.relationship("ActivityStream", backref="activity", lazy="dynamic")
+	# The user's category with the same name as the activity type, if there is one
+	category = db.relationship("ExerciseCategory", primaryjoin="and_(foreign(Activity.activity_type) == ExerciseCategory.category_name, foreign(Activity.user_id) == ExerciseCategory.user_id)",
+							   viewonly=True, uselist=False)
+
+	__table_args__ = (db.Index("ix_activity_user_id_external_source_external_id", "user_id", "external_source", "external_id", unique=True),
+					  db.Index("ix_activity_user_id_week_start_date_activity_type", "user_id", "week_start_date", "activity_type"),
+					  db.Index("ix_activity_user_id_activity_date", "user_id", "activity_date"),
+					  db.Index("ix_activity_user_id_start_datetime", "user_id", "start_datetime"))
 
 	def __repr__(self):
 		return "<Activity {name} with external ID of {external_id}>".format(name=self.name, external_id=self.external_id)
 
-	@property
-	def category(self):
-		category = ExerciseCategory.query.filter_by(category_name=self.activity_type).filter_by(owner=self.owner).first()
-		return category
-
-	@property
-	def activity_date(self):
-		return self.start_datetime.date()
-
 	@property
 	def distance_formatted(self):
 		return utils.format_distance_for_uom_preference(self.distance, self.owner)
@@ -919,6 +917,44 @@ class Activity(db.Model):
 		return "{gradient} %".format(gradient=self.average_climbing_gradient) if self.average_climbing_gradient else None
 
 
+class StravaSyncCheckpoint(db.Model):
+	id = db.Column(db.Integer, primary_key=True)
+	user_id = db.Column(db.Integer, db.ForeignKey("user.id"), index=True, unique=True)
+	synced_until_datetime = db.Column(db.DateTime) # start of the latest Strava activity that has been saved
+	status = db.Column(db.String(20)) # In Progress, Completed
+	activities_synced = db.Column(db.Integer, default=0)
+	started_datetime = db.Column(db.DateTime)
+	updated_datetime = db.Column(db.DateTime, default=datetime.utcnow)
+	created_datetime = db.Column(db.DateTime, default=datetime.utcnow)
+
+	def __repr__(self):
+		return "<StravaSyncCheckpoint for {user_id} up to {synced_until}>".format(user_id=self.user_id, synced_until=self.synced_until_datetime)
+
+
+class StravaWebhookEvent(db.Model):
+	id = db.Column(db.Integer, primary_key=True)
+	object_type = db.Column(db.String(20)) # activity, athlete
+	object_id = db.Column(db.BigInteger)
+	owner_id = db.Column(db.BigInteger) # Strava athlete ID
+	aspect_type = db.Column(db.String(20)) # create, update, delete
+	updates = db.Column(db.String(1000)) # JSON of the fields that changed
+	event_datetime = db.Column(db.DateTime)
+	status = db.Column(db.String(20), default="Queued") # Queued, Running, Completed, Failed
+	received_count = db.Column(db.Integer, default=1) # number of events coalesced into this one
+	attempts = db.Column(db.Integer, default=0)
+	next_attempt_datetime = db.Column(db.DateTime, default=datetime.utcnow)
+	last_error = db.Column(db.String(1000))
+	completed_datetime = db.Column(db.DateTime)
+	created_datetime = db.Column(db.DateTime, default=datetime.utcnow)
+
+	# Only one queued event per Strava object, any more that arrive before it is applied get merged into it
+	__table_args__ = (db.Index("ix_strava_webhook_event_queued_object", "object_type", "object_id", unique=True, postgresql_where=db.text("status = 'Queued'")),
+					  db.Index("ix_strava_webhook_event_status_id", "status", "id"),)
+
+	def __repr__(self):
+		return "<StravaWebhookEvent {aspect_type} {object_type} {object_id}>".format(aspect_type=self.aspect_type, object_type=self.object_type, object_id=self.object_id)
+
+
 class ActivityCadenceAggregate(db.Model):
 	id = db.Column(db.Integer, primary_key=True)
 	activity_id = db.Column(db.Integer, db.ForeignKey("activity.id"))
@@ -927,6 +963,8 @@ class ActivityCadenceAggregate(db.Model):
 	total_seconds_above_cadence = db.Column(db.Integer)
 	created_datetime = db.Column(db.DateTime, default=datetime.utcnow)
 
+	__table_args__ = (db.Index("ix_activity_cadence_aggregate_activity_id_cadence", "activity_id", "cadence"),)
+
 	def __repr__(self):
 		return "<ActivityCadenceAggregate for {cadence} on {name}>".format(cadence=self.cadence, name=self.activity.name)
 
@@ -947,6 +985,8 @@ class ActivityPaceAggregate(db.Model):
 	total_seconds_above_pace = db.Column(db.Integer)
 	created_datetime = db.Column(db.DateTime, default=datetime.utcnow)
 
+	__table_args__ = (db.Index("ix_activity_pace_aggregate_activity_id_pace_seconds", "activity_id", "pace_seconds"),)
+
 	def __repr__(self):
 		return "<ActivityPaceAggregate for {pace_seconds} on {name}>".format(pace_seconds=self.pace_seconds, name=self.activity.name)
 
@@ -968,6 +1008,8 @@ class ActivityGradientAggregate(db.Model):
 	total_metres_at_gradient = db.Column(db.Integer)
 	total_metres_above_gradient = db.Column(db.Integer)
 	created_datetime = db.Column(db.DateTime, default=datetime.utcnow)
+
+	__table_args__ = (db.Index("ix_activity_gradient_aggregate_activity_id_gradient", "activity_id", "gradient"),)
 	
 	def __repr__(self):
 		return "<ActivityGradientAggregate for {gradient} on {name}>".format(gradient=self.gradient, name=self.activity.name)
@@ -989,31 +1031,86 @@ class ActivityGradientAggregate(db.Model):
 		return utils.format_distance(m=self.total_metres_above_gradient)
 
 
+class ActivityStream(db.Model):
+	id = db.Column(db.Integer, primary_key=True)
+	activity_id = db.Column(db.Integer, db.ForeignKey("activity.id"))
+	stream_type = db.Column(db.String(20))
+	dtype = db.Column(db.String(10)) # numpy type string of the compressed array, e.g. <f8
+	point_count = db.Column(db.Integer)
+	data = db.Column(db.LargeBinary)
+	created_datetime = db.Column(db.DateTime, default=datetime.utcnow)
+
+	__table_args__ = (db.Index("ix_activity_stream_activity_id_stream_type", "activity_id", "stream_type", unique=True),)
+
+	def __repr__(self):
+		return "<ActivityStream {stream_type} for {activity_id}>".format(stream_type=self.stream_type, activity_id=self.activity_id)
+
+
+class StreamParseJob(db.Model):
+	id = db.Column(db.Integer, primary_key=True)
+	user_id = db.Column(db.Integer, db.ForeignKey("user.id"), index=True)
+	activity_id = db.Column(db.Integer, db.ForeignKey("activity.id"), index=True)
+	status = db.Column(db.String(20), default="Queued") # Queued, Running, Retrying, Completed, Failed
+	attempts = db.Column(db.Integer, default=0)
+	next_attempt_datetime = db.Column(db.DateTime, default=datetime.utcnow)
+	last_error = db.Column(db.String(1000))
+	completed_datetime = db.Column(db.DateTime)
+	created_datetime = db.Column(db.DateTime, default=datetime.utcnow)
+
+	__table_args__ = (db.Index("ix_stream_parse_job_status_next_attempt_datetime", "status", "next_attempt_datetime"),)
+
+	def __repr__(self):
+		return "<StreamParseJob for {activity_id} with status of {status}>".format(activity_id=self.activity_id, status=self.status)
+
+
 class Exercise(db.Model):
 	id = db.Column(db.Integer, primary_key=True)
 	exercise_type_id = db.Column(db.Integer, db.ForeignKey("exercise_type.id"))
-	scheduled_exercise_id = db.Column(db.Integer, db.ForeignKey("scheduled_exercise.id"))
+	scheduled_exercise_id = db.Column(db.Integer, db.ForeignKey("scheduled_exercise.id"), index=True)
 	exercise_datetime = db.Column(db.DateTime, index=True, default=datetime.utcnow)
+	exercise_date = db.Column(db.Date)
+	week_start_date = db.Column(db.Date)
+	calendar_year = db.Column(db.Integer)
 	reps = db.Column(db.Integer)
 	seconds = db.Column(db.Integer)
 	created_datetime = db.Column(db.DateTime, default=datetime.utcnow)
 
+	__table_args__ = (db.Index("ix_exercise_exercise_type_id_week_start_date", "exercise_type_id", "week_start_date"),
+					  db.Index("ix_exercise_exercise_type_id_exercise_date", "exercise_type_id", "exercise_date"))
+
 	def __repr__(self):
 		return "<Exercise {name} for {user} at {time}>".format(
 			name=self.type.name, user=self.type.owner.email, time=self.exercise_datetime)
 
-	@property
-	def exercise_date(self):
-		return self.exercise_datetime.date()
-
 	@property
 	def owner(self):
 		return self.type.owner
 
 
+# The stored date columns are worked out whenever an activity or exercise is written through the ORM. Anything writing
+# them with Core statements (e.g. strava_utils.upsert_strava_activities) has to fill them in itself.
+@event.listens_for(Activity, "before_insert")
+@event.listens_for(Activity, "before_update")
+def set_activity_dates(mapper, connection, activity):
+	activity.activity_date = activity.start_datetime.date() if activity.start_datetime else None
+	activity.week_start_date = utils.week_start_date(activity.activity_date) if activity.activity_date else None
+	activity.calendar_year = activity.activity_date.year if activity.activity_date else None
+
+
+@event.listens_for(Exercise, "before_insert")
+@event.listens_for(Exercise, "before_update")
+def set_exercise_dates(mapper, connection, exercise):
+	# The column default isn't applied until after this runs
+	if exercise.exercise_datetime is None:
+		exercise.exercise_datetime = datetime.utcnow()
+	exercise.exercise_date = exercise.exercise_datetime.date()
+	exercise.week_start_date = utils.week_start_date(exercise.exercise_date)
+	exercise.calendar_year = exercise.exercise_date.year
+
+
 class ScheduledExercise(db.Model):
 	id = db.Column(db.Integer, primary_key=True)
-	exercise_type_id = db.Column(db.Integer, db.ForeignKey("exercise_type.id"))
+	exercise_type_id = db.Column(db.Integer, db.ForeignKey("exercise_type.id"), index=True)
 	planning_period = db.Column(db.String(20), default="day")
 	recurrence = db.Column(db.String(20))
 	scheduled_date = db.Column(db.Date)
@@ -1034,7 +1131,7 @@ class ScheduledExercise(db.Model):
 
 class ExerciseForToday(db.Model):
 	id = db.Column(db.Integer, primary_key=True)
-	scheduled_exercise_id = db.Column(db.Integer, db.ForeignKey("scheduled_exercise.id"))
+	scheduled_exercise_id = db.Column(db.Integer, db.ForeignKey("scheduled_exercise.id"), index=True)
 	created_datetime = db.Column(db.DateTime, default=datetime.utcnow)
 
 	def __repr__(self):
@@ -1048,6 +1145,8 @@ class ScheduledExerciseSkippedDate(db.Model):
 	skipped_date = db.Column(db.Date)
 	created_datetime = db.Column(db.DateTime, default=datetime.utcnow)
 
+	__table_args__ = (db.Index("ix_scheduled_exercise_skipped_date_exercise_id_date", "scheduled_exercise_id", "skipped_date"),)
+
 	def __repr__(self):
 		return "<ScheduledExerciseSkippedDate for {name} by {user} on {date}>".format(
 			activity_type=self.scheduled_exercise.type.name, user=self.scheduled_exercise.owner.email, date=self.skipped_date)
@@ -1055,7 +1154,7 @@ class ScheduledExerciseSkippedDate(db.Model):
 
 class ScheduledActivity(db.Model):
 	id = db.Column(db.Integer, primary_key=True)
-	user_id = db.Column(db.Integer, db.ForeignKey("user.id"))
+	user_id = db.Column(db.Integer, db.ForeignKey("user.id"), index=True)
 	activity_type = db.Column(db.String(50))
 	activity_subtype = db.Column(db.String(50))
 	planning_period = db.Column(db.String(20), default="day")
@@ -1093,6 +1192,8 @@ class ScheduledRace(db.Model):
 	race_website_url = db.Column(db.String(250))
 	is_removed = db.Column(db.Boolean, default=False)
 
+	__table_args__ = (db.Index("ix_scheduled_race_user_id_scheduled_date", "user_id", "scheduled_date"),)
+
 	def __repr__(self):
 		return "<ScheduledRace of {name} for {user} on {date}>".format(
 			name=self.name, user=self.owner.email, date=self.scheduled_date)
@@ -1100,7 +1201,7 @@ class ScheduledRace(db.Model):
 
 class ActivityForToday(db.Model):
 	id = db.Column(db.Integer, primary_key=True)
-	scheduled_activity_id = db.Column(db.Integer, db.ForeignKey("scheduled_activity.id"))
+	scheduled_activity_id = db.Column(db.Integer, db.ForeignKey("scheduled_activity.id"), index=True)
 	created_datetime = db.Column(db.DateTime, default=datetime.utcnow)
 
 	def __repr__(self):
@@ -1114,10 +1215,30 @@ class ScheduledActivitySkippedDate(db.Model):
 	skipped_date = db.Column(db.Date)
 	created_datetime = db.Column(db.DateTime, default=datetime.utcnow)
 
+	__table_args__ = (db.Index("ix_scheduled_activity_skipped_date_activity_id_date", "scheduled_activity_id", "skipped_date"),)
+
 	def __repr__(self):
 		return "<ScheduledActivitySkippedDate for {activity_type} by {user} on {date}>".format(
 			activity_type=self.scheduled_activity.activity_type, user=self.scheduled_activity.owner.email, date=self.skipped_date)
 
+
+class PlanOccurrence(db.Model):
+	# Each date that a scheduled activity or exercise is planned for, from a few days ago up to the user's
+	# plan_occurrences_until, leaving out skipped dates and removed items. Kept up to date by app.plan_occurrences.
+	id = db.Column(db.Integer, primary_key=True)
+	user_id = db.Column(db.Integer, db.ForeignKey("user.id"))
+	scheduled_activity_id = db.Column(db.Integer, db.ForeignKey("scheduled_activity.id", ondelete="CASCADE"))
+	scheduled_exercise_id = db.Column(db.Integer, db.ForeignKey("scheduled_exercise.id", ondelete="CASCADE"))
+	planned_date = db.Column(db.Date)
+	week_start_date = db.Column(db.Date)
+
+	__table_args__ = (db.Index("ix_plan_occurrence_user_id_planned_date", "user_id", "planned_date"),
+					  db.Index("ix_plan_occurrence_scheduled_activity_id_planned_date", "scheduled_activity_id", "planned_date", unique=True),
+					  db.Index("ix_plan_occurrence_scheduled_exercise_id_planned_date", "scheduled_exercise_id", "planned_date", unique=True))
+
+	def __repr__(self):
+		return "<PlanOccurrence for user {user_id} on {date}>".format(user_id=self.user_id, date=self.planned_date)
+
 class TrainingGoal(db.Model):
 	id = db.Column(db.Integer, primary_key=True)
 	user_id = db.Column(db.Integer, db.ForeignKey("user.id"))
@@ -1131,6 +1252,8 @@ class TrainingGoal(db.Model):
 	goal_status = db.Column(db.String(20))
 	created_datetime = db.Column(db.DateTime, default=datetime.utcnow)
 
+	__table_args__ = (db.Index("ix_training_goal_user_id_goal_metric_goal_start_date", "user_id", "goal_metric", "goal_start_date"),)
+
 	def __repr__(self):
 		return "<TrainingGoal for {metric} starting on {start_date}>".format(metric=self.goal_metric, start_date=self.goal_start_date)
 
@@ -1176,6 +1299,36 @@ class CalendarDay(db.Model):
 		return "<CalendarDay {date}>".format(date=self.calendar_date)
 
 
+class UserWeeklyRollup(db.Model):
+	# Weekly totals of each user's activities (by activity type) and exercises (by category) that the summary screens read
+	# from instead of aggregating the raw rows. Kept up to date by app.rollups whenever activities or exercises change.
+	# Weeks that span new year are split in two so that yearly totals still add up
+	id = db.Column(db.Integer, primary_key=True)
+	user_id = db.Column(db.Integer, db.ForeignKey("user.id"))
+	week_start_date = db.Column(db.Date)
+	calendar_year = db.Column(db.Integer)
+	source = db.Column(db.String(20)) # Activity or Exercise
+	activity_type = db.Column(db.String(50)) # for activities
+	exercise_category_id = db.Column(db.Integer) # for exercises, None when uncategorised
+	activities_completed = db.Column(db.Integer) # number of activities or exercise sets
+	active_days = db.Column(db.Integer)
+	total_distance = db.Column(db.Numeric())
+	total_moving_time = db.Column(db.Interval())
+	total_elevation_gain = db.Column(db.Numeric())
+	total_reliable_elevation_gain = db.Column(db.Numeric()) # excluding activities flagged as having bad elevation data
+	longest_distance = db.Column(db.Numeric())
+	total_reps = db.Column(db.Integer)
+	total_seconds = db.Column(db.Integer)
+
+	# One row per key, which is also what refreshes use to find a user's weeks. activity_type and exercise_category_id are
+	# coalesced as one or the other is always NULL, and NULLs would never clash
+	__table_args__ = (db.Index("ix_user_weekly_rollup_key", "user_id", "week_start_date", "calendar_year", "source",
+							   db.text("coalesce(activity_type, '')"), db.text("coalesce(exercise_category_id, 0)"), unique=True),)
+
+	def __repr__(self):
+		return "<UserWeeklyRollup for {user_id} in week {week}>".format(user_id=self.user_id, week=self.week_start_date)
+
+
 class AvailableCategoryKey(db.Model):
 	id = db.Column(db.Integer, primary_key=True)
 	category_key = db.Column(db.String(25))
@@ -0,0 +1,222 @@
+import calendar
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from datetime import date, datetime
+from sqlalchemy import and_, or_, func
+
+from app import db
+from app.models import Activity, Exercise, ExerciseType, ExerciseCategory, ScheduledActivity, ScheduledActivitySkippedDate, ScheduledExercise, ScheduledExerciseSkippedDate
+
+# Expands a user's plan into dated occurrences in Python rather than joining each scheduled item onto CalendarDay. The
+# scheduled items, skipped dates and completions are each loaded in one flat query, dates are handled as ordinals and
+# the completions for each scheduled item are kept in a sorted array so they can be looked up with bisect. The rows
+# have the same fields as User.planned_activities_filtered and User.planned_exercises_filtered.
+PlannedActivityRow = namedtuple("PlannedActivityRow", ["id", "planning_period", "recurrence", "planned_date", "activity_type", "activity_subtype",
+													   "scheduled_day", "description", "planned_distance", "category_key"])
+PlannedExerciseRow = namedtuple("PlannedExerciseRow", ["id", "exercise_type_id", "exercise_name", "planning_period", "recurrence", "planned_date",
+													   "category_name", "scheduled_day", "sets", "measured_by", "reps", "seconds", "category_key",
+													   "completed_sets"])
+
+# The same abbreviations as CalendarDay.day_of_week and ScheduledActivity.scheduled_day
+DAYS_OF_WEEK = list(calendar.day_abbr)
+NO_COMPLETIONS = array("l")
+
+def as_date(value):
+	return value.date() if isinstance(value, datetime) else value
+
+
+def weekday(ordinal):
+	# date.fromordinal(1) is a Monday
+	return (ordinal - 1) % 7
+
+
+def week_start_ordinal(ordinal):
+	return ordinal - weekday(ordinal)
+
+
+def occurrence_ordinals(scheduled_date, scheduled_day, first_ordinal, last_ordinal):
+	# Matches joining CalendarDay on scheduled_date == calendar_date or scheduled_day == day_of_week, which only gives
+	# one row per day even when both match
+	ordinals = set()
+	if scheduled_date is not None and first_ordinal <= scheduled_date.toordinal() <= last_ordinal:
+		ordinals.add(scheduled_date.toordinal())
+	if scheduled_day in DAYS_OF_WEEK:
+		first_match = first_ordinal + (DAYS_OF_WEEK.index(scheduled_day) - weekday(first_ordinal)) % 7
+		ordinals.update(range(first_match, last_ordinal + 1, 7))
+	return sorted(ordinals)
+
+
+def completion_ordinals(rows):
+	# rows of (scheduled id, completion date) sorted by date
+	completions = {}
+	for scheduled_id, completion_date in rows:
+		completions.setdefault(scheduled_id, array("l")).append(completion_date.toordinal())
+	return completions
+
+
+def is_activity_completed(completed_ordinals, ordinal, is_weekly):
+	# A weekly plan is done by anything completed for it from the start of its week onwards, anything else has to be
+	# completed on the day
+	completed_index = bisect_left(completed_ordinals, week_start_ordinal(ordinal) if is_weekly else ordinal)
+	return completed_index < len(completed_ordinals) and (is_weekly or completed_ordinals[completed_index] == ordinal)
+
+
+def completed_set_count(completed_ordinals, ordinal):
+	# Sets count towards an occurrence for the six days after it too
+	return bisect_right(completed_ordinals, ordinal + 6) - bisect_left(completed_ordinals, ordinal)
+
+
+class PlanExpander:
+	def __init__(self, user):
+		self.user = user
+		self.today_ordinal = date.today().toordinal()
+
+	def first_ordinal(self, start_ordinal, planning_period):
+		# Weekly plans stay in the plan for the rest of the week they were planned for
+		return max(start_ordinal, self.today_ordinal - 6 if planning_period == "week" else self.today_ordinal)
+
+	def planned_activities(self, startDate, endDate, activityType=None, planningPeriod=None):
+		start_ordinal = as_date(startDate).toordinal()
+		end_ordinal = as_date(endDate).toordinal()
+		earliest_ordinal = max(start_ordinal, self.today_ordinal - 6)
+		if earliest_ordinal > end_ordinal:
+			return []
+
+		scheduled_activities = db.session.query(
+											ScheduledActivity.id,
+											ScheduledActivity.planning_period,
+											ScheduledActivity.recurrence,
+											ScheduledActivity.scheduled_date,
+											ScheduledActivity.activity_type,
+											ScheduledActivity.activity_subtype,
+											ScheduledActivity.scheduled_day,
+											ScheduledActivity.description,
+											ScheduledActivity.planned_distance,
+											ExerciseCategory.category_key
+				).outerjoin(ExerciseCategory, and_(ScheduledActivity.activity_type==ExerciseCategory.category_name, ExerciseCategory.user_id==ScheduledActivity.user_id)
+				).filter(ScheduledActivity.owner == self.user
+				).filter(ScheduledActivity.is_removed == False
+				).filter(or_(ScheduledActivity.planning_period == planningPeriod, planningPeriod == None)
+				).filter(or_(ScheduledActivity.activity_type == activityType, activityType == None)
+				).order_by(ScheduledActivity.id).all()
+		if len(scheduled_activities) == 0:
+			return []
+
+		skipped_dates = set([(row.scheduled_activity_id, row.skipped_date.toordinal()) for row in db.session.query(
+											ScheduledActivitySkippedDate.scheduled_activity_id,
+											ScheduledActivitySkippedDate.skipped_date
+				).join(ScheduledActivity, ScheduledActivity.id == ScheduledActivitySkippedDate.scheduled_activity_id
+				).filter(ScheduledActivity.owner == self.user
+				).filter(ScheduledActivitySkippedDate.skipped_date >= date.fromordinal(earliest_ordinal)
+				).filter(ScheduledActivitySkippedDate.skipped_date <= date.fromordinal(end_ordinal)).all()])
+
+		# There's no upper bound as a weekly plan is done by anything from the start of its week onwards (see is_activity_completed)
+		completions = completion_ordinals(db.session.query(
+											Activity.scheduled_activity_id,
+											Activity.activity_date
+				).join(ScheduledActivity, ScheduledActivity.id == Activity.scheduled_activity_id
+				).filter(ScheduledActivity.owner == self.user
+				).filter(Activity.activity_date >= date.fromordinal(week_start_ordinal(earliest_ordinal))
+				).order_by(Activity.activity_date).all())
+
+		planned_activities = []
+		for scheduled_activity in scheduled_activities:
+			completed_ordinals = completions.get(scheduled_activity.id, NO_COMPLETIONS)
+			is_weekly = scheduled_activity.planning_period == "week"
+			for ordinal in occurrence_ordinals(scheduled_activity.scheduled_date, scheduled_activity.scheduled_day,
+											   self.first_ordinal(start_ordinal, scheduled_activity.planning_period), end_ordinal):
+				if (scheduled_activity.id, ordinal) in skipped_dates:
+					continue
+				if is_activity_completed(completed_ordinals, ordinal, is_weekly):
+					continue
+				planned_activities.append(PlannedActivityRow(
+					id=scheduled_activity.id,
+					planning_period=scheduled_activity.planning_period,
+					recurrence=scheduled_activity.recurrence,
+					planned_date=date.fromordinal(ordinal),
+					activity_type=scheduled_activity.activity_type,
+					activity_subtype=scheduled_activity.activity_subtype,
+					scheduled_day=scheduled_activity.scheduled_day,
+					description=scheduled_activity.description,
+					planned_distance=scheduled_activity.planned_distance,
+					category_key=scheduled_activity.category_key))
+
+		return planned_activities
+
+	def planned_exercises(self, startDate, endDate):
+		start_ordinal = as_date(startDate).toordinal()
+		end_ordinal = as_date(endDate).toordinal()
+		earliest_ordinal = max(start_ordinal, self.today_ordinal - 6)
+		if earliest_ordinal > end_ordinal:
+			return []
+
+		scheduled_exercises = db.session.query(
+											ScheduledExercise.id,
+											ScheduledExercise.exercise_type_id,
+											ExerciseType.name.label("exercise_name"),
+											ScheduledExercise.planning_period,
+											ScheduledExercise.recurrence,
+											ScheduledExercise.scheduled_date,
+											func.coalesce(ExerciseCategory.category_name, "Uncategorised").label("category_name"),
+											ScheduledExercise.scheduled_day,
+											ScheduledExercise.sets,
+											ExerciseType.measured_by,
+											ScheduledExercise.reps,
+											ScheduledExercise.seconds,
+											func.coalesce(ExerciseCategory.category_key, "uncategorised").label("category_key")
+				).join(ExerciseType, (ExerciseType.id == ScheduledExercise.exercise_type_id)
+				).outerjoin(ExerciseCategory, ExerciseCategory.id == ExerciseType.exercise_category_id
+				).filter(ExerciseType.owner == self.user
+				).filter(ScheduledExercise.is_removed == False
+				).filter(ScheduledExercise.sets != None
+				).order_by(ScheduledExercise.id).all()
+		if len(scheduled_exercises) == 0:
+			return []
+
+		skipped_dates = set([(row.scheduled_exercise_id, row.skipped_date.toordinal()) for row in db.session.query(
+											ScheduledExerciseSkippedDate.scheduled_exercise_id,
+											ScheduledExerciseSkippedDate.skipped_date
+				).join(ScheduledExercise, ScheduledExercise.id == ScheduledExerciseSkippedDate.scheduled_exercise_id
+				).join(ExerciseType, ExerciseType.id == ScheduledExercise.exercise_type_id
+				).filter(ExerciseType.owner == self.user
+				).filter(ScheduledExerciseSkippedDate.skipped_date >= date.fromordinal(earliest_ordinal)
+				).filter(ScheduledExerciseSkippedDate.skipped_date <= date.fromordinal(end_ordinal)).all()])
+
+		completions = completion_ordinals(db.session.query(
+											Exercise.scheduled_exercise_id,
+											Exercise.exercise_date
+				).join(ScheduledExercise, ScheduledExercise.id == Exercise.scheduled_exercise_id
+				).join(ExerciseType, ExerciseType.id == ScheduledExercise.exercise_type_id
+				).filter(ExerciseType.owner == self.user
+				).filter(Exercise.exercise_date >= date.fromordinal(earliest_ordinal)
+				).filter(Exercise.exercise_date <= date.fromordinal(end_ordinal + 6)
+				).order_by(Exercise.exercise_date).all())
+
+		planned_exercises = []
+		for scheduled_exercise in scheduled_exercises:
+			completed_ordinals = completions.get(scheduled_exercise.id, NO_COMPLETIONS)
+			for ordinal in occurrence_ordinals(scheduled_exercise.scheduled_date, scheduled_exercise.scheduled_day,
+											   self.first_ordinal(start_ordinal, scheduled_exercise.planning_period), end_ordinal):
+				if (scheduled_exercise.id, ordinal) in skipped_dates:
+					continue
+				completed_sets = completed_set_count(completed_ordinals, ordinal)
+				if scheduled_exercise.sets - completed_sets <= 0:
+					continue
+				planned_exercises.append(PlannedExerciseRow(
+					id=scheduled_exercise.id,
+					exercise_type_id=scheduled_exercise.exercise_type_id,
+					exercise_name=scheduled_exercise.exercise_name,
+					planning_period=scheduled_exercise.planning_period,
+					recurrence=scheduled_exercise.recurrence,
+					planned_date=date.fromordinal(ordinal),
+					category_name=scheduled_exercise.category_name,
+					scheduled_day=scheduled_exercise.scheduled_day,
+					sets=scheduled_exercise.sets,
+					measured_by=scheduled_exercise.measured_by,
+					reps=scheduled_exercise.reps,
+					seconds=scheduled_exercise.seconds,
+					category_key=scheduled_exercise.category_key,
+					completed_sets=completed_sets))
+
+		return planned_exercises
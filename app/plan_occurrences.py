@@ -0,0 +1,158 @@
+from datetime import date, timedelta
+from sqlalchemy import and_, or_, null
+from sqlalchemy.orm import attributes
+
+from app import app, db, change_tracking
+from app.change_tracking import has_changes
+from app.models import User, ScheduledActivity, ScheduledActivitySkippedDate, ScheduledExercise, ScheduledExerciseSkippedDate, ExerciseType, CalendarDay, PlanOccurrence
+from app.bulk_utils import user_id_ranges
+from app.rollups import lock_users
+
+# Recurring plans are expanded into PlanOccurrence rows when they're saved, rather than every time the plan is read. Each
+# user's occurrences run up to their plan_occurrences_until, which extend_all_occurrences moves on every night. Anything
+# further ahead than that is expanded on the fly by app.plan_expander. Like the weekly rollup, refreshing and extending
+# hold the lock on the users' rows so that a plan saved while the nightly extend is running isn't expanded twice.
+OCCURRENCE_COLUMNS = ["user_id", "scheduled_activity_id", "scheduled_exercise_id", "planned_date", "week_start_date"]
+SCHEDULED_ACTIVITY_OCCURRENCE_ATTRIBUTES = ["user_id", "scheduled_date", "scheduled_day", "is_removed"]
+SCHEDULED_EXERCISE_OCCURRENCE_ATTRIBUTES = ["exercise_type_id", "scheduled_date", "scheduled_day", "is_removed"]
+
+def first_occurrence_date():
+	# Weekly plans stay in the plan until the end of the week, so keep the last six days
+	return date.today() - timedelta(days=6)
+
+
+def horizon_date():
+	return date.today() + timedelta(weeks=app.config.get("PLAN_OCCURRENCE_HORIZON_WEEKS", 26))
+
+
+def new_changes():
+	return dict(scheduled_activity_ids=set(), scheduled_exercise_ids=set())
+
+
+def collect_instance_changes(changes, instance, is_update):
+	if isinstance(instance, ScheduledActivity) and (not is_update or has_changes(instance, SCHEDULED_ACTIVITY_OCCURRENCE_ATTRIBUTES)):
+		changes["scheduled_activity_ids"].add(instance.id)
+	elif isinstance(instance, ScheduledActivitySkippedDate):
+		changes["scheduled_activity_ids"].update([instance.scheduled_activity_id] + attributes.get_history(instance, "scheduled_activity_id").deleted)
+	elif isinstance(instance, ScheduledExercise) and (not is_update or has_changes(instance, SCHEDULED_EXERCISE_OCCURRENCE_ATTRIBUTES)):
+		changes["scheduled_exercise_ids"].add(instance.id)
+	elif isinstance(instance, ScheduledExerciseSkippedDate):
+		changes["scheduled_exercise_ids"].update([instance.scheduled_exercise_id] + attributes.get_history(instance, "scheduled_exercise_id").deleted)
+
+
+def refresh_changed_occurrences(session, changes):
+	scheduled_activity_ids = [scheduled_activity_id for scheduled_activity_id in changes["scheduled_activity_ids"] if scheduled_activity_id is not None]
+	scheduled_exercise_ids = [scheduled_exercise_id for scheduled_exercise_id in changes["scheduled_exercise_ids"] if scheduled_exercise_id is not None]
+	if len(scheduled_activity_ids) > 0 or len(scheduled_exercise_ids) > 0:
+		refresh_occurrences(session,
+							ScheduledActivity.id.in_(scheduled_activity_ids) if len(scheduled_activity_ids) > 0 else None,
+							ScheduledExercise.id.in_(scheduled_exercise_ids) if len(scheduled_exercise_ids) > 0 else None)
+
+
+change_tracking.register("plan_occurrences", 20, new_changes, collect_instance_changes, refresh_changed_occurrences)
+
+
+def activity_occurrences(date_filter):
+	return db.session.query(
+					ScheduledActivity.user_id,
+					ScheduledActivity.id,
+					null(),
+					CalendarDay.calendar_date,
+					CalendarDay.calendar_week_start_date
+			).join(User, User.id == ScheduledActivity.user_id
+			).join(CalendarDay, or_(ScheduledActivity.scheduled_date==CalendarDay.calendar_date, ScheduledActivity.scheduled_day==CalendarDay.day_of_week)
+			).outerjoin(ScheduledActivitySkippedDate, and_(ScheduledActivity.id==ScheduledActivitySkippedDate.scheduled_activity_id, CalendarDay.calendar_date==ScheduledActivitySkippedDate.skipped_date)
+			).filter(ScheduledActivity.is_removed == False
+			).filter(ScheduledActivitySkippedDate.id == None
+			).filter(date_filter)
+
+
+def exercise_occurrences(date_filter):
+	return db.session.query(
+					ExerciseType.user_id,
+					null(),
+					ScheduledExercise.id,
+					CalendarDay.calendar_date,
+					CalendarDay.calendar_week_start_date
+			).join(ExerciseType, ExerciseType.id == ScheduledExercise.exercise_type_id
+			).join(User, User.id == ExerciseType.user_id
+			).join(CalendarDay, or_(ScheduledExercise.scheduled_date==CalendarDay.calendar_date, ScheduledExercise.scheduled_day == CalendarDay.day_of_week)
+			).outerjoin(ScheduledExerciseSkippedDate, and_(ScheduledExercise.id==ScheduledExerciseSkippedDate.scheduled_exercise_id, CalendarDay.calendar_date==ScheduledExerciseSkippedDate.skipped_date)
+			).filter(ScheduledExercise.is_removed == False
+			).filter(ScheduledExerciseSkippedDate.id == None
+			).filter(date_filter)
+
+
+def scheduled_activity_ids(scheduled_activity_filter):
+	return db.session.query(ScheduledActivity.id).filter(scheduled_activity_filter).statement
+
+
+def scheduled_exercise_ids(scheduled_exercise_filter):
+	return db.session.query(ScheduledExercise.id).join(ExerciseType, ExerciseType.id == ScheduledExercise.exercise_type_id).filter(scheduled_exercise_filter).statement
+
+
+def refresh_occurrences(session, scheduled_activity_filter, scheduled_exercise_filter):
+	# Either filter can be None to leave that side of the plan alone
+	user_table = User.__table__
+	occurrence_table = PlanOccurrence.__table__
+
+	# Locked before plan_occurrences_until is read, so it's the one that goes with the occurrences that are deleted
+	user_filters = []
+	if scheduled_activity_filter is not None:
+		user_filters.append(User.id.in_(session.query(ScheduledActivity.user_id).filter(scheduled_activity_filter)))
+	if scheduled_exercise_filter is not None:
+		user_filters.append(User.id.in_(session.query(ExerciseType.user_id).join(ScheduledExercise, ScheduledExercise.exercise_type_id == ExerciseType.id).filter(scheduled_exercise_filter)))
+	lock_users(session, or_(*user_filters))
+
+	# The first time a user plans anything the rest of their plan (if any) gets generated along with it
+	new_user_ids = set()
+	if scheduled_activity_filter is not None:
+		new_user_ids.update([row.user_id for row in session.query(ScheduledActivity.user_id).join(User, User.id == ScheduledActivity.user_id
+			).filter(scheduled_activity_filter).filter(User.plan_occurrences_until == None).distinct().all()])
+	if scheduled_exercise_filter is not None:
+		new_user_ids.update([row.user_id for row in session.query(ExerciseType.user_id).join(ScheduledExercise, ScheduledExercise.exercise_type_id == ExerciseType.id
+			).join(User, User.id == ExerciseType.user_id).filter(scheduled_exercise_filter).filter(User.plan_occurrences_until == None).distinct().all()])
+
+	if len(new_user_ids) > 0:
+		session.execute(user_table.update().values(plan_occurrences_until=horizon_date()).where(user_table.c.id.in_(new_user_ids)))
+		scheduled_activity_filter = ScheduledActivity.user_id.in_(new_user_ids) if scheduled_activity_filter is None else or_(scheduled_activity_filter, ScheduledActivity.user_id.in_(new_user_ids))
+		scheduled_exercise_filter = ExerciseType.user_id.in_(new_user_ids) if scheduled_exercise_filter is None else or_(scheduled_exercise_filter, ExerciseType.user_id.in_(new_user_ids))
+
+	date_filter = and_(CalendarDay.calendar_date >= first_occurrence_date(), CalendarDay.calendar_date <= User.plan_occurrences_until)
+	if scheduled_activity_filter is not None:
+		session.execute(occurrence_table.delete().where(occurrence_table.c.scheduled_activity_id.in_(scheduled_activity_ids(scheduled_activity_filter))))
+		session.execute(occurrence_table.insert().from_select(OCCURRENCE_COLUMNS, activity_occurrences(date_filter).filter(scheduled_activity_filter).statement))
+	if scheduled_exercise_filter is not None:
+		session.execute(occurrence_table.delete().where(occurrence_table.c.scheduled_exercise_id.in_(scheduled_exercise_ids(scheduled_exercise_filter))))
+		session.execute(occurrence_table.insert().from_select(OCCURRENCE_COLUMNS, exercise_occurrences(date_filter).filter(scheduled_exercise_filter).statement))
+
+
+def extend_occurrences(session, until, user_filter):
+	# Adds the occurrences after each user's plan_occurrences_until up to until, for users that have had any generated
+	user_table = User.__table__
+	occurrence_table = PlanOccurrence.__table__
+	user_filter = and_(user_filter, User.plan_occurrences_until < until)
+	date_filter = and_(CalendarDay.calendar_date > User.plan_occurrences_until, CalendarDay.calendar_date >= first_occurrence_date(), CalendarDay.calendar_date <= until)
+
+	lock_users(session, user_filter)
+	session.execute(occurrence_table.insert().from_select(OCCURRENCE_COLUMNS, activity_occurrences(date_filter).filter(user_filter).statement))
+	session.execute(occurrence_table.insert().from_select(OCCURRENCE_COLUMNS, exercise_occurrences(date_filter).filter(user_filter).statement))
+	return session.execute(user_table.update().values(plan_occurrences_until=until).where(user_filter)).rowcount
+
+
+def is_generated_until(user, until):
+	return user.plan_occurrences_until is not None and user.plan_occurrences_until >= until
+
+
+def extend_all_occurrences(chunk_size=1000):
+	until = horizon_date()
+	extended_user_count = 0
+	for first_user_id, last_user_id in user_id_ranges(chunk_size):
+		extended_user_count += extend_occurrences(db.session, until, User.id.between(first_user_id, last_user_id))
+		db.session.commit()
+
+	# Occurrences that have dropped out of the plan aren't needed any more
+	occurrence_table = PlanOccurrence.__table__
+	removed_count = db.session.execute(occurrence_table.delete().where(occurrence_table.c.planned_date < first_occurrence_date())).rowcount
+	db.session.commit()
+	return extended_user_count, removed_count
@@ -1,3 +1,4 @@
+from flask import request, Response, stream_with_context
 from flask_restful import Resource, reqparse
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from datetime import datetime, timedelta, date
@@ -6,14 +7,21 @@ from itertools import cycle
 import logging
 import json
 
-from app import db, utils, analysis
+from app import app, db, utils, analysis, strava_webhooks, plan_occurrences, plan_expander, response_cache, chart_cache, chart_data
 from app.models import  User, ExerciseCategory, ExerciseType, TrainingPlanTemplate
-from app.models import ScheduledActivity, ScheduledActivitySkippedDate, ScheduledRace, ScheduledExercise, ScheduledExerciseSkippedDate, Activity, Exercise, CalendarDay
+from app.models import ScheduledActivity, ScheduledActivitySkippedDate, ScheduledRace, ScheduledExercise, ScheduledExerciseSkippedDate, Activity, Exercise, CalendarDay, StreamParseJob
 from app.ga import track_event
-from app.strava_utils import import_strava_activity
+from app.strava_utils import import_strava_activity, save_strava_tokens
 from app.training_plan_utils import get_training_plan_generator_inputs, copy_training_plan_template, refresh_plan_for_today
 
 class Monitoring(Resource):
+    def get(self):
+        # Hit rates of the response and chart caches since this process started
+        return {
+            "response_cache": response_cache.cache_stats(),
+            "chart_cache": chart_cache.cache_stats()
+        }
+
     def post(self):
         parser = reqparse.RequestParser()
         parser.add_argument("type", help="Type of message to be logged, e.g. error")
@@ -29,53 +37,61 @@ class Monitoring(Resource):
 
 class AnnualStats(Resource):
     @jwt_required
+    @response_cache.data_version_etag
     def get(self):
         user_id = get_jwt_identity()
         current_user = User.query.get(int(user_id))
 
-        counters = []
-        for activity_type_stat in current_user.current_year_activity_stats().all():
-            counters.append({
-                "category_name": activity_type_stat.activity_type,
-                "category_key": activity_type_stat.category_key,
-                "value": str(utils.format_distance_for_uom_preference(m=activity_type_stat.total_distance, user=current_user, decimal_places=0, show_uom_suffix=False)),
-                "uom": current_user.distance_uom_preference if current_user.distance_uom_preference else "km"
-            })
-        
-        for exercise_category_stat in current_user.current_year_exercise_stats().all():
-            counters.append({
-                "category_name": exercise_category_stat.category_name,
-                "category_key": exercise_category_stat.category_key,
-                "value": str(exercise_category_stat.total_sets),
-                "uom": "sets"
-            })
+        return response_cache.cached_response(current_user, "annual_stats", {}, lambda: annual_stats_json(current_user))
 
-        return {
-            "heading": "Your {current_year} Stats".format(current_year=str(datetime.today().year)),
-            "counters": counters
-        }
+def annual_stats_json(user):
+    counters = []
+    for activity_type_stat in user.current_year_activity_stats().all():
+        counters.append({
+            "category_name": activity_type_stat.activity_type,
+            "category_key": activity_type_stat.category_key,
+            "value": str(utils.format_distance_for_uom_preference(m=activity_type_stat.total_distance, user=user, decimal_places=0, show_uom_suffix=False)),
+            "uom": user.distance_uom_preference if user.distance_uom_preference else "km"
+        })
+
+    for exercise_category_stat in user.current_year_exercise_stats().all():
+        counters.append({
+            "category_name": exercise_category_stat.category_name,
+            "category_key": exercise_category_stat.category_key,
+            "value": str(exercise_category_stat.total_sets),
+            "uom": "sets"
+        })
+
+    return {
+        "heading": "Your {current_year} Stats".format(current_year=str(datetime.today().year)),
+        "counters": counters
+    }
 
 class ActivityTypes(Resource):
     @jwt_required
+    @response_cache.data_version_etag
     def get(self):
         user_id = get_jwt_identity()
         current_user = User.query.get(int(user_id))
 
-        activity_types = []
-        for activity_type in current_user.exercise_categories.filter(ExerciseCategory.category_name.in_(["Run", "Ride", "Swim"])).all():
-            activity_types.append({
-                "activity_type": activity_type.category_name,
-                "category_key": activity_type.category_key
-            })
+        return response_cache.cached_response(current_user, "activity_types", {}, lambda: activity_types_json(current_user))
 
-        exercise_types = exercise_types_json(current_user)
-        exercise_categories = exercise_categories_json(current_user)
+def activity_types_json(user):
+    activity_types = []
+    for activity_type in user.exercise_categories.filter(ExerciseCategory.category_name.in_(["Run", "Ride", "Swim"])).all():
+        activity_types.append({
+            "activity_type": activity_type.category_name,
+            "category_key": activity_type.category_key
+        })
 
-        return {
-            "activity_types": activity_types,
-            "exercise_types": exercise_types,
-            "exercise_categories": exercise_categories
-        }
+    exercise_types = exercise_types_json(user)
+    exercise_categories = exercise_categories_json(user)
+
+    return {
+        "activity_types": activity_types,
+        "exercise_types": exercise_types,
+        "exercise_categories": exercise_categories
+    }
 
 def exercise_types_json(user):
     exercise_types = []
@@ -114,6 +130,7 @@ def training_plan_template_json(template):
 
 class TrainingPlanTemplates(Resource):
     # Needn't be authenticated for this one
+    @response_cache.content_etag
     def get(self):
         templates = [training_plan_template_json(template) for template in TrainingPlanTemplate.query.all()]
 
@@ -199,6 +216,7 @@ def activity_summary_json(weekly_activity_record, user):
 class CompletedActivities(Resource):
 
     @jwt_required
+    @response_cache.data_version_etag
     def get(self):
         user_id = get_jwt_identity()
         current_user = User.query.get(int(user_id))
@@ -210,6 +228,7 @@ class CompletedActivities(Resource):
         parser.add_argument("pageNo", help="Page number for when paging through recent activities in descending order")
         parser.add_argument("pageSize", help="Number of activities to return for the repquested page")
         parser.add_argument("combineExercises", help="When true, exercises will be unioned into the results with activities")
+        parser.add_argument("stream", help="When true, results for a date range are streamed back rather than built up in one go, for long ranges")
         args = parser.parse_args()
 
         if args["startDate"]:
@@ -218,19 +237,27 @@ class CompletedActivities(Resource):
         
         if args["resultType"] and args["resultType"] == "summary":
             # Currently only supports weekly aggregation but can change in due course
-            activity_summary = [activity_summary_json(activity_for_week, current_user) for activity_for_week in current_user.activity_summary_by_week(start_date=start_date, end_date=end_date).all()]
-            result = {
-                "activity_summary": activity_summary
-            }
+            result = response_cache.cached_response(current_user, "activity_summary", dict(startDate=args["startDate"], endDate=args["endDate"]),
+                lambda: {"activity_summary": [activity_summary_json(activity_for_week, current_user) for activity_for_week in current_user.activity_summary_by_week(start_date=start_date, end_date=end_date).all()]})
         elif args["startDate"]: # 
             start_date = datetime.strptime(args["startDate"], "%Y-%m-%d")
             end_date = datetime.strptime(args["endDate"], "%Y-%m-%d") if args["endDate"] else start_date
 
-            completed_activities = [completed_activity_json(activity, current_user) for activity in current_user.completed_activities_filtered(start_date, end_date).all()]
+            if args["stream"] == "true":
+                batch_size = app.config.get("STREAM_RESPONSE_BATCH_SIZE", 500)
+                completed_activities = current_user.completed_activities_filtered(start_date, end_date).yield_per(batch_size)
+                completed_exercises = current_user.completed_exercises_filtered(start_date, end_date).yield_per(batch_size)
+                return json_stream_response([
+                    ("completed_activities", (completed_activity_json(activity, current_user) for activity in completed_activities)),
+                    ("completed_exercises", completed_exercise_groups(current_user, completed_exercises, start_date, end_date))
+                ])
+
+            completed_activities = current_user.completed_activities_filtered(start_date, end_date).all()
+            completed_exercises = current_user.completed_exercises_filtered(start_date, end_date).all()
 
             result = {
-                "completed_activities": completed_activities,
-                "completed_exercises": completed_exercises_json(current_user, start_date, end_date)
+                "completed_activities": [completed_activity_json(activity, current_user) for activity in completed_activities],
+                "completed_exercises": list(completed_exercise_groups(current_user, completed_exercises, start_date, end_date))
             }
         elif args["pageNo"]:
             page_no = int(args["pageNo"])
@@ -261,8 +288,17 @@ class CompletedActivities(Resource):
 
         parser = reqparse.RequestParser()
         parser.add_argument("strava_access_token", help="Access token returned by Strava after the user has been through OAth2 authentication")
+        parser.add_argument("strava_refresh_token", help="Refresh token returned alongside the access token, used to apply webhook events")
+        parser.add_argument("strava_access_token_expires_at", type=int, help="Epoch time that the access token expires")
         data = parser.parse_args()
 
+        # Stream parsing and webhook events run with the stored tokens, so keep the access token even without a refresh token
+        if data["strava_access_token"]:
+            token_data = {"access_token": data["strava_access_token"], "expires_at": data["strava_access_token_expires_at"]}
+            if data["strava_refresh_token"]:
+                token_data["refresh_token"] = data["strava_refresh_token"]
+            save_strava_tokens(current_user, token_data)
+
         track_event(category="Strava", action="Starting import of Strava activity", userId = str(current_user.id))
         result = import_strava_activity(data["strava_access_token"], current_user)
 
@@ -307,9 +343,86 @@ class CompletedActivities(Resource):
         }, 200
 
 
+class StreamParseJobs(Resource):
+    @jwt_required
+    @response_cache.content_etag
+    def get(self):
+        user_id = get_jwt_identity()
+        current_user = User.query.get(int(user_id))
+
+        status_counts = dict(current_user.stream_parse_jobs.with_entities(StreamParseJob.status, func.count(StreamParseJob.id)).group_by(StreamParseJob.status).all())
+        outstanding_count = sum([status_counts.get(status, 0) for status in analysis.PENDING_STREAM_PARSE_STATUSES])
+        total_count = sum(status_counts.values())
+        latest_failure = current_user.stream_parse_jobs.filter(StreamParseJob.status == "Failed").order_by(StreamParseJob.next_attempt_datetime.desc()).first()
+
+        return {
+            "queued": status_counts.get("Queued", 0),
+            "running": status_counts.get("Running", 0),
+            "retrying": status_counts.get("Retrying", 0),
+            "completed": status_counts.get("Completed", 0),
+            "failed": status_counts.get("Failed", 0),
+            "outstanding": outstanding_count,
+            "percent_complete": round(((total_count - outstanding_count) / total_count) * 100) if total_count > 0 else 100,
+            "latest_error": latest_failure.last_error if latest_failure else None
+        }
+
+
+class ChartData(Resource):
+    @jwt_required
+    @response_cache.data_version_etag
+    def get(self, chart_name):
+        user_id = get_jwt_identity()
+        current_user = User.query.get(int(user_id))
+
+        if chart_name != "activity_analysis":
+            return {
+                "message": "unknown chart"
+            }, 404
+
+        parser = reqparse.RequestParser()
+        parser.add_argument("activityId", help="Activity that the activity analysis charts are for")
+        args = parser.parse_args()
+
+        activity = Activity.query.get(int(args["activityId"])) if args["activityId"] else None
+        if activity is None or activity.user_id != current_user.id:
+            return {
+                "message": "activity belongs to a different user"
+            }, 403
+        compute = lambda: chart_data.activity_analysis_chart_data(activity)
+
+        # Wrapped so that charts with nothing to draw are cached too
+        return response_cache.cached_response(current_user, "chart_data", dict(args, chart_name=chart_name), lambda: {"chart": compute()})
+
+
+class StravaWebhook(Resource):
+    # Strava checks the callback URL when the subscription is created by asking for the challenge to be echoed back
+    def get(self):
+        if request.args.get("hub.verify_token") != app.config.get("STRAVA_WEBHOOK_VERIFY_TOKEN"):
+            return "", 403
+
+        return {
+            "hub.challenge": request.args.get("hub.challenge")
+        }, 200
+
+    def post(self):
+        event = request.get_json(force=True, silent=True)
+
+        if not event or event.get("object_type") not in ["activity", "athlete"] or event.get("aspect_type") not in ["create", "update", "delete"]:
+            return "", 400
+
+        # Nothing is accepted until the subscription has been created. Events are checked with Strava before anything is
+        # deleted or revoked, as anyone can post here
+        if not app.config.get("STRAVA_WEBHOOK_SUBSCRIPTION_ID") or str(event.get("subscription_id")) != str(app.config["STRAVA_WEBHOOK_SUBSCRIPTION_ID"]):
+            return "", 403
+
+        strava_webhooks.record_event(event)
+        return "", 200
+
+
 class PlannedActivities(Resource):
 
     @jwt_required
+    @response_cache.data_version_etag
     def get(self):
         user_id = get_jwt_identity()
         current_user = User.query.get(int(user_id))
@@ -317,18 +430,22 @@ class PlannedActivities(Resource):
         parser = reqparse.RequestParser()
         parser.add_argument("startDate", help="Start date for the period that we're returning planned activities for", required=True)
         parser.add_argument("endDate", help="Optional end date for the period that we're returning planned activities for. If left blank it will be the same as the start date")
+        parser.add_argument("stream", help="When true, the plan is streamed back rather than built up in one go, for long ranges such as a whole training block")
         args = parser.parse_args()
         
         start_date = datetime.strptime(args["startDate"], "%Y-%m-%d")
         end_date = datetime.strptime(args["endDate"], "%Y-%m-%d") if args["endDate"] else start_date
 
-        planned_activities = [planned_activity_json(activity, current_user) for activity in current_user.planned_activities_filtered(start_date, end_date).all()]
+        if args["stream"] == "true":
+            planned_activities, planned_exercises = planned_rows(current_user, start_date, end_date, batch_size=app.config.get("STREAM_RESPONSE_BATCH_SIZE", 500))
+            return json_stream_response([
+                ("planned_activities", (planned_activity_json(activity, current_user) for activity in planned_activities)),
+                ("planned_exercises", planned_exercise_groups(current_user, planned_exercises, start_date, end_date)),
+                ("planned_races", planned_races_json(current_user, start_date))
+            ])
 
-        return {
-            "planned_activities": planned_activities,
-            "planned_exercises": planned_exercises_json(current_user, start_date, end_date),
-            "planned_races": planned_races_json(current_user, start_date)
-        }
+        return response_cache.cached_response(current_user, "planned_activities", dict(startDate=args["startDate"], endDate=args["endDate"]),
+                                              lambda: planned_activities_json(current_user, start_date, end_date))
 
     @jwt_required
     def post(self):
@@ -614,6 +731,26 @@ class PlannedActivities(Resource):
             "message": message
         }, 201
 
+def planned_rows(user, start_date, end_date, batch_size=None):
+    if plan_occurrences.is_generated_until(user, end_date.date()):
+        planned_activities = user.planned_activities_filtered(start_date, end_date)
+        planned_exercises = user.planned_exercises_filtered(start_date, end_date)
+        # With a batch size the rows are fetched as they're iterated, for streamed responses
+        if batch_size is not None:
+            return planned_activities.yield_per(batch_size), planned_exercises.yield_per(batch_size)
+        return planned_activities.all(), planned_exercises.all()
+
+    # Past the generated occurrences the plan is expanded on the fly rather than generating more for one request
+    expander = plan_expander.PlanExpander(user)
+    return expander.planned_activities(start_date, end_date), expander.planned_exercises(start_date, end_date)
+
+def planned_activities_json(user, start_date, end_date):
+    planned_activities, planned_exercises = planned_rows(user, start_date, end_date)
+    return {
+        "planned_activities": [planned_activity_json(activity, user) for activity in planned_activities],
+        "planned_exercises": list(planned_exercise_groups(user, planned_exercises, start_date, end_date)),
+        "planned_races": planned_races_json(user, start_date)
+    }
 
 class PlannedActivity(Resource):
     @jwt_required
@@ -852,36 +989,14 @@ def completed_exercise_json(completed_exercise):
         "category_key": completed_exercise.category_key
     }
 
-def completed_exercises_json(user, start_date, end_date):
-    completed_exercises = user.completed_exercises_filtered(start_date, end_date).all()
-    categories = user.exercise_categories.all()
-
-    # Make sure we still present any uncategorised exercises
-    temp_uncategorised = ExerciseCategory(category_name="Uncategorised",
-                                          category_key="uncategorised",
-                                          owner=user)
-    categories.append(temp_uncategorised)
-
-    completed_exercises_by_category = []
-
-    # Group up the planned exercises by category
-    for category in categories:
-        calendar_date = start_date
-        
-        while calendar_date <= end_date:
-            category_completed_exercises = [completed_exercise for completed_exercise in completed_exercises if completed_exercise.category_name==category.category_name and completed_exercise.exercise_date==calendar_date.date()]
-            if len(category_completed_exercises) > 0:
-                completed_exercises_category = {
-                    "exercise_date": calendar_date.strftime("%Y-%m-%d"),
-                    "category_name": category.category_name,
-                    "category_key": category.category_key,
-                    "exercises": [completed_exercise_json(completed_exercise) for completed_exercise in category_completed_exercises]
-                }
-                completed_exercises_by_category.append(completed_exercises_category)
-
-            calendar_date = calendar_date + timedelta(days=1)
-
-    return completed_exercises_by_category
+def completed_exercise_groups(user, completed_exercises, start_date, end_date):
+    for category, exercise_date, planning_period, category_completed_exercises in exercise_groups(user, completed_exercises, "exercise_date", [None], start_date, end_date):
+        yield {
+            "exercise_date": exercise_date.strftime("%Y-%m-%d"),
+            "category_name": category.category_name,
+            "category_key": category.category_key,
+            "exercises": [completed_exercise_json(completed_exercise) for completed_exercise in category_completed_exercises]
+        }
 
     
 class CompletedExercises(Resource):
@@ -1010,8 +1125,26 @@ def planned_exercise_json(planned_exercise):
         "category_key": planned_exercise.category_key
     }
 
-def planned_exercises_json(user, start_date, end_date):
-    planned_exercises = user.planned_exercises_filtered(start_date, end_date).all()
+def planned_exercise_groups(user, planned_exercises, start_date, end_date):
+    for category, planned_date, planning_period, category_planned_exercises in exercise_groups(user, planned_exercises, "planned_date", ["day", "week"], start_date, end_date):
+        yield {
+            "planned_date": planned_date.strftime("%Y-%m-%d"),
+            "planning_period": planning_period,
+            "category_name": category.category_name,
+            "category_key": category.category_key,
+            "exercises": [planned_exercise_json(planned_exercise) for planned_exercise in category_planned_exercises]
+        }
+
+
+def exercise_groups(user, exercises, date_attribute, planning_periods, start_date, end_date):
+    # Buckets the exercises by category, date and planning period in a single pass and then hands the buckets back in
+    # category, date and planning period order. Completed exercises don't have a planning period so they go under None.
+    grouped_exercises = {}
+    for exercise in exercises:
+        exercises_by_date = grouped_exercises.setdefault(exercise.category_name, {})
+        exercises_by_planning_period = exercises_by_date.setdefault(getattr(exercise, date_attribute), {})
+        exercises_by_planning_period.setdefault(getattr(exercise, "planning_period", None), []).append(exercise)
+
     categories = user.exercise_categories.all()
 
     # Make sure we still present any uncategorised exercises
@@ -1020,38 +1153,27 @@ def planned_exercises_json(user, start_date, end_date):
                                           owner=user)
     categories.append(temp_uncategorised)
 
-    planned_exercises_by_category = []
-
-    # Group up the planned exercises by category
     for category in categories:
-        calendar_date = start_date
-        
-        while calendar_date <= end_date:
-            category_planned_exercises_for_day = [planned_exercise for planned_exercise in planned_exercises if planned_exercise.category_name==category.category_name and planned_exercise.planned_date==calendar_date.date() and planned_exercise.planning_period=="day"]
-            if len(category_planned_exercises_for_day) > 0:
-                planned_exercises_category = {
-                    "planned_date": calendar_date.strftime("%Y-%m-%d"),
-                    "planning_period": "day",
-                    "category_name": category.category_name,
-                    "category_key": category.category_key,
-                    "exercises": [planned_exercise_json(planned_exercise) for planned_exercise in category_planned_exercises_for_day]
-                }
-                planned_exercises_by_category.append(planned_exercises_category)
-
-            category_planned_exercises_for_week = [planned_exercise for planned_exercise in planned_exercises if planned_exercise.category_name==category.category_name and planned_exercise.planned_date==calendar_date.date() and planned_exercise.planning_period=="week"]
-            if len(category_planned_exercises_for_week) > 0:
-                planned_exercises_category = {
-                    "planned_date": calendar_date.strftime("%Y-%m-%d"),
-                    "planning_period": "week",
-                    "category_name": category.category_name,
-                    "category_key": category.category_key,
-                    "exercises": [planned_exercise_json(planned_exercise) for planned_exercise in category_planned_exercises_for_week]
-                }
-                planned_exercises_by_category.append(planned_exercises_category)
-
-            calendar_date = calendar_date + timedelta(days=1)
-
-    return planned_exercises_by_category
+        exercises_by_date = grouped_exercises.get(category.category_name, {})
+        for exercise_date in sorted(exercises_by_date):
+            if start_date.date() <= exercise_date <= end_date.date():
+                for planning_period in planning_periods:
+                    if planning_period in exercises_by_date[exercise_date]:
+                        yield category, exercise_date, planning_period, exercises_by_date[exercise_date][planning_period]
+
+
+def json_stream_response(sections):
+    # Writes out a JSON object of lists one item at a time, so the encoded response is never held in full for long ranges
+    def generate():
+        yield "{"
+        for section_index, (key, items) in enumerate(sections):
+            yield "{separator}{key}: [".format(separator=", " if section_index > 0 else "", key=json.dumps(key))
+            for item_index, item in enumerate(items):
+                yield "{separator}{item}".format(separator=", " if item_index > 0 else "", item=json.dumps(item))
+            yield "]"
+        yield "}"
+
+    return Response(stream_with_context(generate()), mimetype="application/json")
         
 
 class PlannedExercises(Resource):
@@ -1278,6 +1400,7 @@ def pre_pb_long_runs_json(query_results, user):
 
 class TrainingPlanGenerator(Resource):
     @jwt_required
+    @response_cache.content_etag
     def get(self):
         user_id = get_jwt_identity()
         current_user = User.query.get(int(user_id))
@@ -0,0 +1,261 @@
+from collections import OrderedDict
+from datetime import date
+from functools import wraps
+from flask import request, Response
+from flask_jwt_extended import get_jwt_identity
+from flask_restful.utils import unpack
+from sqlalchemy import func
+from sqlalchemy.orm import attributes
+from werkzeug.http import quote_etag
+import hashlib
+import json
+import threading
+import time
+
+from app import app, db, change_tracking
+from app.models import User, Activity, Exercise, ExerciseType, ExerciseCategory, ScheduledActivity, ScheduledActivitySkippedDate, ScheduledExercise, ScheduledExerciseSkippedDate, ScheduledRace, TrainingGoal
+
+# Responses of the read-heavy API resources are cached per user. Every key includes the user's data_version, which is
+# bumped in the same transaction as any change to their activities, exercises, plans or goals, so a changed user simply
+# stops finding their old entries and those age out of the cache. Like rollups, anything that writes those rows with
+# Core statements rather than through the ORM has to call mark_users_changed itself.
+USER_ATTRIBUTE_MODELS = (Activity, ExerciseCategory, ExerciseType, ScheduledActivity, ScheduledRace, TrainingGoal)
+USER_PREFERENCE_ATTRIBUTES = ["distance_uom_preference", "elevation_uom_preference", "has_weekly_flexible_planning_enabled"]
+
+class LRUCacheBackend:
+	# In-process, so each worker process has its own
+	name = "lru"
+
+	def __init__(self, max_entries, ttl_seconds):
+		self.max_entries = max_entries
+		self.ttl_seconds = ttl_seconds
+		self.entries = OrderedDict()
+		self.lock = threading.Lock()
+
+	def get(self, key):
+		with self.lock:
+			entry = self.entries.get(key)
+			if entry is None:
+				return None
+			expires, value = entry
+			if expires < time.time():
+				del self.entries[key]
+				return None
+			self.entries.move_to_end(key)
+			return value
+
+	def set(self, key, value):
+		with self.lock:
+			self.entries[key] = (time.time() + self.ttl_seconds, value)
+			self.entries.move_to_end(key)
+			while len(self.entries) > self.max_entries:
+				self.entries.popitem(last=False)
+
+	def entry_count(self):
+		return len(self.entries)
+
+
+class RedisCacheBackend:
+	# Shared between processes. Size based eviction is left to Redis, e.g. maxmemory with maxmemory-policy allkeys-lru
+	name = "redis"
+
+	def __init__(self, url, ttl_seconds):
+		import redis
+		self.client = redis.StrictRedis.from_url(url)
+		self.ttl_seconds = ttl_seconds
+
+	def get(self, key):
+		value = self.client.get(key)
+		return json.loads(value.decode("utf-8")) if value is not None else None
+
+	def set(self, key, value):
+		self.client.setex(key, self.ttl_seconds, json.dumps(value))
+
+	def entry_count(self):
+		return None
+
+
+class ResponseCache:
+	def __init__(self, backend):
+		self.backend = backend
+		self.lock = threading.Lock()
+		self.hits = {}
+		self.misses = {}
+
+	def record(self, counts, resource):
+		with self.lock:
+			counts[resource] = counts.get(resource, 0) + 1
+
+	def get_or_compute(self, key, resource, compute):
+		response = self.backend.get(key) if self.backend is not None else None
+		if response is not None:
+			self.record(self.hits, resource)
+			return response
+
+		self.record(self.misses, resource)
+		response = compute()
+		if self.backend is not None:
+			self.backend.set(key, response)
+		return response
+
+	def stats(self):
+		with self.lock:
+			resources = sorted(set(self.hits.keys()).union(self.misses.keys()))
+			resource_stats = [dict(resource=resource,
+								   hits=self.hits.get(resource, 0),
+								   misses=self.misses.get(resource, 0),
+								   hit_rate=hit_rate(self.hits.get(resource, 0), self.misses.get(resource, 0))) for resource in resources]
+		total_hits = sum([resource_stat["hits"] for resource_stat in resource_stats])
+		total_misses = sum([resource_stat["misses"] for resource_stat in resource_stats])
+		return dict(backend=self.backend.name if self.backend is not None else None,
+					entries=self.backend.entry_count() if self.backend is not None else 0,
+					hits=total_hits,
+					misses=total_misses,
+					hit_rate=hit_rate(total_hits, total_misses),
+					resources=resource_stats)
+
+
+def hit_rate(hits, misses):
+	return round(hits / (hits + misses), 3) if hits + misses > 0 else None
+
+
+def configured_backend():
+	backend = app.config.get("RESPONSE_CACHE_BACKEND", "lru")
+	ttl_seconds = app.config.get("RESPONSE_CACHE_TTL_SECONDS", 300)
+	if backend == "redis":
+		return RedisCacheBackend(app.config["RESPONSE_CACHE_REDIS_URL"], ttl_seconds)
+	elif backend == "lru":
+		return LRUCacheBackend(app.config.get("RESPONSE_CACHE_MAX_ENTRIES", 10000), ttl_seconds)
+	return None
+
+
+response_cache = ResponseCache(configured_backend())
+
+def cache_key(user, resource, arguments):
+	# Today's date is part of the key as what's planned, this year's stats and so on all depend on it
+	return "response:{user_id}:{data_version}:{today}:{resource}:{arguments}".format(user_id=user.id,
+																					 data_version=user.data_version or 0,
+																					 today=date.today().isoformat(),
+																					 resource=resource,
+																					 arguments=json.dumps(arguments, sort_keys=True))
+
+
+def cached_response(user, resource, arguments, compute):
+	return response_cache.get_or_compute(cache_key(user, resource, arguments), resource, compute)
+
+
+def cache_stats():
+	return response_cache.stats()
+
+
+def new_changes():
+	return dict(user_ids=set(), exercise_type_ids=set(), scheduled_activity_ids=set(), scheduled_exercise_ids=set())
+
+
+def mark_users_changed(user_ids, session=None):
+	session = db.session() if session is None else session
+	change_tracking.pending_changes(session, "data_version")["user_ids"].update(user_ids)
+
+
+def current_and_previous(instance, attribute_name):
+	return [getattr(instance, attribute_name)] + attributes.get_history(instance, attribute_name).deleted
+
+
+def collect_instance_changes(changes, instance, is_update):
+	if isinstance(instance, USER_ATTRIBUTE_MODELS):
+		changes["user_ids"].update(current_and_previous(instance, "user_id"))
+	elif isinstance(instance, (Exercise, ScheduledExercise)):
+		changes["exercise_type_ids"].update(current_and_previous(instance, "exercise_type_id"))
+	elif isinstance(instance, ScheduledActivitySkippedDate):
+		changes["scheduled_activity_ids"].update(current_and_previous(instance, "scheduled_activity_id"))
+	elif isinstance(instance, ScheduledExerciseSkippedDate):
+		changes["scheduled_exercise_ids"].update(current_and_previous(instance, "scheduled_exercise_id"))
+	elif isinstance(instance, User) and is_update and change_tracking.has_changes(instance, USER_PREFERENCE_ATTRIBUTES):
+		changes["user_ids"].add(instance.id)
+
+
+def bump_changed_data_versions(session, changes):
+	user_ids = set(changes["user_ids"])
+	exercise_type_ids = [exercise_type_id for exercise_type_id in changes["exercise_type_ids"] if exercise_type_id is not None]
+	if len(exercise_type_ids) > 0:
+		user_ids.update([row.user_id for row in session.query(ExerciseType.user_id).filter(ExerciseType.id.in_(exercise_type_ids)).all()])
+	scheduled_activity_ids = [scheduled_activity_id for scheduled_activity_id in changes["scheduled_activity_ids"] if scheduled_activity_id is not None]
+	if len(scheduled_activity_ids) > 0:
+		user_ids.update([row.user_id for row in session.query(ScheduledActivity.user_id).filter(ScheduledActivity.id.in_(scheduled_activity_ids)).all()])
+	scheduled_exercise_ids = [scheduled_exercise_id for scheduled_exercise_id in changes["scheduled_exercise_ids"] if scheduled_exercise_id is not None]
+	if len(scheduled_exercise_ids) > 0:
+		user_ids.update([row.user_id for row in session.query(ExerciseType.user_id).join(ScheduledExercise, ScheduledExercise.exercise_type_id == ExerciseType.id
+			).filter(ScheduledExercise.id.in_(scheduled_exercise_ids)).all()])
+
+	user_ids = [user_id for user_id in user_ids if user_id is not None]
+	if len(user_ids) > 0:
+		bump_data_versions(session, User.id.in_(user_ids))
+
+
+# After the rollup and plan occurrences, which lock the users they refresh first
+change_tracking.register("data_version", 30, new_changes, collect_instance_changes, bump_changed_data_versions)
+
+
+def bump_data_versions(session, user_filter):
+	user_table = User.__table__
+	return session.execute(user_table.update().values(data_version=func.coalesce(user_table.c.data_version, 0) + 1).where(user_filter)).rowcount
+
+
+# Conditional GETs for the API resources. The ETag goes on the resource's get method underneath @jwt_required and
+# If-None-Match is answered with a 304 where it still matches
+def data_version_etag(get):
+	# For responses that only depend on the user's data and today's date, so an unchanged poll costs a single lookup of
+	# data_version rather than the full query and serialisation
+	@wraps(get)
+	def conditional_get(*args, **kwargs):
+		user_id = int(get_jwt_identity())
+		data_version = db.session.query(User.data_version).filter(User.id == user_id).scalar()
+		etag = hashed_etag("{user_id}:{data_version}:{today}:{path}".format(user_id=user_id,
+																			data_version=data_version or 0,
+																			today=date.today().isoformat(),
+																			path=request.full_path))
+		if request.if_none_match.contains(etag):
+			return not_modified(etag)
+		return with_etag(get(*args, **kwargs), etag)
+	return conditional_get
+
+
+def content_etag(get):
+	# For responses that aren't covered by data_version. The response is still put together in full, this only saves
+	# sending it again
+	@wraps(get)
+	def conditional_get(*args, **kwargs):
+		response = get(*args, **kwargs)
+		if isinstance(response, Response):
+			return response
+		data, code, headers = unpack(response)
+		if code != 200:
+			return response
+		etag = hashed_etag(json.dumps(data, sort_keys=True, default=str))
+		if request.if_none_match.contains(etag):
+			return not_modified(etag)
+		return with_etag(response, etag)
+	return conditional_get
+
+
+def hashed_etag(value):
+	return hashlib.sha1(value.encode("utf-8")).hexdigest()
+
+
+def etag_headers(etag):
+	# Responses differ by the token's user, and clients should check back rather than reuse them unasked
+	return {"ETag": quote_etag(etag), "Cache-Control": "private, no-cache", "Vary": "Authorization"}
+
+
+def not_modified(etag):
+	return Response(status=304, headers=etag_headers(etag))
+
+
+def with_etag(response, etag):
+	if isinstance(response, Response):
+		response.headers.extend(etag_headers(etag))
+		return response
+	data, code, headers = unpack(response)
+	if code != 200:
+		return response
+	return data, code, dict(headers, **etag_headers(etag))
@@ -0,0 +1,195 @@
+from datetime import timedelta
+from sqlalchemy import func, distinct, case, literal, null, tuple_
+from sqlalchemy.orm import attributes
+import logging
+
+from app import db, change_tracking
+from app.bulk_utils import user_id_ranges
+from app.change_tracking import has_changes
+from app.utils import week_start_date
+from app.models import User, Activity, Exercise, ExerciseType, UserWeeklyRollup
+
+# Changes are collected on the session as they're flushed and the affected weeks of UserWeeklyRollup are recalculated
+# from the raw rows just before the transaction commits, so the rollup is always consistent with what was committed.
+# Each refresh holds the lock on the users' rows until then, so two transactions can't refresh the same week at once.
+# Anything that writes activities or exercises with Core statements rather than through the ORM has to call one of the
+# mark_ functions itself.
+ROLLUP_COLUMNS = ["user_id", "week_start_date", "calendar_year", "source", "activity_type", "exercise_category_id",
+				  "activities_completed", "active_days", "total_distance", "total_moving_time", "total_elevation_gain",
+				  "total_reliable_elevation_gain", "longest_distance", "total_reps", "total_seconds"]
+ACTIVITY_ROLLUP_ATTRIBUTES = ["user_id", "start_datetime", "activity_type", "distance", "moving_time", "total_elevation_gain", "is_bad_elevation_data"]
+EXERCISE_ROLLUP_ATTRIBUTES = ["exercise_type_id", "exercise_datetime", "reps", "seconds"]
+
+def new_changes():
+	return dict(user_weeks=set(), exercise_type_weeks=set(), users=set())
+
+
+def mark_activities_changed(user_id, start_datetimes, session=None):
+	session = db.session() if session is None else session
+	change_tracking.pending_changes(session, "weekly_rollup")["user_weeks"].update([(user_id, week_start_date(start_datetime.date())) for start_datetime in start_datetimes if start_datetime is not None])
+
+
+def mark_users_changed(user_ids, session=None):
+	session = db.session() if session is None else session
+	change_tracking.pending_changes(session, "weekly_rollup")["users"].update(user_ids)
+
+
+def attribute_values(instance, attribute_names, include_previous):
+	# The current value of each attribute plus, for updates, what it was before
+	values = dict([(attribute_name, [getattr(instance, attribute_name)]) for attribute_name in attribute_names])
+	if include_previous:
+		for attribute_name in attribute_names:
+			values[attribute_name] += attributes.get_history(instance, attribute_name).deleted
+	return values
+
+
+def collect_instance_changes(changes, instance, is_update):
+	if isinstance(instance, Activity) and (not is_update or has_changes(instance, ACTIVITY_ROLLUP_ATTRIBUTES)):
+		values = attribute_values(instance, ["user_id", "start_datetime"], is_update)
+		changes["user_weeks"].update([(user_id, week_start_date(start_datetime.date())) for user_id in values["user_id"] for start_datetime in values["start_datetime"]
+									  if user_id is not None and start_datetime is not None])
+
+	elif isinstance(instance, Exercise) and (not is_update or has_changes(instance, EXERCISE_ROLLUP_ATTRIBUTES)):
+		values = attribute_values(instance, ["exercise_type_id", "exercise_datetime"], is_update)
+		changes["exercise_type_weeks"].update([(exercise_type_id, week_start_date(exercise_datetime.date())) for exercise_type_id in values["exercise_type_id"] for exercise_datetime in values["exercise_datetime"]
+											   if exercise_type_id is not None and exercise_datetime is not None])
+
+	# Moving an exercise type to another category affects every week it's been done in
+	elif isinstance(instance, ExerciseType) and is_update and has_changes(instance, ["exercise_category_id", "user_id"]):
+		changes["users"].update([user_id for user_id in attribute_values(instance, ["user_id"], True)["user_id"] if user_id is not None])
+
+
+def refresh_changed_rollups(session, changes):
+	user_weeks = set(changes["user_weeks"])
+	if len(changes["exercise_type_weeks"]) > 0:
+		exercise_type_users = dict(session.query(ExerciseType.id, ExerciseType.user_id).filter(ExerciseType.id.in_(set([exercise_type_id for exercise_type_id, week in changes["exercise_type_weeks"]]))).all())
+		user_weeks.update([(exercise_type_users[exercise_type_id], week) for exercise_type_id, week in changes["exercise_type_weeks"] if exercise_type_users.get(exercise_type_id) is not None])
+
+	# Weeks of users that are being refreshed in full are covered already
+	user_weeks = [(user_id, week) for user_id, week in user_weeks if user_id not in changes["users"]]
+
+	user_ids = set([user_id for user_id, week in user_weeks]).union(changes["users"])
+	if len(user_ids) > 0:
+		lock_users(session, User.id.in_(user_ids))
+	if len(user_weeks) > 0:
+		refresh_rollups(session, tuple_(UserWeeklyRollup.user_id, UserWeeklyRollup.week_start_date).in_(user_weeks),
+						lambda user_id, week: tuple_(user_id, week).in_(user_weeks))
+	if len(changes["users"]) > 0:
+		refresh_rollups(session, UserWeeklyRollup.user_id.in_(changes["users"]),
+						lambda user_id, week: user_id.in_(changes["users"]))
+
+
+change_tracking.register("weekly_rollup", 10, new_changes, collect_instance_changes, refresh_changed_rollups)
+
+
+def activity_rollups():
+	return db.session.query(
+					Activity.user_id,
+					Activity.week_start_date,
+					Activity.calendar_year,
+					literal("Activity"),
+					Activity.activity_type,
+					null(),
+					func.count(Activity.id),
+					func.count(distinct(Activity.activity_date)),
+					func.sum(Activity.distance),
+					func.sum(Activity.moving_time),
+					func.sum(Activity.total_elevation_gain),
+					func.sum(case([(Activity.is_bad_elevation_data == False, Activity.total_elevation_gain)])),
+					func.max(Activity.distance),
+					null(),
+					null()
+			).group_by(
+					Activity.user_id,
+					Activity.week_start_date,
+					Activity.calendar_year,
+					Activity.activity_type
+			)
+
+
+def exercise_rollups():
+	return db.session.query(
+					ExerciseType.user_id,
+					Exercise.week_start_date,
+					Exercise.calendar_year,
+					literal("Exercise"),
+					null(),
+					ExerciseType.exercise_category_id,
+					func.count(Exercise.id),
+					func.count(distinct(Exercise.exercise_date)),
+					null(),
+					null(),
+					null(),
+					null(),
+					null(),
+					func.sum(Exercise.reps),
+					func.sum(Exercise.seconds)
+			).join(ExerciseType.exercises
+			).group_by(
+					ExerciseType.user_id,
+					Exercise.week_start_date,
+					Exercise.calendar_year,
+					ExerciseType.exercise_category_id
+			)
+
+
+def lock_users(session, user_filter):
+	# Serialises refreshes of the same user's rows between transactions. Under READ COMMITTED each statement after the
+	# lock is granted sees whatever the transaction that held it committed, so nothing is deleted twice or inserted twice.
+	# Locked in id order so that transactions locking several users can't deadlock each other
+	session.query(User.id).filter(user_filter).order_by(User.id).with_for_update().all()
+
+
+def refresh_rollups(session, rollup_filter, source_filter):
+	# rollup_filter picks the UserWeeklyRollup rows to replace, source_filter(user_id, week) does the same for the raw
+	# rows. The users involved should be locked first with lock_users
+	rollup_table = UserWeeklyRollup.__table__
+	session.execute(rollup_table.delete().where(rollup_filter))
+	session.execute(rollup_table.insert().from_select(ROLLUP_COLUMNS, activity_rollups().filter(source_filter(Activity.user_id, Activity.week_start_date)).statement))
+	session.execute(rollup_table.insert().from_select(ROLLUP_COLUMNS, exercise_rollups().filter(source_filter(ExerciseType.user_id, Exercise.week_start_date)).statement))
+
+
+def rebuild_rollups(chunk_size=500):
+	for first_user_id, last_user_id in user_id_ranges(chunk_size):
+		lock_users(db.session, User.id.between(first_user_id, last_user_id))
+		refresh_rollups(db.session, UserWeeklyRollup.user_id.between(first_user_id, last_user_id),
+						lambda user_id, week: user_id.between(first_user_id, last_user_id))
+		db.session.commit()
+
+
+def rollup_key(row):
+	return tuple(row[:6])
+
+
+def rollup_values(row):
+	# Compare numbers as floats so that, for example, 10 and 10.0 from different sums match
+	return tuple([float(value) if value is not None and not isinstance(value, timedelta) else value for value in row[6:]])
+
+
+def check_rollups(chunk_size=500, fix=False):
+	# Compares the rollup with the totals worked out from scratch and returns the (user_id, week_start_date) of any that differ
+	rollup_columns = [getattr(UserWeeklyRollup, column) for column in ROLLUP_COLUMNS]
+	inconsistent_user_weeks = set()
+
+	for first_user_id, last_user_id in user_id_ranges(chunk_size):
+		expected = dict([(rollup_key(row), rollup_values(row)) for row in
+						 activity_rollups().filter(Activity.user_id.between(first_user_id, last_user_id)).all() +
+						 exercise_rollups().filter(ExerciseType.user_id.between(first_user_id, last_user_id)).all()])
+		# Every row is kept so that a key that's been rolled up twice shows up as well as one with the wrong totals
+		actual = {}
+		for row in db.session.query(*rollup_columns).filter(UserWeeklyRollup.user_id.between(first_user_id, last_user_id)).all():
+			actual.setdefault(rollup_key(row), []).append(rollup_values(row))
+
+		for key in set(expected.keys()).union(actual.keys()):
+			if ([expected[key]] if key in expected else []) != actual.get(key, []):
+				inconsistent_user_weeks.add((key[0], key[1]))
+
+	if len(inconsistent_user_weeks) > 0:
+		logging.warning("{count} user weeks in the weekly rollup don't match their activities and exercises".format(count=len(inconsistent_user_weeks)))
+		if fix:
+			lock_users(db.session, User.id.in_(set([user_id for user_id, week in inconsistent_user_weeks])))
+			refresh_rollups(db.session, tuple_(UserWeeklyRollup.user_id, UserWeeklyRollup.week_start_date).in_(inconsistent_user_weeks),
+							lambda user_id, week: tuple_(user_id, week).in_(inconsistent_user_weeks))
+			db.session.commit()
+
+	return sorted(inconsistent_user_weeks)
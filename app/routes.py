@@ -9,15 +9,14 @@ from flask import render_template, flash, redirect, url_for, request, session, R
 from flask_login import current_user, login_user, logout_user, login_required
 from werkzeug.urls import url_parse
 from wtforms import HiddenField, SubmitField
-import pandas as pd
 from bokeh.embed import components
 from bokeh.models import TapTool, CustomJS, Arrow, NormalHead, VeeHead
-from app import app, db, utils, analysis, training_plan_utils
+from app import app, db, utils, analysis, training_plan_utils, strava_utils, chart_cache, chart_data
 from app.auth.forms import RegisterForm
 from app.auth.common import configured_google_client
 from app.forms import LogNewExerciseTypeForm, EditExerciseForm, AddNewExerciseTypeForm, EditScheduledExerciseForm, ScheduledActivityForm, EditExerciseTypeForm, ExerciseCategoriesForm
 from app.forms import ActivitiesCompletedGoalForm, TotalDistanceGoalForm, TotalMovingTimeGoalForm, TotalElevationGainGoalForm, CadenceGoalForm, GradientGoalForm, ExerciseSetsGoalForm
-from app.models import User, ExerciseType, Exercise, ScheduledExercise, ExerciseCategory, Activity, ScheduledActivity, ActivityCadenceAggregate, ActivityPaceAggregate, CalendarDay, TrainingGoal, ExerciseForToday, ActivityForToday, TrainingPlanTemplate
+from app.models import User, ExerciseType, Exercise, ScheduledExercise, ExerciseCategory, Activity, ScheduledActivity, ActivityCadenceAggregate, CalendarDay, TrainingGoal, ExerciseForToday, ActivityForToday, TrainingPlanTemplate
 from app.app_classes import TempCadenceAggregate, PlotComponentContainer
 from app.dataviz import generate_stacked_bar_for_categories, generate_bar, generate_line_chart, generate_line_chart_for_categories
 from stravalib.client import Client
@@ -77,7 +76,7 @@ def goal_callback_function_js(modal_id, dimension_input_id, target_input_id):
 	return goal_callback
 
 
-def handle_goal_form_post(form, current_week, goal_type, goal_metric, goal_metric_units, metric_multiplier, calculate_weekly_aggregations_function=None):
+def handle_goal_form_post(form, current_week, goal_type, goal_metric, goal_metric_units, metric_multiplier):
 	if form.goal_relative_week.data == "this":
 		goal_start_date = current_week.calendar_week_start_date
 	elif form.goal_relative_week.data == "next":
@@ -115,7 +114,7 @@ def handle_goal_form_post(form, current_week, goal_type, goal_metric, goal_metri
 	db.session.commit()
 
 	# Evaluate the goals in case there's already progress made
-	analysis.evaluate_running_goals(week=goal_start_date, goal_metric=goal_metric, calculate_weekly_aggregations_function=calculate_weekly_aggregations_function)
+	analysis.evaluate_running_goals(week=goal_start_date, goal_metrics=[goal_metric])
 
 
 # Routes
@@ -388,8 +387,7 @@ def weekly_activity(year, week=None):
 
 	# Create a new runs/activities completed goal
 	if activities_completed_goal_form.validate_on_submit():
-		handle_goal_form_post(form=activities_completed_goal_form, current_week=week_options[0], goal_type="runs completed", goal_metric="Runs Completed Over Distance", goal_metric_units="runs", metric_multiplier = 1,
-							calculate_weekly_aggregations_function=None)
+		handle_goal_form_post(form=activities_completed_goal_form, current_week=week_options[0], goal_type="runs completed", goal_metric="Runs Completed Over Distance", goal_metric_units="runs", metric_multiplier = 1)
 
 	# Create a new distance goal
 	if total_distance_goal_form.validate_on_submit():
@@ -407,13 +405,11 @@ def weekly_activity(year, week=None):
 
 	# Create a new cadence goal or update an existing one if it's a post
 	if cadence_goal_form.validate_on_submit():
-		handle_goal_form_post(form=cadence_goal_form, current_week=week_options[0], goal_type="cadence", goal_metric="Time Spent Above Cadence", goal_metric_units="seconds", metric_multiplier = 60,
-							calculate_weekly_aggregations_function=analysis.calculate_weekly_cadence_aggregations)
+		handle_goal_form_post(form=cadence_goal_form, current_week=week_options[0], goal_type="cadence", goal_metric="Time Spent Above Cadence", goal_metric_units="seconds", metric_multiplier = 60)
 
 	# Create a new cadence goal or update an existing one if it's a post
 	if gradient_goal_form.validate_on_submit():
-		handle_goal_form_post(form=gradient_goal_form, current_week=week_options[0], goal_type="gradient", goal_metric="Distance Climbing Above Gradient", goal_metric_units="metres", metric_multiplier = 1000,
-							calculate_weekly_aggregations_function=analysis.calculate_weekly_gradient_aggregations)
+		handle_goal_form_post(form=gradient_goal_form, current_week=week_options[0], goal_type="gradient", goal_metric="Distance Climbing Above Gradient", goal_metric_units="metres", metric_multiplier = 1000)
 
 	# Create a new exercise sets goal for or update an existing one if it's a post
 	if exercise_sets_goal_form.validate_on_submit():
@@ -449,53 +445,9 @@ def weekly_activity(year, week=None):
 		db.session.commit()
 
 	# Now start getting the data that we need for a get (as well as after a post)
-	days = CalendarDay.query.filter_by(calendar_week_start_date=current_week).order_by(CalendarDay.calendar_date.desc()).all()
-
-	all_exercises = current_user.exercises().all()
-	all_activities = current_user.activities.all()
+	current_week_dataset, current_week_activity_count = analysis.weekly_activity_dataset(current_week)
 	categories = current_user.exercise_categories.all()
 
-	current_week_dataset = []
-	current_week_activity_count = 0 # for plotting the current week indicator at the right height on the graph
-
-	for day in days:
-		exercises_by_category = []
-		# Create dictionaries of exercises for each category
-		for category in categories:
-			category_exercises = [exercise for exercise in all_exercises if exercise.exercise_date==day.calendar_date and exercise.type.exercise_category==category]
-			if len(category_exercises) > 0:
-				category_detail = dict(category=category,
-						  			   exercise_count=len(category_exercises),
-									   exercises=category_exercises)
-				exercises_by_category.append(category_detail)
-				current_week_activity_count += 1
-		# Create similar dictionary for uncategorised
-		uncategorised_exercises = [exercise for exercise in all_exercises if exercise.exercise_date==day.calendar_date and exercise.type.exercise_category is None]
-		if len(uncategorised_exercises) > 0:
-			category_detail = dict(category=None,
-					  			   exercise_count=len(uncategorised_exercises),
-								   exercises=uncategorised_exercises)
-			exercises_by_category.append(category_detail)
-			current_week_activity_count += 1
-		# Grab the activities without worrying about categories
-		day_activities = [activity for activity in all_activities if activity.activity_date==day.calendar_date]
-		current_week_activity_count += len(day_activities)
-
-		if day.calendar_date > date.today():
-			scheduled_activities = current_user.scheduled_activities_filtered(day.day_of_week).all()
-			scheduled_exercise_categories = current_user.scheduled_exercise_categories(day.day_of_week).all()
-		else:
-			scheduled_activities = []
-			scheduled_exercise_categories = []
-
-		# Construct a dictionary for the day as a whole
-		day_detail = dict(day=day,
-						  exercises_by_category=exercises_by_category,
-						  activities=day_activities,
-						  scheduled_activities=scheduled_activities,
-						  scheduled_exercise_categories=scheduled_exercise_categories)
-		current_week_dataset.append(day_detail)
-
 	# Evaluate the exercise sets goals at this point
 	analysis.evaluate_exercise_set_goals(current_week)
 
@@ -512,18 +464,20 @@ def weekly_activity(year, week=None):
 	# Data for the summary stats
 	summary_stats = current_user.weekly_activity_type_stats(week=current_week).all()
 	
-	# Data and plotting for weekly cadence analysis graph
-	weekly_cadence_goals = current_user.training_goals.filter_by(goal_start_date=current_week).filter_by(goal_metric="Time Spent Above Cadence").all()
+	# The charts below are cached by chart_cache, so each render function does its own queries and is only called when the
+	# user's data has changed since the chart was last drawn
+	def render_above_cadence_plot():
+		# Data and plotting for weekly cadence analysis graph
+		weekly_cadence_goals = current_user.training_goals.filter_by(goal_start_date=current_week).filter_by(goal_metric="Time Spent Above Cadence").all()
 
-	if len(weekly_cadence_goals) == 0:
-		weekly_cadence_goals = None
+		if len(weekly_cadence_goals) == 0:
+			weekly_cadence_goals = None
 
-	weekly_cadence_aggregations = analysis.calculate_weekly_cadence_aggregations(current_week)
+		weekly_cadence_aggregations = analysis.calculate_weekly_cadence_aggregations(current_week)
+
+		if len(weekly_cadence_aggregations["summary"]) == 0:
+			return None, None
 
-	if len(weekly_cadence_aggregations["summary"]) == 0:
-		above_cadence_plot_script=None
-		above_cadence_plot_div=None
-	else:
 		weekly_cadence_summary = weekly_cadence_aggregations["summary"]
 		min_significant_cadence = weekly_cadence_aggregations["min_significant_cadence"]
 		max_significant_cadence = weekly_cadence_aggregations["max_significant_cadence"]
@@ -560,23 +514,26 @@ def weekly_activity(year, week=None):
 		above_cadence_plot = generate_bar(dataset=weekly_cadence_summary, plot_height=120, dimension_name="cadence", measure_name="total_seconds_above_cadence",
 				measure_label_function=utils.convert_seconds_to_minutes_formatted, fill_color=run_fill_color, line_color=run_line_color, max_dimension_range=max_dimension_range,
 				goals_dataset=weekly_cadence_goals, tap_tool_callback=set_cadence_goal_callback)
-		above_cadence_plot_script, above_cadence_plot_div = components(above_cadence_plot)
+		return components(above_cadence_plot)
+
+	above_cadence_plot_script, above_cadence_plot_div = chart_cache.cached_charts(current_user, "weekly_above_cadence", current_week, render_above_cadence_plot)
 
 	# Data and plotting for historic performance against current cadence goals
-	cadence_goal_history_charts = analysis.get_cadence_goal_history_charts(week=current_week)
+	cadence_goal_history_charts = chart_cache.cached_charts(current_user, "cadence_goal_history", current_week,
+		lambda: analysis.get_cadence_goal_history_charts(week=current_week))
 
-	# Data and plotting for weekly gradient analysis graph
-	weekly_gradient_goals = current_user.training_goals.filter_by(goal_start_date=current_week).filter_by(goal_metric="Distance Climbing Above Gradient").all()
+	def render_above_gradient_plot():
+		# Data and plotting for weekly gradient analysis graph
+		weekly_gradient_goals = current_user.training_goals.filter_by(goal_start_date=current_week).filter_by(goal_metric="Distance Climbing Above Gradient").all()
 
-	if len(weekly_gradient_goals) == 0:
-		weekly_gradient_goals = None
+		if len(weekly_gradient_goals) == 0:
+			weekly_gradient_goals = None
 
-	weekly_gradient_aggregations = analysis.calculate_weekly_gradient_aggregations(current_week)
+		weekly_gradient_aggregations = analysis.calculate_weekly_gradient_aggregations(current_week)
+
+		if len(weekly_gradient_aggregations["summary"]) == 0:
+			return None, None
 
-	if len(weekly_gradient_aggregations["summary"]) == 0:
-		above_gradient_plot_script=None
-		above_gradient_plot_div=None
-	else:
 		weekly_gradient_summary = weekly_gradient_aggregations["summary"]
 		min_significant_gradient = weekly_gradient_aggregations["min_significant_gradient"]
 		max_significant_gradient = weekly_gradient_aggregations["max_significant_gradient"]
@@ -588,24 +545,27 @@ def weekly_activity(year, week=None):
 				measure_label_function=utils.format_distance, fill_color=run_fill_color, line_color=run_line_color,
 				dimension_interval=1, max_dimension_range=max_dimension_range,
 				goals_dataset=weekly_gradient_goals, tap_tool_callback=set_gradient_goal_callback)
-		above_gradient_plot_script, above_gradient_plot_div = components(above_gradient_plot)
-	
+		return components(above_gradient_plot)
+
+	above_gradient_plot_script, above_gradient_plot_div = chart_cache.cached_charts(current_user, "weekly_above_gradient", current_week, render_above_gradient_plot)
 	above_gradient_plot_container = PlotComponentContainer(name="Distance Climbing above Gradient %", plot_div=above_gradient_plot_div, plot_script=above_gradient_plot_script)
 
 	# Data and plotting for historic performance against current gradient goals
-	gradient_goal_history_charts = analysis.get_goal_history_charts(week=current_week, goal_metric="Distance Climbing Above Gradient")
-
-	# Data and plotting for the exercise sets by day graph
-	exercises_by_category_and_day = current_user.exercises_by_category_and_day(week=current_week)
-	weekly_exercise_set_goals = current_user.training_goals.filter_by(goal_start_date=current_week).filter_by(goal_metric="Exercise Sets Completed").all()
+	gradient_goal_history_charts = chart_cache.cached_charts(current_user, "gradient_goal_history", current_week,
+		lambda: analysis.get_goal_history_charts(week=current_week, goal_metric="Distance Climbing Above Gradient"))
 
 	# Data and plotting for historic performance against current exercise set goals
-	exercise_set_goal_history_charts = analysis.get_goal_history_charts(week=current_week, goal_metric="Exercise Sets Completed")
+	exercise_set_goal_history_charts = chart_cache.cached_charts(current_user, "exercise_set_goal_history", current_week,
+		lambda: analysis.get_goal_history_charts(week=current_week, goal_metric="Exercise Sets Completed"))
+
+	def render_exercise_sets_plot():
+		# Data and plotting for the exercise sets by day graph
+		exercises_by_category_and_day = current_user.exercises_by_category_and_day(week=current_week)
+		weekly_exercise_set_goals = current_user.training_goals.filter_by(goal_start_date=current_week).filter_by(goal_metric="Exercise Sets Completed").all()
+
+		if len(exercises_by_category_and_day.all()) == 0:
+			return None, None
 
-	if len(exercises_by_category_and_day.all()) == 0:
-		exercise_sets_plot_script = None
-		exercise_sets_plot_div = None
-	else:
 		user_categories = current_user.exercise_categories.all()
 		set_exercise_sets_goal_callback = """
 				$('#setExerciseSetsGoal-modal').modal('show')
@@ -614,44 +574,52 @@ def weekly_activity(year, week=None):
 		exercise_sets_plot = generate_line_chart_for_categories(dataset_query=exercises_by_category_and_day, user_categories=user_categories,
 			dimension="exercise_date", measure="exercise_sets_count", dimension_type = "datetime", plot_height=120, line_type="cumulative", goals_dataset=weekly_exercise_set_goals,
 			tap_tool_callback=set_exercise_sets_goal_callback)
-		exercise_sets_plot_script, exercise_sets_plot_div = components(exercise_sets_plot)
+		return components(exercise_sets_plot)
+
+	exercise_sets_plot_script, exercise_sets_plot_div = chart_cache.cached_charts(current_user, "weekly_exercise_sets", current_week, render_exercise_sets_plot)
+
+	def render_current_goals_plot():
+		# Data and plotting for the goals graph
+		goals_for_week = current_user.training_goals.filter(TrainingGoal.goal_start_date == current_week).all()
+		if len(goals_for_week) == 0:
+			return None, None
 
-	# Data and plotting for the goals graph
-	goals_for_week = current_user.training_goals.filter(TrainingGoal.goal_start_date == current_week).all()
-	if len(goals_for_week) == 0:
-		current_goals_plot_script = None
-		current_goals_plot_div = None
-	else:
 		current_goals_plot = generate_bar(dataset=goals_for_week, plot_height=120, dimension_name="goal_description", measure_name="percent_progress",
 					measure_label_function=utils.format_percentage_labels, dimension_type="discrete", category_field="goal_category",
 					goals_dataset=goals_for_week, goal_measure_type="percent", goal_dimension_type="description", goal_label_function=utils.format_goal_units)
-		current_goals_plot_script, current_goals_plot_div = components(current_goals_plot)
+		return components(current_goals_plot)
 
+	current_goals_plot_script, current_goals_plot_div = chart_cache.cached_charts(current_user, "weekly_goals", current_week, render_current_goals_plot)
 
 	# Graph of activity by week for the year so we can provide navigation at the top
 	weekly_summary = current_user.weekly_activity_summary(year=year)
-	weekly_summary_plot, source = generate_stacked_bar_for_categories(dataset_query=weekly_summary, user_categories=categories,
-		dimension="week_start_date", measure="total_activities", measure_units="activities", dimension_type = "datetime", plot_height=100, bar_direction="vertical",
-		granularity="week", show_grid=False, show_yaxis=False)
 
-	# TODO: extra stuff for the data viz should should be refactored into dataviz now we've shown we can pass the callback in as a parameter
-	weekly_summary_callback_code = """
-		selection = require('core/util/selection')
-		indices = selection.get_indices(source)
-		for (i = 0; i < indices.length; i++) {{
-		    ind = indices[i]
-		    url = "/weekly_activity/{year}/" + source.data['week_start_date'][ind]
-		    window.open(url, "_self")
-		}}
-		""".format(year=year)
+	def render_weekly_summary_plot():
+		weekly_summary_plot, source = generate_stacked_bar_for_categories(dataset_query=weekly_summary, user_categories=categories,
+			dimension="week_start_date", measure="total_activities", measure_units="activities", dimension_type = "datetime", plot_height=100, bar_direction="vertical",
+			granularity="week", show_grid=False, show_yaxis=False)
 
-	tap_tool = weekly_summary_plot.select(type=TapTool)
-	tap_tool.callback = CustomJS(args=dict(source=source), code=weekly_summary_callback_code)
+		# TODO: extra stuff for the data viz should should be refactored into dataviz now we've shown we can pass the callback in as a parameter
+		weekly_summary_callback_code = """
+			selection = require('core/util/selection')
+			indices = selection.get_indices(source)
+			for (i = 0; i < indices.length; i++) {{
+			    ind = indices[i]
+			    url = "/weekly_activity/{year}/" + source.data['week_start_date'][ind]
+			    window.open(url, "_self")
+			}}
+			""".format(year=year)
 
-	weekly_summary_plot.add_layout(Arrow(end=VeeHead(fill_color="#999999"),
-                   x_start=current_week_ms, y_start=current_week_activity_count+0.1, x_end=current_week_ms, y_end=current_week_activity_count))
+		tap_tool = weekly_summary_plot.select(type=TapTool)
+		tap_tool.callback = CustomJS(args=dict(source=source), code=weekly_summary_callback_code)
 
-	weekly_summary_plot_script, weekly_summary_plot_div = components(weekly_summary_plot)
+		weekly_summary_plot.add_layout(Arrow(end=VeeHead(fill_color="#999999"),
+	                   x_start=current_week_ms, y_start=current_week_activity_count+0.1, x_end=current_week_ms, y_end=current_week_activity_count))
+
+		return components(weekly_summary_plot)
+
+	weekly_summary_plot_script, weekly_summary_plot_div = chart_cache.cached_charts(current_user, "weekly_summary", "{year}:{week}".format(year=year, week=current_week),
+		render_weekly_summary_plot)
 
 	return render_template("weekly_activity.html", title="Weekly Activity", utils=utils, current_user=current_user,
 		weekly_summary=weekly_summary, weekly_summary_plot_script=weekly_summary_plot_script, weekly_summary_plot_div=weekly_summary_plot_div,
@@ -1116,89 +1084,26 @@ def copy_template_to_schedule(template_id):
 	# Send the user back to the schedule page
 	return redirect(url_for("schedule", schedule_freq="weekly"))	
 
-#TODO: Refactor to use strava_utils if we need to make any changes before killing this off
 @app.route("/import_strava_activity")
 @login_required
 def import_strava_activity():
 	track_event(category="Strava", action="Starting import of Strava activity", userId = str(current_user.id))
-	strava_client = Client()
-
 	if not session.get("strava_access_token"):
 		return redirect(url_for("connect_strava", action="authorize"))
 
-	access_token = session["strava_access_token"]
-	strava_client.access_token = access_token
-
-	try:
-		athlete = strava_client.get_athlete()
-	except:
+	result = strava_utils.import_strava_activity(session["strava_access_token"], current_user)
+	if result["status"] != "success":
 		return redirect(url_for("connect_strava", action="authorize"))
 
-	# Update user's UOM preferences based on what they have set in Strava
-	if athlete.measurement_preference == "feet":
-		current_user.distance_uom_preference = "miles"
-		current_user.elevation_uom_preference = "feet"
-	elif athlete.measurement_preference == "meters":
-		current_user.distance_uom_preference = "km"
-		current_user.elevation_uom_preference = "m"
-	db.session.commit()
-
-	most_recent_strava_activity_datetime = current_user.most_recent_strava_activity_datetime()
-
-	# Start from 2000 if no imported activities
-	most_recent_strava_activity_datetime = datetime(2000,1,1) if most_recent_strava_activity_datetime is None else most_recent_strava_activity_datetime
-
-	activities = strava_client.get_activities(after = most_recent_strava_activity_datetime)
-	activities_list = list(activities)
-
-	new_activity_count = 0
-
-	for strava_activity in activities_list:
-		# if the start_datetime is today then check if there's a scheduled activity in today's plan
-		if strava_activity.start_date.date() == date.today():
-			scheduled_activity = current_user.activities_for_today_remaining(activity_type=strava_activity.type).first()
-		else:
-			scheduled_activity = None
-		
-
-		activity = Activity(external_source = "Strava",
-							external_id = strava_activity.id,
-							owner = current_user,
-							scheduled_activity_id = scheduled_activity.id if scheduled_activity else None,
-							name = strava_activity.name,
-							start_datetime = strava_activity.start_date,
-							activity_type = strava_activity.type,
-							is_race = True if strava_activity.workout_type == "1" else False,
-							distance = strava_activity.distance.num,
-							total_elevation_gain = strava_activity.total_elevation_gain.num,
-							elapsed_time =strava_activity.elapsed_time,
-							moving_time = strava_activity.moving_time,
-							average_speed = strava_activity.average_speed.num,
-							average_cadence = (strava_activity.average_cadence * 2) if (strava_activity.type == "Run" and strava_activity.average_cadence is not None) else strava_activity.average_cadence,
-							average_heartrate = strava_activity.average_heartrate,
-							description = (strava_activity.description[:1000] if strava_activity.description else None)) #limit to first 1000 characters just in case
-
-		db.session.add(activity)
-		new_activity_count += 1
-
-		if strava_activity.start_date.replace(tzinfo=None) > datetime.now() - timedelta(days=7):
-			result = analysis.parse_streams(activity=activity)
+	new_activity_count = result["new_activity_count"]
 
 	flash("Added {count} new activities from Strava!".format(count=new_activity_count))
 	track_event(category="Strava", action="Completed import of Strava activity", userId = str(current_user.id))
 	db.session.commit()
 
-	#TODO: refactor to use analysis function
 	# Evaluate any goals that the user has, including processing any additional data e.g. cadence
-	current_day = CalendarDay.query.filter(CalendarDay.calendar_date==datetime.date(datetime.today())).first()
-	current_week = current_day.calendar_week_start_date
-	analysis.evaluate_running_goals(week=current_week, goal_metric="Runs Completed Over Distance")
-	analysis.evaluate_running_goals(week=current_week, goal_metric="Weekly Distance")
-	analysis.evaluate_running_goals(week=current_week, goal_metric="Weekly Moving Time")
-	analysis.evaluate_running_goals(week=current_week, goal_metric="Weekly Elevation Gain")
-	analysis.evaluate_running_goals(week=current_week, goal_metric="Time Spent Above Cadence", calculate_weekly_aggregations_function=analysis.calculate_weekly_cadence_aggregations)
-	analysis.evaluate_running_goals(week=current_week, goal_metric="Distance Climbing Above Gradient", calculate_weekly_aggregations_function=analysis.calculate_weekly_gradient_aggregations)
-	
+	analysis.evaluate_all_running_goals_for_current_week(current_user)
+
 	# TODO: refactor to avoid duplication in resources
 	# If the user hasn't used categories yet then apply some defaults
 	if len(current_user.exercise_categories.all()) == 0:
@@ -1289,76 +1194,11 @@ def activity_analysis(id):
 
 		db.session.commit()
 
-	# Find out colour-coding req's for the charts that follow
-	run_category = ExerciseCategory.query.filter(ExerciseCategory.owner == current_user).filter(ExerciseCategory.category_name == "Run").first()
-	if run_category is not None:
-		fill_color = run_category.fill_color
-		line_color = run_category.line_color
-	else:
-		fill_color = None
-		line_color = None
-	
-	# Cadence charts
-	if activity.median_cadence:
-		# Keep the graph tidy if there's any bit of walking or other outliers by excluding them
-		max_dimension_range = (int(activity.median_cadence-30), int(activity.median_cadence+30))
-
-		at_cadence_plot = generate_bar(dataset=activity.activity_cadence_aggregates, plot_height=300,
-			dimension_name="cadence", measure_name="total_seconds_at_cadence", measure_label_name="total_seconds_at_cadence_formatted", max_dimension_range=max_dimension_range,
-			fill_color=fill_color, line_color=line_color)
-		at_cadence_plot_script, at_cadence_plot_div = components(at_cadence_plot)
-
-		above_cadence_plot = generate_bar(dataset=activity.activity_cadence_aggregates, plot_height=300,
-			dimension_name="cadence", measure_name="total_seconds_above_cadence", measure_label_name="total_seconds_above_cadence_formatted", max_dimension_range=max_dimension_range,
-			fill_color=fill_color, line_color=line_color)
-		above_cadence_plot_script, above_cadence_plot_div = components(above_cadence_plot)
-	else:
-		at_cadence_plot_script, at_cadence_plot_div = ("", "")
-		above_cadence_plot_script, above_cadence_plot_div = ("", "")
-	
-	# Pace charts
-	if activity.activity_pace_aggregates.first():
-		# Keep the graph tidy if there's any bit of walking or other outliers by excluding them
-		max_dimension_range = (utils.seconds_to_datetime(0), utils.seconds_to_datetime(utils.convert_mps_to_km_pace(activity.average_speed).total_seconds() + 60))
-
-		at_pace_plot = generate_bar(dataset=activity.activity_pace_aggregates.order_by(ActivityPaceAggregate.pace_seconds.desc()), plot_height=300,
-			dimension_type="timedelta", dimension_name="pace_seconds", measure_name="total_seconds_at_pace", dimension_interval=5000, measure_label_name="total_seconds_at_pace_formatted", max_dimension_range=max_dimension_range,
-			fill_color=fill_color, line_color=line_color)
-		at_pace_plot_script, at_pace_plot_div = components(at_pace_plot)
-		at_pace_plot_container = PlotComponentContainer(name="Time Spent at Pace (secs/km)", plot_div=at_pace_plot_div, plot_script=at_pace_plot_script)
-
-		above_pace_plot = generate_bar(dataset=activity.activity_pace_aggregates.order_by(ActivityPaceAggregate.pace_seconds.desc()), plot_height=300,
-			dimension_type="timedelta", dimension_name="pace_seconds", measure_name="total_seconds_above_pace", dimension_interval=5000, measure_label_name="total_seconds_above_pace_formatted", max_dimension_range=max_dimension_range,
-			fill_color=fill_color, line_color=line_color)
-		above_pace_plot_script, above_pace_plot_div = components(above_pace_plot)
-		above_pace_plot_container = PlotComponentContainer(name="Time Spent faster than Pace (secs/km)", plot_div=above_pace_plot_div, plot_script=above_pace_plot_script)
-	else:
-		at_pace_plot_container = None
-		above_pace_plot_container = None
-
-	# Gradient charts
-	if activity.activity_gradient_aggregates.first():
-		at_gradient_plot = generate_bar(dataset=activity.activity_gradient_aggregates, plot_height=300,
-			dimension_name="gradient", measure_name="total_metres_at_gradient", dimension_interval=1, measure_label_name="total_metres_at_gradient_formatted",
-			fill_color=fill_color, line_color=line_color)
-		at_gradient_plot_script, at_gradient_plot_div = components(at_gradient_plot)
-		at_gradient_plot_container = PlotComponentContainer(name="Distance Climbing at Gradient %", plot_div=at_gradient_plot_div, plot_script=at_gradient_plot_script)
-
-		above_gradient_plot = generate_bar(dataset=activity.activity_gradient_aggregates, plot_height=300,
-			dimension_name="gradient", measure_name="total_metres_above_gradient", dimension_interval=1, measure_label_name="total_metres_above_gradient_formatted",
-			fill_color=fill_color, line_color=line_color)
-		above_gradient_plot_script, above_gradient_plot_div = components(above_gradient_plot)
-		above_gradient_plot_container = PlotComponentContainer(name="Distance Climbing above Gradient %", plot_div=above_gradient_plot_div, plot_script=above_gradient_plot_script)
-	else:
-		at_gradient_plot_container = None
-		above_gradient_plot_container = None
-
+	# The charts are drawn in the browser by static/charts.js from their series, which only change if the activity is
+	# re-parsed or the Run category's colours do, see chart_cache
+	charts = chart_cache.cached_charts(current_user, "activity_analysis", activity.id, lambda: chart_data.activity_analysis_chart_data(activity))
 
-	return render_template("activity_analysis.html", title="Activity Analysis: {name}".format(name=activity.name), activity=activity,
-		at_cadence_plot_script=at_cadence_plot_script, at_cadence_plot_div=at_cadence_plot_div,
-		above_cadence_plot_script=above_cadence_plot_script, above_cadence_plot_div=above_cadence_plot_div,
-		at_pace_plot_container=at_pace_plot_container, above_pace_plot_container=above_pace_plot_container,
-		at_gradient_plot_container=at_gradient_plot_container, above_gradient_plot_container=above_gradient_plot_container)
+	return render_template("activity_analysis.html", title="Activity Analysis: {name}".format(name=activity.name), activity=activity, charts=charts)
 
 
 @app.route("/connect_strava/<action>")
@@ -1393,6 +1233,9 @@ def connect_strava(action="prompt"):
 
 		data = strava_auth.get_token(code=code, grant_type="authorization_code")
 		session["strava_access_token"] = data.get("access_token")
+		# Keep the tokens so that webhook events can be applied without the user being around
+		strava_utils.save_strava_tokens(current_user, data)
+		db.session.commit()
 		track_event(category="Strava", action="Strava authorization successful", userId = str(current_user.id))
 
 		# Pass the next query string parameter through o the import
@@ -1407,15 +1250,19 @@ def connect_strava(action="prompt"):
 @login_required
 def backfill_stream_data():
 	track_event(category="Strava", action="Streams backfill triggered", userId = str(current_user.id))
-	activities = current_user.activities.filter(Activity.is_fully_parsed == False).order_by(Activity.start_datetime.desc()).all()
-	flash("Getting detailed run data for {count} activities".format(count=len(activities)))
+	# The jobs run with the stored tokens, so those are what need to be there
+	if strava_utils.strava_access_token_for(current_user) is None:
+		return redirect(url_for("connect_strava", action="authorize"))
 
+	activities = current_user.activities.filter(Activity.is_fully_parsed == False).filter(Activity.activity_type == "Run").order_by(Activity.start_datetime.desc()).all()
+
+	# Parsing happens in the background as a big backfill would time out if done inside the request
 	for activity in activities:
-		result = analysis.parse_streams(activity)
-		if result == "Not authorized":
-			return redirect(url_for("connect_strava", action="authorize"))
+		analysis.enqueue_stream_parse(activity=activity)
+	db.session.commit()
 
-	track_event(category="Strava", action="Streams backfill completed", userId = str(current_user.id))
+	flash("Getting detailed run data for {count} activities in the background".format(count=len(activities)))
+	track_event(category="Strava", action="Streams backfill queued", userId = str(current_user.id))
 	return redirect(url_for("weekly_activity", year="current"))
 
 @app.route("/flag_bad_elevation_data/<activity_id>")
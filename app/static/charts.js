@@ -0,0 +1,60 @@
+// Draws the charts described by app/chart_data.py (and /api/chart_data) with BokehJS in the browser, in the same style
+// as the bar charts that app/dataviz.py builds on the server. Needs bokeh and bokeh-api loaded first.
+var TrainingTicksCharts = (function() {
+	function styleAxes(plot, fontSize) {
+		plot.xaxis.concat(plot.yaxis).forEach(function(axis) {
+			axis.minor_tick_line_color = null;
+			axis.axis_line_color = "#999999";
+			axis.major_label_text_color = "#666666";
+			axis.major_label_text_font_size = {value: fontSize};
+			axis.major_tick_line_color = "#cccccc";
+		});
+		plot.outline_line_color = null;
+	}
+
+	function labels(source, textColor) {
+		return new Bokeh.LabelSet({source: source, x: {field: "measure"}, y: {field: "dimension"}, text: {field: "measure_label"}, level: "glyph",
+			x_offset: 5, y_offset: -5, render_mode: "canvas", text_font: "sans-serif", text_font_size: {value: "7pt"}, text_color: textColor});
+	}
+
+	function bar(chart, plotHeight) {
+		var plot = Bokeh.Plotting.figure({plot_height: plotHeight, sizing_mode: "scale_width", toolbar_location: null, tools: "",
+			x_range: new Bokeh.Range1d({start: chart.measure_range[0], end: chart.measure_range[1]}),
+			y_range: new Bokeh.Range1d({start: chart.dimension_range[0], end: chart.dimension_range[1]}),
+			y_axis_type: chart.dimension_type == "timedelta" ? "datetime" : null});
+		var source = new Bokeh.ColumnDataSource({data: {dimension: chart.dimension, dimension_label: chart.dimension_label, measure: chart.measure,
+			measure_label: chart.measure_label, fill_color: chart.fill_color, line_color: chart.line_color}});
+
+		plot.hbar({source: source, y: {field: "dimension"}, right: {field: "measure"}, height: chart.bar_height,
+			fill_color: {field: "fill_color"}, line_color: {field: "line_color"}, fill_alpha: 0.8});
+		plot.add_layout(labels(source, {field: "fill_color"}));
+		plot.add_tools(new Bokeh.HoverTool({tooltips: "@dimension_label: @measure_label"}));
+
+		if (chart.dimension_type == "continuous") {
+			plot.add_layout(new Bokeh.LinearAxis({ticker: new Bokeh.SingleIntervalTicker({interval: chart.dimension_tick_interval, num_minor_ticks: 2})}), "left");
+		}
+		else {
+			plot.yaxis.forEach(function(axis) { axis.formatter = new Bokeh.DatetimeTickFormatter({minsec: ["%M:%S"]}); });
+		}
+
+		plot.xaxis.forEach(function(axis) { axis.visible = false; });
+		styleAxes(plot, "7pt");
+		plot.xgrid.concat(plot.ygrid).forEach(function(grid) { grid.grid_line_color = null; });
+		return plot;
+	}
+
+	var renderers = {bar: bar};
+
+	// options.plotHeight defaults to 300
+	function render(elementId, chart, options) {
+		options = options || {};
+		if (!chart) {
+			return null;
+		}
+		var plot = renderers[chart.kind](chart, options.plotHeight || 300);
+		Bokeh.Plotting.show(plot, document.getElementById(elementId));
+		return plot;
+	}
+
+	return {render: render};
+})();
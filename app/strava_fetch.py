@@ -0,0 +1,124 @@
+from concurrent.futures import ThreadPoolExecutor
+from stravalib.client import Client
+from stravalib import exc
+import threading
+import logging
+import time
+
+from app import app
+
+STREAM_TYPES = ["time", "cadence", "velocity_smooth", "distance", "altitude", "grade_smooth"]
+
+class TokenBucket:
+	# Strava counts requests in fixed windows (each quarter hour and each UTC day) so the bucket is refilled in one go
+	# at the start of each window rather than continuously
+	def __init__(self, capacity, period_seconds):
+		self.capacity = capacity
+		self.period_seconds = period_seconds
+		self.tokens = capacity
+		self.window_start = self.current_window_start(time.time())
+
+	def current_window_start(self, now):
+		return now - (now % self.period_seconds)
+
+	def refill(self, now):
+		if self.current_window_start(now) > self.window_start:
+			self.window_start = self.current_window_start(now)
+			self.tokens = self.capacity
+
+	def seconds_until_available(self, now):
+		self.refill(now)
+		return 0 if self.tokens >= 1 else self.window_start + self.period_seconds - now
+
+	def sync(self, usage, limit, now):
+		# Strava's count is shared by every process using our app so trust it over what we think we've used. The capacity
+		# stays as configured as it may only be this process's share of the limit
+		self.refill(now)
+		self.tokens = min(self.tokens, self.capacity, limit - usage)
+
+	def exhaust(self, now):
+		self.refill(now)
+		self.tokens = 0
+
+
+class StravaRateLimiter:
+	def __init__(self, short_limit=None, long_limit=None, buckets=None):
+		short_limit = app.config.get("STRAVA_RATE_LIMIT_15_MIN", 600) if short_limit is None else short_limit
+		long_limit = app.config.get("STRAVA_RATE_LIMIT_DAILY", 30000) if long_limit is None else long_limit
+		self.buckets = [TokenBucket(short_limit, 900), TokenBucket(long_limit, 86400)] if buckets is None else buckets
+		self.lock = threading.Lock()
+		self.waited_seconds = 0
+
+	def acquire(self):
+		while True:
+			with self.lock:
+				now = time.time()
+				wait_seconds = max([bucket.seconds_until_available(now) for bucket in self.buckets])
+				if wait_seconds == 0:
+					for bucket in self.buckets:
+						bucket.tokens -= 1
+					return
+				self.waited_seconds += wait_seconds
+			time.sleep(wait_seconds)
+
+	def exhaust(self):
+		with self.lock:
+			now = time.time()
+			self.buckets[0].exhaust(now)
+
+	# stravalib calls this with the headers of every response
+	def __call__(self, response_headers):
+		try:
+			usage = [int(value) for value in response_headers["X-RateLimit-Usage"].split(",")]
+			limit = [int(value) for value in response_headers["X-RateLimit-Limit"].split(",")]
+		except (KeyError, ValueError):
+			return
+
+		with self.lock:
+			now = time.time()
+			for bucket, bucket_usage, bucket_limit in zip(self.buckets, usage, limit):
+				bucket.sync(bucket_usage, bucket_limit, now)
+
+
+class StravaStreamFetcher:
+	def __init__(self, max_workers=None, rate_limiter=None, requests_session_factory=None, max_attempts=3):
+		self.max_workers = app.config.get("STRAVA_FETCH_THREADS", 8) if max_workers is None else max_workers
+		self.rate_limiter = StravaRateLimiter() if rate_limiter is None else rate_limiter
+		self.requests_session_factory = requests_session_factory
+		self.max_attempts = max_attempts
+		self.local = threading.local()
+
+	def client(self, access_token):
+		# stravalib clients aren't thread safe so each thread gets its own, sharing the one rate limiter
+		if getattr(self.local, "client", None) is None:
+			requests_session = self.requests_session_factory() if self.requests_session_factory else None
+			self.local.client = Client(rate_limiter=self.rate_limiter, requests_session=requests_session)
+		self.local.client.access_token = access_token
+		return self.local.client
+
+	def fetch(self, external_id, access_token):
+		for attempt in range(self.max_attempts):
+			self.rate_limiter.acquire()
+			try:
+				activity_streams = self.client(access_token).get_activity_streams(external_id, types=STREAM_TYPES)
+			except exc.AccessUnauthorized:
+				return "Not authorized"
+			except exc.ObjectNotFound:
+				return None
+			except (exc.RateLimitExceeded, exc.Fault) as e:
+				# A 429 means someone else used up the quota, so wait for the window to reset before trying again
+				if isinstance(e, exc.RateLimitExceeded) or "429" in str(e):
+					self.rate_limiter.exhaust()
+					continue
+				logging.warning("Error fetching streams for {external_id}: {error}".format(external_id=external_id, error=e))
+				return str(e)
+
+			return {stream_type: stream.data for stream_type, stream in activity_streams.items()} if activity_streams else None
+
+		return "Rate limit exceeded"
+
+	def fetch_all(self, stream_requests):
+		# stream_requests is a list of (external_id, access_token). Results are in the same order, each either a dict of
+		# stream type to data, None if the activity has no streams, or a string describing the error
+		with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+			return list(executor.map(lambda stream_request: self.fetch(*stream_request), stream_requests))
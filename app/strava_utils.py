@@ -1,10 +1,14 @@
 from flask import session
 from datetime import datetime, date, timedelta
+from itertools import islice
+from sqlalchemy import func, case
+from sqlalchemy.dialects import postgresql
 from stravalib.client import Client
+import requests
 
-from app import db, analysis
+from app import app, db, utils, analysis, rollups, response_cache
 from app.ga import track_event
-from app.models import Activity, ExerciseCategory, CalendarDay
+from app.models import User, Activity, ExerciseCategory, CalendarDay, StravaSyncCheckpoint
 
 def import_strava_activity(access_token, current_user):
 
@@ -29,64 +33,214 @@ def import_strava_activity(access_token, current_user):
     elif athlete.measurement_preference == "meters":
         current_user.distance_uom_preference = "km"
         current_user.elevation_uom_preference = "m"
+
+    # Needed to match webhook events from Strava back to the user
+    link_strava_athlete(current_user, athlete.id)
+    if current_user.strava_refresh_token is None:
+        current_user.strava_access_token = access_token
     db.session.commit()
 
-    most_recent_strava_activity_datetime = current_user.most_recent_strava_activity_datetime()
+    new_activity_count = sync_strava_activities(strava_client, access_token, current_user)
 
-    # Start from 2000 if no imported activities
-    most_recent_strava_activity_datetime = datetime(2000,1,1) if most_recent_strava_activity_datetime is None else most_recent_strava_activity_datetime
+    return {
+            "status": "success",
+            "message": "Added {count} new activities from Strava!".format(count=new_activity_count),
+            "new_activity_count": new_activity_count
+    }
+
+
+def link_strava_athlete(user, athlete_id):
+    # A Strava athlete can only belong to one of our users, so take it from anyone who connected it before
+    User.query.filter(User.strava_athlete_id == athlete_id).filter(User.id != user.id).update({"strava_athlete_id": None}, synchronize_session=False)
+    user.strava_athlete_id = athlete_id
+
+
+def save_strava_tokens(user, token_data):
+    # token_data is the response from Strava's token endpoint, which only includes the athlete on the first exchange
+    if token_data.get("athlete"):
+        link_strava_athlete(user, token_data["athlete"]["id"])
+    user.strava_access_token = token_data.get("access_token")
+    user.strava_refresh_token = token_data.get("refresh_token", user.strava_refresh_token)
+    user.strava_access_token_expires_datetime = datetime.utcfromtimestamp(token_data["expires_at"]) if token_data.get("expires_at") else None
+
+
+def strava_access_token_for(user):
+    # Background work doesn't have the user's session so uses the stored tokens, refreshing them when they've expired
+    if user.strava_refresh_token and (user.strava_access_token_expires_datetime is None or user.strava_access_token_expires_datetime < datetime.utcnow() + timedelta(minutes=5)):
+        response = requests.post("https://www.strava.com/oauth/token", data={"client_id": app.config["STRAVA_OAUTH2_CLIENT_ID"],
+                                                                             "client_secret": app.config["STRAVA_OAUTH2_CLIENT_SECRET"],
+                                                                             "grant_type": "refresh_token",
+                                                                             "refresh_token": user.strava_refresh_token})
+        if response.status_code != 200:
+            return None
+        save_strava_tokens(user, response.json())
+        db.session.commit()
+
+    return user.strava_access_token
+
+
+def sync_strava_activities(strava_client, access_token, current_user):
+    checkpoint = current_user.strava_sync_checkpoint
+    if checkpoint is None:
+        checkpoint = StravaSyncCheckpoint(owner=current_user,
+                                          synced_until_datetime=current_user.most_recent_strava_activity_datetime())
+        db.session.add(checkpoint)
+
+    # Start from 2000 if no imported activities. If a previous sync died part way through it carries on from the last saved page
+    synced_until_datetime = datetime(2000,1,1) if checkpoint.synced_until_datetime is None else checkpoint.synced_until_datetime
+
+    checkpoint.status = "In Progress"
+    checkpoint.activities_synced = 0
+    checkpoint.started_datetime = datetime.utcnow()
+    checkpoint.updated_datetime = datetime.utcnow()
+    db.session.commit()
 
-    activities = strava_client.get_activities(after = most_recent_strava_activity_datetime)
-    activities_list = list(activities)
+    # Strava returns activities oldest first when given an after date, and stravalib only requests each page as it's needed,
+    # so taking them a page at a time means only one page is ever held in memory
+    activities = strava_client.get_activities(after=synced_until_datetime)
+    planned_activity_matcher = PlannedActivityMatcher(current_user)
+    page_size = app.config.get("STRAVA_SYNC_PAGE_SIZE", 200)
 
-    new_activity_count = 0
+    while True:
+        strava_activities = list(islice(activities, page_size))
+        if len(strava_activities) == 0:
+            break
 
-    current_date = date.today()
-    current_day = CalendarDay.query.filter(CalendarDay.calendar_date==current_date).first()
-    current_week_start_date = current_day.calendar_week_start_date
+        new_activity_count = upsert_strava_activities(strava_activities, access_token, current_user, planned_activity_matcher)
 
-    for strava_activity in activities_list:
-        # if the start_datetime is today or this week then check if there's a scheduled activity in today's or this week's plan
-        scheduled_activity = None
-
-        if strava_activity.start_date.date() == current_date:
-            scheduled_activity = current_user.planned_activities_filtered(startDate=current_date,
-                                                                          endDate=current_date,
-                                                                          planningPeriod="day",
-                                                                          activityType=strava_activity.type).first()
-
-        if scheduled_activity is None and strava_activity.start_date.date() >= current_week_start_date:
-            scheduled_activity = current_user.planned_activities_filtered(startDate=current_week_start_date,
-                                                                          endDate=current_date,
-                                                                          planningPeriod="week",
-                                                                          activityType=strava_activity.type).first()  
-
-        activity = Activity(external_source = "Strava",
-                            external_id = strava_activity.id,
-                            owner = current_user,
-                            scheduled_activity_id = scheduled_activity.id if scheduled_activity else None,
-                            name = strava_activity.name,
-                            start_datetime = strava_activity.start_date,
-                            activity_type = strava_activity.type,
-                            is_race = True if strava_activity.workout_type == "1" else False,
-                            distance = strava_activity.distance.num,
-                            total_elevation_gain = strava_activity.total_elevation_gain.num,
-                            elapsed_time =strava_activity.elapsed_time,
-                            moving_time = strava_activity.moving_time,
-                            average_speed = strava_activity.average_speed.num,
-                            average_cadence = (strava_activity.average_cadence * 2) if (strava_activity.type == "Run" and strava_activity.average_cadence is not None) else strava_activity.average_cadence,
-                            average_heartrate = strava_activity.average_heartrate,
-                            description = (strava_activity.description[:1000] if strava_activity.description else None)) #limit to first 1000 characters just in case
-
-        db.session.add(activity)
-        new_activity_count += 1
-
-        if strava_activity.start_date.replace(tzinfo=None) > datetime.now() - timedelta(days=7):
-            result = analysis.parse_streams(activity=activity)
+        checkpoint.synced_until_datetime = max([strava_activity.start_date.replace(tzinfo=None) for strava_activity in strava_activities])
+        checkpoint.activities_synced += new_activity_count
+        checkpoint.updated_datetime = datetime.utcnow()
+        db.session.commit()
 
+    checkpoint.status = "Completed"
     db.session.commit()
 
-    return {
-            "status": "success",
-            "message": "Added {count} new activities from Strava!".format(count=new_activity_count)
-    }
\ No newline at end of file
+    return checkpoint.activities_synced
+
+
+def upsert_strava_activities(strava_activities, access_token, current_user, planned_activity_matcher):
+    external_ids = [str(strava_activity.id) for strava_activity in strava_activities]
+    # Where an activity already exists its previous start is kept too, as an edit in Strava can move it to another week
+    existing_activities = Activity.query.with_entities(Activity.external_id, Activity.start_datetime
+        ).filter(Activity.user_id == current_user.id
+        ).filter(Activity.external_source == "Strava"
+        ).filter(Activity.external_id.in_(external_ids)
+        ).all()
+    existing_external_ids = set([activity.external_id for activity in existing_activities])
+
+    activity_rows = []
+    for strava_activity in strava_activities:
+        # Only new activities get matched to the plan, activities we already have keep whatever they were matched to
+        start_datetime = strava_activity.start_date.replace(tzinfo=None)
+        scheduled_activity_id = None
+        if str(strava_activity.id) not in existing_external_ids:
+            scheduled_activity_id = planned_activity_matcher.match(strava_activity.type, start_datetime.date())
+
+        # Core inserts don't apply the model defaults so they're set explicitly here
+        activity_rows.append(dict(external_source = "Strava",
+                                  external_id = str(strava_activity.id),
+                                  user_id = current_user.id,
+                                  scheduled_activity_id = scheduled_activity_id,
+                                  name = strava_activity.name,
+                                  start_datetime = start_datetime,
+                                  activity_date = start_datetime.date(),
+                                  week_start_date = utils.week_start_date(start_datetime.date()),
+                                  calendar_year = start_datetime.year,
+                                  activity_type = strava_activity.type,
+                                  is_race = True if strava_activity.workout_type == "1" else False,
+                                  distance = strava_activity.distance.num,
+                                  total_elevation_gain = strava_activity.total_elevation_gain.num,
+                                  elapsed_time = strava_activity.elapsed_time,
+                                  moving_time = strava_activity.moving_time,
+                                  average_speed = strava_activity.average_speed.num,
+                                  average_cadence = (strava_activity.average_cadence * 2) if (strava_activity.type == "Run" and strava_activity.average_cadence is not None) else strava_activity.average_cadence,
+                                  average_heartrate = strava_activity.average_heartrate,
+                                  description = (strava_activity.description[:1000] if strava_activity.description else None), #limit to first 1000 characters just in case
+                                  is_fully_parsed = False,
+                                  is_bad_elevation_data = False,
+                                  is_overwritten_elevation_gain = False,
+                                  created_datetime = datetime.utcnow()))
+
+    # Re-syncing an activity refreshes what the user can edit in Strava but keeps what we've worked out ourselves
+    activity_table = Activity.__table__
+    insert_statement = postgresql.insert(activity_table).values(activity_rows)
+    upsert_statement = insert_statement.on_conflict_do_update(
+        index_elements=["user_id", "external_source", "external_id"],
+        set_=dict(name=insert_statement.excluded.name,
+                  start_datetime=insert_statement.excluded.start_datetime,
+                  activity_date=insert_statement.excluded.activity_date,
+                  week_start_date=insert_statement.excluded.week_start_date,
+                  calendar_year=insert_statement.excluded.calendar_year,
+                  activity_type=insert_statement.excluded.activity_type,
+                  is_race=insert_statement.excluded.is_race,
+                  distance=insert_statement.excluded.distance,
+                  total_elevation_gain=case([(activity_table.c.is_overwritten_elevation_gain == True, activity_table.c.total_elevation_gain)],
+                                            else_=insert_statement.excluded.total_elevation_gain),
+                  elapsed_time=insert_statement.excluded.elapsed_time,
+                  moving_time=insert_statement.excluded.moving_time,
+                  average_speed=insert_statement.excluded.average_speed,
+                  average_cadence=insert_statement.excluded.average_cadence,
+                  average_heartrate=insert_statement.excluded.average_heartrate,
+                  description=insert_statement.excluded.description,
+                  scheduled_activity_id=func.coalesce(activity_table.c.scheduled_activity_id, insert_statement.excluded.scheduled_activity_id))
+    ).returning(activity_table.c.id, activity_table.c.external_id)
+    upserted_activities = db.session.execute(upsert_statement).fetchall()
+    rollups.mark_activities_changed(current_user.id, [activity_row["start_datetime"] for activity_row in activity_rows] + [activity.start_datetime for activity in existing_activities])
+    response_cache.mark_users_changed([current_user.id])
+
+    # Detailed data gets parsed by the stream parsing workers so that the import can return straight away
+    new_activity_ids = [upserted_activity.id for upserted_activity in upserted_activities if upserted_activity.external_id not in existing_external_ids]
+    recent_run_ids = [activity.id for activity in Activity.query.with_entities(Activity.id
+        ).filter(Activity.id.in_(new_activity_ids)
+        ).filter(Activity.activity_type == "Run"
+        ).filter(Activity.start_datetime > datetime.utcnow() - timedelta(days=7)
+        ).all()] if len(new_activity_ids) > 0 else []
+
+    for activity in Activity.query.filter(Activity.id.in_(recent_run_ids)).all() if len(recent_run_ids) > 0 else []:
+        analysis.enqueue_stream_parse(activity=activity)
+
+    return len(new_activity_ids)
+
+
+class PlannedActivityMatcher:
+    # Loads today's and this week's outstanding planned activities once for the whole sync rather than querying for
+    # each activity. Planned activities are used up as they get matched, same as the Activity anti-join does in the query
+    def __init__(self, current_user):
+        self.current_date = date.today()
+        current_day = CalendarDay.query.filter(CalendarDay.calendar_date==self.current_date).first()
+        self.current_week_start_date = current_day.calendar_week_start_date
+
+        self.day_planned_activities = self.unique_planned_activities(current_user.planned_activities_filtered(startDate=self.current_date,
+                                                                                                            endDate=self.current_date,
+                                                                                                            planningPeriod="day").all())
+        self.week_planned_activities = self.unique_planned_activities(current_user.planned_activities_filtered(startDate=self.current_week_start_date,
+                                                                                                             endDate=self.current_date,
+                                                                                                             planningPeriod="week").all())
+
+    def unique_planned_activities(self, planned_activities):
+        # A weekly plan comes back once per day of the week so far
+        unique_planned_activities = []
+        for planned_activity in planned_activities:
+            if planned_activity.id not in [unique_planned_activity.id for unique_planned_activity in unique_planned_activities]:
+                unique_planned_activities.append(planned_activity)
+        return unique_planned_activities
+
+    def take(self, planned_activities, activity_type):
+        for planned_activity in planned_activities:
+            if planned_activity.activity_type == activity_type:
+                planned_activities.remove(planned_activity)
+                return planned_activity.id
+        return None
+
+    def match(self, activity_type, activity_date):
+        # if the start_datetime is today or this week then check if there's a scheduled activity in today's or this week's plan
+        scheduled_activity_id = None
+
+        if activity_date == self.current_date:
+            scheduled_activity_id = self.take(self.day_planned_activities, activity_type)
+
+        if scheduled_activity_id is None and activity_date >= self.current_week_start_date:
+            scheduled_activity_id = self.take(self.week_planned_activities, activity_type)
+
+        return scheduled_activity_id
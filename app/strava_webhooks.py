@@ -0,0 +1,229 @@
+from datetime import datetime, timedelta
+from sqlalchemy import case, exists, and_
+from sqlalchemy.orm import aliased
+from sqlalchemy.dialects import postgresql
+from stravalib.client import Client
+from stravalib import exc
+import logging
+import json
+import time
+
+from app import app, db, analysis, strava_utils, rollups, response_cache
+from app.models import User, Activity, ActivityCadenceAggregate, ActivityPaceAggregate, ActivityGradientAggregate, ActivityStream, StreamParseJob, StravaWebhookEvent
+from app.strava_fetch import StravaRateLimiter
+
+def record_event(event):
+	# Strava only gives us a couple of seconds to respond so events are queued and applied later by the worker. Anything
+	# that arrives for an object that's already queued is merged into the queued event, so a burst of edits to an
+	# activity only means fetching it once
+	event_table = StravaWebhookEvent.__table__
+	insert_statement = postgresql.insert(event_table).values(object_type=event["object_type"],
+															 object_id=event["object_id"],
+															 owner_id=event["owner_id"],
+															 aspect_type=event["aspect_type"],
+															 updates=json.dumps(event.get("updates") or {})[:1000],
+															 event_datetime=datetime.utcfromtimestamp(event["event_time"]) if event.get("event_time") else datetime.utcnow(),
+															 status="Queued",
+															 received_count=1,
+															 attempts=0,
+															 next_attempt_datetime=datetime.utcnow(),
+															 created_datetime=datetime.utcnow())
+
+	# An update doesn't change what needs doing if the activity is still to be created or has since been deleted
+	upsert_statement = insert_statement.on_conflict_do_update(
+		index_elements=["object_type", "object_id"],
+		index_where=event_table.c.status == "Queued",
+		set_=dict(aspect_type=case([(insert_statement.excluded.aspect_type == "update", event_table.c.aspect_type)], else_=insert_statement.excluded.aspect_type),
+				  owner_id=insert_statement.excluded.owner_id,
+				  updates=insert_statement.excluded.updates,
+				  event_datetime=insert_statement.excluded.event_datetime,
+				  received_count=event_table.c.received_count + 1))
+
+	db.session.execute(upsert_statement)
+	db.session.commit()
+
+
+def claim_events(limit):
+	# Events for an object that's already being applied are left until it's finished so they're applied in order
+	running_event = aliased(StravaWebhookEvent)
+	events = StravaWebhookEvent.query.filter(StravaWebhookEvent.status.in_(["Queued", "Retrying"])
+		).filter(StravaWebhookEvent.next_attempt_datetime <= datetime.utcnow()
+		).filter(~exists().where(and_(running_event.status == "Running",
+									  running_event.object_type == StravaWebhookEvent.object_type,
+									  running_event.object_id == StravaWebhookEvent.object_id))
+		).order_by(StravaWebhookEvent.id
+		).limit(limit
+		).with_for_update(skip_locked=True
+		).all()
+
+	for event in events:
+		event.status = "Running"
+		event.attempts += 1
+		event.next_attempt_datetime = datetime.utcnow()
+	db.session.commit()
+
+	return events
+
+
+def complete_event(event, message=None):
+	event.status = "Completed"
+	event.last_error = message
+	event.completed_datetime = datetime.utcnow()
+	db.session.commit()
+
+
+def retry_or_fail_event(event, error):
+	event.last_error = str(error)[:1000]
+
+	if event.attempts >= app.config.get("STRAVA_WEBHOOK_MAX_ATTEMPTS", 5):
+		event.status = "Failed"
+	else:
+		event.status = "Retrying"
+		event.next_attempt_datetime = datetime.utcnow() + timedelta(seconds=app.config.get("STRAVA_WEBHOOK_RETRY_SECONDS", 60) * (2 ** (event.attempts - 1)))
+
+	db.session.commit()
+
+
+def delete_activities(user, external_id):
+	activities = Activity.query.with_entities(Activity.id, Activity.start_datetime
+		).filter(Activity.user_id == user.id
+		).filter(Activity.external_source == "Strava"
+		).filter(Activity.external_id == str(external_id)
+		).all()
+	activity_ids = [activity.id for activity in activities]
+
+	if len(activity_ids) == 0:
+		return 0
+
+	rollups.mark_activities_changed(user.id, [activity.start_datetime for activity in activities])
+	response_cache.mark_users_changed([user.id])
+
+	for model in [ActivityCadenceAggregate, ActivityPaceAggregate, ActivityGradientAggregate, ActivityStream, StreamParseJob]:
+		model.query.filter(model.activity_id.in_(activity_ids)).delete(synchronize_session=False)
+	Activity.query.filter(Activity.id.in_(activity_ids)).delete(synchronize_session=False)
+
+	return len(activity_ids)
+
+
+def revoke_access(event, user, strava_client, rate_limiter):
+	# The user says they've revoked our access from their Strava settings, which is only believed once Strava turns
+	# down their stored token
+	access_token = strava_utils.strava_access_token_for(user)
+	if access_token is None:
+		retry_or_fail_event(event, "Couldn't refresh the stored token to check access")
+		return None
+
+	rate_limiter.acquire()
+	strava_client.access_token = access_token
+	try:
+		strava_client.get_athlete()
+	except exc.AccessUnauthorized:
+		user.strava_access_token = None
+		user.strava_refresh_token = None
+		user.strava_access_token_expires_datetime = None
+		complete_event(event)
+		return None
+
+	complete_event(event, "Access is still authorized")
+	return None
+
+
+def apply_event(event, strava_client, rate_limiter):
+	user = User.query.filter(User.strava_athlete_id == event.owner_id).first()
+	if user is None:
+		complete_event(event, "No user connected to Strava athlete {athlete_id}".format(athlete_id=event.owner_id))
+		return None
+
+	if event.object_type == "athlete":
+		if json.loads(event.updates).get("authorized") == "false":
+			return revoke_access(event, user, strava_client, rate_limiter)
+		complete_event(event)
+		return None
+
+	access_token = strava_utils.strava_access_token_for(user)
+	if access_token is None:
+		retry_or_fail_event(event, "Not authorized")
+		return None
+
+	rate_limiter.acquire()
+	strava_client.access_token = access_token
+	try:
+		strava_activity = strava_client.get_activity(event.object_id)
+	except exc.ObjectNotFound:
+		# Deletes are only applied once Strava confirms the activity has gone. Otherwise it's been deleted or made private
+		# since the event was sent, and a delete event will follow if it's gone
+		if event.aspect_type == "delete":
+			delete_activities(user, event.object_id)
+			complete_event(event)
+			return user
+		complete_event(event, "Activity not found")
+		return None
+	except exc.AccessUnauthorized:
+		retry_or_fail_event(event, "Not authorized")
+		return None
+
+	# Including for a delete of an activity that Strava still has, which is then just brought up to date
+
+	# Only this activity is fetched, and stream parsing is queued for it the same way as for a full sync
+	strava_utils.upsert_strava_activities([strava_activity], access_token, user, strava_utils.PlannedActivityMatcher(user))
+	complete_event(event)
+	return user
+
+
+def apply_events(events, strava_client, rate_limiter):
+	updated_users = {}
+
+	for event in events:
+		try:
+			user = apply_event(event, strava_client, rate_limiter)
+		except Exception as e:
+			logging.exception("Error applying Strava webhook event {event_id}".format(event_id=event.id))
+			db.session.rollback()
+			retry_or_fail_event(event, e)
+			continue
+
+		if user is not None:
+			updated_users[user.id] = user
+
+	# Goals only need bringing up to date once per user however many of their activities changed
+	for user in updated_users.values():
+		analysis.evaluate_all_running_goals_for_current_week(user)
+
+	return len(events)
+
+
+def work(exit_when_empty=False, poll_seconds=None, rate_limiter=None):
+	poll_seconds = app.config.get("STRAVA_WEBHOOK_POLL_SECONDS", 5) if poll_seconds is None else poll_seconds
+	rate_limiter = StravaRateLimiter() if rate_limiter is None else rate_limiter
+	strava_client = Client(rate_limiter=rate_limiter)
+	processed_count = 0
+
+	while True:
+		events = claim_events(app.config.get("STRAVA_WEBHOOK_BATCH_SIZE", 50))
+
+		if len(events) == 0:
+			if exit_when_empty:
+				return processed_count
+			time.sleep(poll_seconds)
+			continue
+
+		processed_count += apply_events(events, strava_client, rate_limiter)
+
+
+def reset_stale_events(stale_minutes=30):
+	stale_count = StravaWebhookEvent.query.filter(StravaWebhookEvent.status == "Running"
+		).filter(StravaWebhookEvent.next_attempt_datetime < datetime.utcnow() - timedelta(minutes=stale_minutes)
+		).update({"status": "Retrying"}, synchronize_session=False)
+	db.session.commit()
+	return stale_count
+
+
+def simulated_event(athlete_id, object_id, aspect_type="create", object_type="activity", updates=None):
+	# Same shape as the events Strava posts, see https://developers.strava.com/docs/webhooks/
+	return dict(aspect_type=aspect_type,
+				event_time=int(time.time()),
+				object_id=object_id,
+				object_type=object_type,
+				owner_id=athlete_id,
+				subscription_id=app.config.get("STRAVA_WEBHOOK_SUBSCRIPTION_ID") or 0,
+				updates=updates or {})
@@ -0,0 +1,128 @@
+from multiprocessing import Pool
+import numpy as np
+import logging
+import os
+import time
+
+from app import app, db, analysis, stream_store, bulk_utils, response_cache
+from app.models import Activity, ActivityStream
+
+# Streams are packed end to end into a single data file with an index of where each one starts. Offsets are aligned
+# so that every stream can be viewed straight out of the memory map with its own dtype
+ARCHIVE_INDEX_DTYPE = np.dtype([("activity_id", "<i8"), ("stream_type", "U20"), ("dtype", "U4"), ("offset", "<i8"), ("point_count", "<i8")])
+ARCHIVE_ALIGNMENT = 8
+
+def archive_paths(path):
+	return "{path}.dat".format(path=path), "{path}.idx.npy".format(path=path)
+
+def pack_archive(path, batch_size=1000):
+	data_path, index_path = archive_paths(path)
+	index_entries = []
+	offset = 0
+
+	with open(data_path, "wb") as data_file:
+		for activity_stream in ActivityStream.query.order_by(ActivityStream.activity_id, ActivityStream.stream_type).yield_per(batch_size):
+			values = stream_store.decode_stream(activity_stream.data, activity_stream.dtype)
+			data_file.write(values.tobytes())
+			index_entries.append((activity_stream.activity_id, activity_stream.stream_type, activity_stream.dtype, offset, len(values)))
+
+			offset += values.nbytes
+			padding = -offset % ARCHIVE_ALIGNMENT
+			data_file.write(b"\0" * padding)
+			offset += padding
+
+	np.save(index_path, np.array(index_entries, dtype=ARCHIVE_INDEX_DTYPE))
+	return len(index_entries), offset
+
+
+class StreamArchive:
+	def __init__(self, path):
+		data_path, index_path = archive_paths(path)
+		self.index = np.load(index_path)
+		self.data = np.memmap(data_path, dtype=np.uint8, mode="r") if os.path.getsize(data_path) > 0 else np.empty(0, dtype=np.uint8)
+
+	def activity_ids(self):
+		return np.unique(self.index["activity_id"])
+
+	def streams(self, activity_id):
+		# The index is sorted by activity so each activity's streams are a contiguous slice of it
+		start = np.searchsorted(self.index["activity_id"], activity_id, side="left")
+		end = np.searchsorted(self.index["activity_id"], activity_id, side="right")
+
+		stream_data = {}
+		for entry in self.index[start:end]:
+			dtype = np.dtype(entry["dtype"])
+			offset = int(entry["offset"])
+			stream_data[str(entry["stream_type"])] = self.data[offset:offset + int(entry["point_count"]) * dtype.itemsize].view(dtype)
+
+		return stream_data
+
+
+def reaggregate_activities(archive, activity_ids, skip_gradient_activity_ids=None):
+	skip_gradient_activity_ids = set(skip_gradient_activity_ids) if skip_gradient_activity_ids is not None else set()
+	aggregate_rows = {aggregation["sample_field"]: [] for aggregation in analysis.STREAM_AGGREGATIONS}
+	median_cadences = []
+	reaggregated_activity_ids = []
+
+	for activity_id in activity_ids:
+		stream_data = archive.streams(activity_id)
+		if "time" not in stream_data:
+			continue
+
+		reaggregated_activity_ids.append(int(activity_id))
+		samples = analysis.stream_samples(stream_data)
+		for aggregation in analysis.STREAM_AGGREGATIONS:
+			if aggregation["stream"] not in stream_data:
+				continue
+			if aggregation["sample_field"] == "gradient" and activity_id in skip_gradient_activity_ids:
+				continue
+			aggregate_rows[aggregation["sample_field"]] += [dict(activity_id=int(activity_id), **values) for values in analysis.stream_aggregate_values(samples, aggregation)]
+
+		if "cadence" in stream_data:
+			median_cadences.append(dict(id=int(activity_id), median_cadence=float(np.nanmedian(samples["cadence"]))*2))
+
+	return reaggregated_activity_ids, aggregate_rows, median_cadences
+
+
+def write_aggregates(activity_ids, aggregate_rows, median_cadences):
+	if len(activity_ids) == 0:
+		return
+
+	for aggregation in analysis.STREAM_AGGREGATIONS:
+		bulk_utils.replace_activity_rows(aggregation["model"], activity_ids, aggregate_rows[aggregation["sample_field"]])
+
+	db.session.bulk_update_mappings(Activity, median_cadences)
+	response_cache.mark_users_changed([activity.user_id for activity in Activity.query.with_entities(Activity.user_id).filter(Activity.id.in_(activity_ids)).distinct()])
+	db.session.commit()
+
+
+def reaggregate_chunk(path, activity_ids):
+	archive = StreamArchive(path)
+	activity_ids = [int(activity_id) for activity_id in activity_ids]
+
+	with app.app_context():
+		# Gradient aggregates for activities flagged as having bad elevation data are deliberately left out
+		skip_gradient_activity_ids = [activity.id for activity in Activity.query.with_entities(Activity.id).filter(Activity.id.in_(activity_ids)).filter(Activity.is_bad_elevation_data == True).all()]
+		reaggregated_activity_ids, aggregate_rows, median_cadences = reaggregate_activities(archive, activity_ids, skip_gradient_activity_ids)
+		write_aggregates(reaggregated_activity_ids, aggregate_rows, median_cadences)
+		db.session.remove()
+
+	return len(reaggregated_activity_ids), sum([len(rows) for rows in aggregate_rows.values()])
+
+
+def reaggregate_archive(path, processes=None, chunk_size=200):
+	processes = app.config.get("STREAM_PARSE_WORKER_PROCESSES", os.cpu_count()) if processes is None else processes
+	activity_ids = StreamArchive(path).activity_ids().tolist()
+	chunks = [activity_ids[i:i + chunk_size] for i in range(0, len(activity_ids), chunk_size)]
+	start_time = time.time()
+	activity_count = 0
+	aggregate_count = 0
+
+	with Pool(processes, initializer=bulk_utils.dispose_engine) as pool:
+		for chunk_activity_count, chunk_aggregate_count in pool.starmap(reaggregate_chunk, [(path, chunk) for chunk in chunks]):
+			activity_count += chunk_activity_count
+			aggregate_count += chunk_aggregate_count
+
+	logging.info("Re-aggregated {activities} activities into {aggregates} aggregates in {seconds:.1f}s".format(
+		activities=activity_count, aggregates=aggregate_count, seconds=time.time() - start_time))
+	return activity_count, aggregate_count
@@ -0,0 +1,150 @@
+from datetime import datetime, timedelta
+from multiprocessing import Process
+import logging
+import os
+import time
+
+from app import app, db, analysis, stream_store, strava_utils, bulk_utils
+from app.models import StreamParseJob
+from app.strava_fetch import StravaStreamFetcher, StravaRateLimiter
+
+def claim_jobs(limit):
+	# Skip locked rows so that any number of workers can pull from the same queue without picking up the same job
+	jobs = StreamParseJob.query.filter(StreamParseJob.status.in_(["Queued", "Retrying"])
+		).filter(StreamParseJob.next_attempt_datetime <= datetime.utcnow()
+		).order_by(StreamParseJob.next_attempt_datetime
+		).limit(limit
+		).with_for_update(skip_locked=True
+		).all()
+
+	# next_attempt_datetime doubles up as when the job was claimed while it's running, so stale jobs can be found
+	for job in jobs:
+		job.status = "Running"
+		job.attempts += 1
+		job.next_attempt_datetime = datetime.utcnow()
+	db.session.commit()
+
+	return jobs
+
+
+def access_tokens_for(jobs):
+	# Each owner's stored Strava token, refreshed if it's about to expire, looked up once for all of their jobs in the batch
+	access_tokens = {}
+	for job in jobs:
+		if job.user_id not in access_tokens:
+			access_tokens[job.user_id] = strava_utils.strava_access_token_for(job.owner)
+	return access_tokens
+
+
+def prefetch_streams(jobs, fetcher, access_tokens):
+	# Download streams for the whole batch concurrently so that parse_streams only has to aggregate the stored copies
+	jobs_to_fetch = [job for job in jobs if job.activity.activity_type == "Run" and access_tokens.get(job.user_id) and job.activity.activity_streams.first() is None]
+	fetch_results = fetcher.fetch_all([(job.activity.external_id, access_tokens[job.user_id]) for job in jobs_to_fetch])
+
+	fetch_errors = {}
+	for job, stream_data in zip(jobs_to_fetch, fetch_results):
+		if isinstance(stream_data, dict):
+			stream_store.save_activity_streams(job.activity, stream_data)
+		else:
+			fetch_errors[job.id] = "No activity streams available" if stream_data is None else stream_data
+	db.session.commit()
+
+	return fetch_errors
+
+
+def complete_job(job, result):
+	job.status = "Completed"
+	job.last_error = None if result == "Success" else result
+	job.completed_datetime = datetime.utcnow()
+	db.session.commit()
+
+
+def retry_or_fail_job(job, error):
+	job.last_error = str(error)[:1000]
+
+	if job.attempts >= app.config.get("STREAM_PARSE_MAX_ATTEMPTS", 5):
+		job.status = "Failed"
+	else:
+		# Exponential backoff so that we don't keep hammering Strava while it (or the user's token) is unavailable
+		backoff_seconds = app.config.get("STREAM_PARSE_RETRY_SECONDS", 60) * (2 ** (job.attempts - 1))
+		job.status = "Retrying"
+		job.next_attempt_datetime = datetime.utcnow() + timedelta(seconds=backoff_seconds)
+
+	db.session.commit()
+
+
+def run_job(job, access_token):
+	try:
+		result = analysis.parse_streams(activity=job.activity, strava_access_token=access_token)
+	except Exception as e:
+		logging.exception("Error parsing streams for activity {activity_id}".format(activity_id=job.activity_id))
+		db.session.rollback()
+		retry_or_fail_job(job, e)
+		return
+
+	if result == "Not authorized":
+		retry_or_fail_job(job, result)
+		return
+
+	complete_job(job, result)
+
+	# Once the last of the user's activities has been parsed, bring their running goals up to date with the new data
+	if result == "Success" and job.owner.stream_parse_jobs.filter(StreamParseJob.status.in_(analysis.PENDING_STREAM_PARSE_STATUSES)).count() == 0:
+		analysis.evaluate_all_running_goals_for_current_week(job.owner)
+
+
+def work(exit_when_empty=False, poll_seconds=None, fetcher=None):
+	poll_seconds = app.config.get("STREAM_PARSE_POLL_SECONDS", 5) if poll_seconds is None else poll_seconds
+	fetcher = StravaStreamFetcher() if fetcher is None else fetcher
+	processed_count = 0
+
+	while True:
+		jobs = claim_jobs(app.config.get("STREAM_PARSE_BATCH_SIZE", fetcher.max_workers))
+
+		if len(jobs) == 0:
+			if exit_when_empty:
+				return processed_count
+			time.sleep(poll_seconds)
+			continue
+
+		access_tokens = access_tokens_for(jobs)
+		fetch_errors = prefetch_streams(jobs, fetcher, access_tokens)
+
+		for job in jobs:
+			if fetch_errors.get(job.id) == "No activity streams available":
+				complete_job(job, fetch_errors[job.id])
+			elif job.id in fetch_errors:
+				retry_or_fail_job(job, fetch_errors[job.id])
+			else:
+				run_job(job, access_tokens.get(job.user_id))
+			processed_count += 1
+
+
+def worker_process(exit_when_empty, poll_seconds, processes):
+	bulk_utils.dispose_engine()
+	with app.app_context():
+		# The Strava quota is for the whole app so split it between the worker processes
+		rate_limiter = StravaRateLimiter(short_limit=app.config.get("STRAVA_RATE_LIMIT_15_MIN", 600) // processes,
+										 long_limit=app.config.get("STRAVA_RATE_LIMIT_DAILY", 30000) // processes)
+
+		processed_count = work(exit_when_empty=exit_when_empty, poll_seconds=poll_seconds, fetcher=StravaStreamFetcher(rate_limiter=rate_limiter))
+		logging.info("Stream parse worker {pid} processed {count} jobs".format(pid=os.getpid(), count=processed_count))
+
+
+def run_workers(processes=None, exit_when_empty=False, poll_seconds=None):
+	processes = app.config.get("STREAM_PARSE_WORKER_PROCESSES", os.cpu_count()) if processes is None else processes
+
+	workers = [Process(target=worker_process, args=(exit_when_empty, poll_seconds, processes)) for i in range(processes)]
+	for worker in workers:
+		worker.start()
+	for worker in workers:
+		worker.join()
+
+
+def reset_stale_jobs(stale_minutes=30):
+	# Jobs left as Running by a worker that died part way through get put back on the queue
+	stale_count = StreamParseJob.query.filter(StreamParseJob.status == "Running"
+		).filter(StreamParseJob.next_attempt_datetime < datetime.utcnow() - timedelta(minutes=stale_minutes)
+		).update({"status": "Retrying"}, synchronize_session=False)
+	db.session.commit()
+	return stale_count
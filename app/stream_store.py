@@ -0,0 +1,45 @@
+from datetime import datetime
+import numpy as np
+import zlib
+
+from app import db
+from app.models import ActivityStream
+
+# Little endian so that the stored bytes mean the same thing whatever machine reads them back. Float streams are kept
+# as doubles, the same as Strava's values when parsed, so that aggregates match what the raw samples give
+STREAM_DTYPES = {
+	"time": "<i4",
+	"distance": "<f8",
+	"altitude": "<f8",
+	"velocity_smooth": "<f8",
+	"grade_smooth": "<f8",
+	"cadence": "<i2",
+}
+
+def typed_stream(stream_type, values):
+	return np.asarray(values, dtype=STREAM_DTYPES.get(stream_type, "<f8"))
+
+def encode_stream(values):
+	return zlib.compress(values.tobytes())
+
+def decode_stream(data, dtype):
+	# frombuffer gives a read-only view over the decompressed bytes rather than copying them into a new array
+	return np.frombuffer(zlib.decompress(data), dtype=dtype)
+
+def save_activity_streams(activity, stream_data):
+	activity.activity_streams.delete(synchronize_session=False)
+
+	typed_streams = {}
+	for stream_type, values in stream_data.items():
+		typed_streams[stream_type] = typed_stream(stream_type, values)
+		db.session.add(ActivityStream(activity=activity,
+									  stream_type=stream_type,
+									  dtype=typed_streams[stream_type].dtype.str,
+									  point_count=len(typed_streams[stream_type]),
+									  data=encode_stream(typed_streams[stream_type]),
+									  created_datetime=datetime.utcnow()))
+
+	return typed_streams
+
+def load_activity_streams(activity):
+	return {activity_stream.stream_type: decode_stream(activity_stream.data, activity_stream.dtype) for activity_stream in activity.activity_streams.all()}
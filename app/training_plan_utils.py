@@ -50,7 +50,7 @@ def get_training_plan_generator_inputs(user, target_distance_m, target_race_date
 
     last_4_weeks_inputs = db.session.query(
                                     func.max(Activity.distance).label("longest_distance"),
-                                    func.count(distinct(Activity.start_datetime.cast(db.Date))).label("runs_completed")
+                                    func.count(distinct(Activity.activity_date)).label("runs_completed")
                                 ).filter(Activity.owner == user
                                 ).filter(Activity.activity_type == "Run"
                                 ).filter(Activity.start_datetime >= datetime.today() - timedelta(days=28)
@@ -66,7 +66,7 @@ def get_training_plan_generator_inputs(user, target_distance_m, target_race_date
     current_pb = db.session.query(
                                 Activity.id,
                                 Activity.name,
-                                Activity.start_datetime.cast(db.Date).label("activity_date"),
+                                Activity.activity_date,
                                 Activity.average_speed
                             ).filter(Activity.owner == user
                             ).filter(Activity.activity_type == "Run"
@@ -78,8 +78,8 @@ def get_training_plan_generator_inputs(user, target_distance_m, target_race_date
         pre_pb_long_runs = db.session.query(
                                         func.count(Activity.id).label("runs_above_90pct_distance_count"),
                                         func.max(Activity.distance).label("longest_distance"),
-                                        (current_pb.activity_date - func.min(Activity.start_datetime).cast(db.Date)).label("first_long_run_days_until_race"),
-                                        (current_pb.activity_date - func.max(Activity.start_datetime).cast(db.Date)).label("last_long_run_days_until_race")
+                                        (current_pb.activity_date - func.min(Activity.activity_date)).label("first_long_run_days_until_race"),
+                                        (current_pb.activity_date - func.max(Activity.activity_date)).label("last_long_run_days_until_race")
                                     ).filter(Activity.owner == user
                                     ).filter(Activity.activity_type == "Run"
                                     ).filter(Activity.start_datetime >= current_pb.activity_date - timedelta_to_target_race
@@ -135,6 +135,10 @@ def format_goal_units(goal_metric, value, user):
 def current_year():
 	return datetime.today().year
 
+def week_start_date(day):
+	# Weeks start on a Monday, same as CalendarDay
+	return day - timedelta(days=day.weekday())
+
 def today_formatted():
 	return datetime.today().strftime("%d %B")
 
@@ -0,0 +1,45 @@
+# Times rendering the weekly activity page for a past week and the activity analysis page for one of its runs with the
+# chart cache turned off and on. Needs the database from config.py and cleans up after itself. Google Analytics events
+# aren't sent so that they don't count towards the timings. Run from the project root with:
+# python -m benchmarks.chart_cache_benchmark
+import time
+from datetime import timedelta
+from flask_login import login_user
+from app import app, db, routes, chart_cache
+from app.models import User, Activity
+from app.response_cache import ResponseCache
+from benchmarks.goal_evaluation_benchmark import seed_user, remove_user
+
+WEEKS = 16
+REPEATS = 10
+
+def timed(render_page):
+	started = time.perf_counter()
+	for i in range(REPEATS):
+		render_page()
+	return (time.perf_counter() - started) * 1000 / REPEATS
+
+if __name__ == "__main__":
+	routes.track_event = lambda *args, **kwargs: None
+	with app.app_context():
+		user, current_week = seed_user(weeks=WEEKS, runs_per_week=5)
+		try:
+			past_week = current_week - timedelta(days=7)
+			run = user.activities.filter(Activity.week_start_date == past_week).first()
+			pages = [("weekly activity", lambda: routes.weekly_activity(str(past_week.year), past_week.isoformat())),
+					 ("activity analysis", lambda: routes.activity_analysis(str(run.id)))]
+
+			cached_charts = chart_cache.chart_cache
+			with app.test_request_context():
+				login_user(user)
+				for label, render_page in pages:
+					chart_cache.chart_cache = ResponseCache(None)
+					uncached_time = timed(render_page)
+					chart_cache.chart_cache = cached_charts
+					render_page()
+					cached_time = timed(render_page)
+					print("{label}: {uncached:.1f}ms drawing every chart, {cached:.1f}ms from the chart cache".format(label=label, uncached=uncached_time, cached=cached_time))
+			print(chart_cache.cache_stats())
+		finally:
+			db.session.rollback()
+			remove_user(User.query.get(user.id))
@@ -0,0 +1,101 @@
+# Compares the plans of the old queries that join CalendarDay on func.date(Activity.start_datetime) with the same queries
+# using the stored activity_date and week_start_date columns, on a synthetic dataset of a million activities. Needs the
+# database from config.py (migrated, with calendar_day populated) and cleans up after itself.
+# Run from the project root with: python -m benchmarks.date_columns_benchmark
+import json
+import time
+from datetime import date, timedelta
+from sqlalchemy import func, distinct, case
+from app import app, db, utils, rollups
+from app.models import User, Activity, CalendarDay
+
+USERS = 1000
+ACTIVITIES_PER_USER = 1000
+
+def seed_activities(users, activities_per_user):
+	email_prefix = "date_benchmark_{time}_".format(time=int(time.time()))
+	user_ids = [row.id for row in db.session.execute("""
+		INSERT INTO "user" (email, distance_uom_preference, created_datetime)
+		SELECT :email_prefix || user_number, 'km', now() FROM generate_series(1, :users) user_number
+		RETURNING id""", dict(email_prefix=email_prefix, users=users)).fetchall()]
+
+	# Roughly three activities every day going back a year, and the stored dates worked out the same way as the migration
+	db.session.execute("""
+		INSERT INTO activity (user_id, external_source, external_id, name, start_datetime, activity_date, week_start_date, calendar_year,
+							  activity_type, distance, moving_time, total_elevation_gain, is_race, is_fully_parsed, is_bad_elevation_data,
+							  is_overwritten_elevation_gain, created_datetime)
+		SELECT user_id, 'Benchmark', user_id || '-' || activity_number, 'Activity', start_datetime, start_datetime::date,
+			   date_trunc('week', start_datetime)::date, extract(year from start_datetime),
+			   (array['Run', 'Ride', 'Swim'])[1 + activity_number % 3], 3000 + (activity_number * 7919) % 12000,
+			   interval '1 minute' * (15 + activity_number % 65), activity_number % 200, false, true, false, false, now()
+		FROM (SELECT "user".id AS user_id, activity_number,
+					 date_trunc('day', now())::timestamp - interval '8 hours 17 minutes' * activity_number AS start_datetime
+			  FROM "user" CROSS JOIN generate_series(1, :activities_per_user) activity_number
+			  WHERE "user".id = ANY(:user_ids)) synthetic_activity""", dict(activities_per_user=activities_per_user, user_ids=user_ids))
+	db.session.commit()
+	db.session.execute("ANALYZE activity")
+	db.session.commit()
+	return user_ids
+
+def remove_activities(user_ids):
+	db.session.execute("DELETE FROM activity WHERE user_id = ANY(:user_ids)", dict(user_ids=user_ids))
+	db.session.execute('DELETE FROM "user" WHERE id = ANY(:user_ids)', dict(user_ids=user_ids))
+	db.session.commit()
+
+def explain(query):
+	compiled = query.statement.compile(dialect=db.engine.dialect)
+	plan = db.session.connection().execute("EXPLAIN (ANALYZE, FORMAT JSON) " + str(compiled), compiled.params).scalar()
+	plan = json.loads(plan) if isinstance(plan, str) else plan
+	return plan[0]
+
+def plan_nodes(plan_node):
+	node = plan_node["Node Type"] + (" on {index}".format(index=plan_node["Index Name"]) if "Index Name" in plan_node else
+									 " on {relation}".format(relation=plan_node["Relation Name"]) if "Relation Name" in plan_node else "")
+	return [node] + [child_node for child_plan_node in plan_node.get("Plans", []) for child_node in plan_nodes(child_plan_node)]
+
+def comparisons(user, week):
+	# (description, query before, query after)
+	return [("Activities in a week",
+			 Activity.query.join(CalendarDay, (func.date(Activity.start_datetime) == CalendarDay.calendar_date)
+				).filter(Activity.owner == user
+				).filter(CalendarDay.calendar_week_start_date == week),
+			 user.activities_filtered(week=week)),
+			("Runs today",
+			 Activity.query.filter(Activity.owner == user
+				).filter(Activity.activity_type == "Run"
+				).filter(func.date(Activity.start_datetime) == date.today()),
+			 Activity.query.filter(Activity.owner == user
+				).filter(Activity.activity_type == "Run"
+				).filter(Activity.activity_date == date.today())),
+			("Weekly totals by activity type",
+			 db.session.query(
+					CalendarDay.calendar_week_start_date,
+					CalendarDay.calendar_year,
+					Activity.activity_type,
+					func.count(Activity.id),
+					func.count(distinct(func.date(Activity.start_datetime))),
+					func.sum(Activity.distance),
+					func.sum(case([(Activity.is_bad_elevation_data == False, Activity.total_elevation_gain)]))
+				).join(CalendarDay, func.date(Activity.start_datetime)==CalendarDay.calendar_date
+				).filter(Activity.owner == user
+				).group_by(CalendarDay.calendar_week_start_date, CalendarDay.calendar_year, Activity.activity_type),
+			 rollups.activity_rollups().filter(Activity.owner == user))]
+
+if __name__ == "__main__":
+	with app.app_context():
+		print("Seeding {count} activities...".format(count=USERS * ACTIVITIES_PER_USER))
+		user_ids = seed_activities(USERS, ACTIVITIES_PER_USER)
+		try:
+			user = User.query.get(user_ids[len(user_ids) // 2])
+			week = utils.week_start_date(date.today() - timedelta(days=28))
+			for description, before_query, after_query in comparisons(user, week):
+				print(description)
+				for label, query in [("func.date() and CalendarDay", before_query), ("stored date columns", after_query)]:
+					plan = explain(query)
+					print("  {label}: {execution:.2f}ms to run, {planning:.2f}ms to plan".format(
+						label=label, execution=plan["Execution Time"], planning=plan["Planning Time"]))
+					print("    " + ", ".join(plan_nodes(plan["Plan"])))
+				db.session.rollback()
+		finally:
+			db.session.rollback()
+			remove_activities(user_ids)
@@ -0,0 +1,79 @@
+# A stand-in for the Strava API that can be mounted on a requests session, so that stravalib clients can be pointed at it
+# to test throughput and rate limiting without going near the real thing.
+import json
+import re
+import threading
+import time
+import requests
+from requests.adapters import BaseAdapter
+from benchmarks.parse_streams_benchmark import synthetic_streams
+
+STREAMS_URL_PATTERN = re.compile(r"/api/v3/activities/(?P<activity_id>\d+)/streams/(?P<types>[^?]+)")
+
+class FakeStravaAdapter(BaseAdapter):
+	def __init__(self, latency_seconds=0.05, short_limit=600, long_limit=30000, short_window_seconds=900, duration_seconds=60*60):
+		super(FakeStravaAdapter, self).__init__()
+		self.latency_seconds = latency_seconds
+		self.short_limit = short_limit
+		self.long_limit = long_limit
+		self.short_window_seconds = short_window_seconds
+		self.lock = threading.Lock()
+		self.window_start = time.time() - (time.time() % short_window_seconds)
+		self.short_usage = 0
+		self.long_usage = 0
+		self.request_count = 0
+		self.rate_limited_count = 0
+		self.unauthorized_activity_ids = set()
+		self.streams = synthetic_streams(duration_seconds=duration_seconds)
+
+	def send(self, request, **kwargs):
+		time.sleep(self.latency_seconds)
+
+		with self.lock:
+			now = time.time()
+			if now - self.window_start >= self.short_window_seconds:
+				self.window_start = now - (now % self.short_window_seconds)
+				self.short_usage = 0
+
+			self.request_count += 1
+			self.short_usage += 1
+			self.long_usage += 1
+			is_rate_limited = self.short_usage > self.short_limit or self.long_usage > self.long_limit
+			if is_rate_limited:
+				self.rate_limited_count += 1
+
+			headers = {"Content-Type": "application/json",
+					   "X-RateLimit-Limit": "{short},{long}".format(short=self.short_limit, long=self.long_limit),
+					   "X-RateLimit-Usage": "{short},{long}".format(short=self.short_usage, long=self.long_usage)}
+
+		match = STREAMS_URL_PATTERN.search(request.url)
+		if is_rate_limited:
+			return self.build_response(request, 429, headers, {"message": "Rate Limit Exceeded", "errors": []})
+		elif match is None:
+			return self.build_response(request, 404, headers, {"message": "Record Not Found", "errors": []})
+		elif match.group("activity_id") in self.unauthorized_activity_ids:
+			return self.build_response(request, 401, headers, {"message": "Authorization Error", "errors": []})
+
+		body = [{"type": stream_type, "data": self.streams[stream_type], "series_type": "distance", "original_size": len(self.streams["time"]), "resolution": "high"}
+				for stream_type in requests.utils.unquote(match.group("types")).split(",") if stream_type in self.streams]
+		return self.build_response(request, 200, headers, body)
+
+	def build_response(self, request, status_code, headers, body):
+		response = requests.Response()
+		response.status_code = status_code
+		response.reason = requests.status_codes._codes[status_code][0].upper()
+		response.headers = requests.structures.CaseInsensitiveDict(headers)
+		response._content = json.dumps(body).encode("utf-8")
+		response.encoding = "utf-8"
+		response.url = request.url
+		response.request = request
+		return response
+
+	def close(self):
+		pass
+
+
+def fake_strava_session(adapter):
+	session = requests.Session()
+	session.mount("https://www.strava.com/", adapter)
+	return session
@@ -0,0 +1,166 @@
+# Counts the queries run to evaluate a user's running goals with the batched engine in analysis compared with the original
+# one metric at a time approach, and checks both arrive at the same goal values. Needs the database from config.py and
+# cleans up after itself. Run from the project root with: python -m benchmarks.goal_evaluation_benchmark
+import random
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import event, or_
+from app import app, db, analysis
+from app.models import User, Activity, ActivityCadenceAggregate, ActivityGradientAggregate, TrainingGoal, CalendarDay
+
+GOALS = [("Runs Completed Over Distance", "5", 3),
+		 ("Weekly Distance", None, 40000),
+		 ("Weekly Moving Time", None, 4*60*60),
+		 ("Weekly Elevation Gain", None, 500),
+		 ("Time Spent Above Cadence", "170", 60*60),
+		 ("Distance Climbing Above Gradient", "4", 2000)]
+
+def seed_user(weeks, runs_per_week, seed=1):
+	randomiser = random.Random(seed)
+	user = User(email="goal_benchmark_{time}@example.com".format(time=int(time.time())), distance_uom_preference="km")
+	db.session.add(user)
+
+	current_day = CalendarDay.query.filter(CalendarDay.calendar_date==datetime.date(datetime.today())).first()
+	goal_weeks = [current_day.calendar_week_start_date - timedelta(days=7*i) for i in range(weeks)]
+
+	for week in goal_weeks:
+		for goal_metric, goal_dimension_value, goal_target in GOALS:
+			db.session.add(TrainingGoal(owner=user, goal_period="week", goal_start_date=week, goal_metric=goal_metric,
+										goal_dimension_value=goal_dimension_value, goal_target=goal_target,
+										goal_status="In Progress", current_metric_value=0))
+
+		for i in range(runs_per_week):
+			run = Activity(owner=user, external_source="Benchmark", external_id="{week}-{i}".format(week=week, i=i), name="Run",
+						   start_datetime=datetime.combine(week + timedelta(days=i % 7), datetime.min.time()) + timedelta(hours=7),
+						   activity_type="Run", distance=randomiser.randint(3000, 15000), total_elevation_gain=randomiser.randint(0, 200),
+						   moving_time=timedelta(minutes=randomiser.randint(15, 80)), is_fully_parsed=True)
+			db.session.add(run)
+			seconds_above = 0
+			for cadence in range(190, 150, -2):
+				seconds_at = randomiser.randint(0, 300)
+				seconds_above += seconds_at
+				db.session.add(ActivityCadenceAggregate(activity=run, cadence=cadence, total_seconds_at_cadence=seconds_at, total_seconds_above_cadence=seconds_above))
+			metres_above = 0
+			for gradient in range(12, 1, -1):
+				metres_at = randomiser.randint(0, 200)
+				metres_above += metres_at
+				db.session.add(ActivityGradientAggregate(activity=run, gradient=gradient, total_seconds_at_gradient=metres_at, total_seconds_above_gradient=metres_above,
+														 total_metres_at_gradient=metres_at, total_metres_above_gradient=metres_above))
+
+	db.session.commit()
+	return user, goal_weeks[0]
+
+def remove_user(user):
+	activity_ids = [activity.id for activity in user.activities.all()]
+	for model in [ActivityCadenceAggregate, ActivityGradientAggregate]:
+		model.query.filter(model.activity_id.in_(activity_ids)).delete(synchronize_session=False)
+	Activity.query.filter(Activity.user_id == user.id).delete(synchronize_session=False)
+	TrainingGoal.query.filter(TrainingGoal.user_id == user.id).delete(synchronize_session=False)
+	db.session.delete(user)
+	db.session.commit()
+
+def reset_goals(user):
+	TrainingGoal.query.filter(TrainingGoal.user_id == user.id).update({"current_metric_value": 0, "goal_status": "In Progress"}, synchronize_session=False)
+	db.session.commit()
+
+def goal_values(user):
+	return sorted([(goal.goal_start_date, goal.goal_metric, float(goal.current_metric_value), goal.goal_status) for goal in user.training_goals.all()])
+
+# The original evaluation, one metric at a time with the stream parsing step left out as the seeded runs are all parsed
+def legacy_evaluate_running_goals(week, goal_metric, calculate_weekly_aggregations_function, user):
+	current_goals = user.training_goals.filter(or_(TrainingGoal.goal_start_date == week, TrainingGoal.goal_status == "In Progress")).filter_by(goal_metric=goal_metric).all()
+
+	weeks_to_evaluate = []
+	[weeks_to_evaluate.append(goal.goal_start_date) for goal in current_goals if goal.goal_start_date not in weeks_to_evaluate]
+
+	for week in weeks_to_evaluate:
+		run_activities = user.activities_filtered(activity_type="Run", week=week).all()
+		weekly_goals = user.training_goals.filter_by(goal_start_date=week).filter_by(goal_metric=goal_metric).all()
+
+		for run in run_activities:
+			if not run.is_fully_parsed:
+				pass
+
+		if goal_metric == "Runs Completed Over Distance":
+			for goal in weekly_goals:
+				distance_multiplier = 1609.344 if user.distance_uom_preference == "miles" else 1000
+				activities_over_distance = [activity for activity in run_activities if activity.distance >= int(goal.goal_dimension_value)*distance_multiplier]
+				goal.current_metric_value = len(activities_over_distance)
+				if goal.current_metric_value >= goal.goal_target:
+					goal.goal_status = "Successful"
+				if goal.goal_start_date + timedelta(days=7) < datetime.date(datetime.utcnow()) and goal.current_metric_value < goal.goal_target:
+					goal.goal_status = "Missed"
+
+		if goal_metric in (["Weekly Distance", "Weekly Moving Time", "Weekly Elevation Gain"]):
+			for goal in weekly_goals:
+				weekly_summary_stats = user.weekly_activity_type_stats(week=week).filter(Activity.activity_type=="Run").all()
+				for row in weekly_summary_stats:
+					if goal_metric == "Weekly Distance":
+						goal.current_metric_value = row.total_distance
+					elif goal_metric == "Weekly Moving Time":
+						goal.current_metric_value = row.total_moving_time.seconds
+					elif goal_metric == "Weekly Elevation Gain":
+						goal.current_metric_value = row.total_elevation_gain
+				if goal.current_metric_value >= goal.goal_target:
+					goal.goal_status = "Successful"
+				if goal.goal_start_date + timedelta(days=7) < datetime.date(datetime.utcnow()) and goal.current_metric_value < goal.goal_target:
+					goal.goal_status = "Missed"
+
+		elif goal_metric in (["Time Spent Above Cadence", "Distance Climbing Above Gradient"]):
+			weekly_aggregations = calculate_weekly_aggregations_function(week, user)
+			for goal in weekly_goals:
+				goal_dimension_value = int(goal.goal_dimension_value)
+				for aggregate in weekly_aggregations["summary"]:
+					if aggregate.get_dimension_value() == goal_dimension_value:
+						goal.current_metric_value = aggregate.get_metric_value()
+						if goal.current_metric_value >= goal.goal_target:
+							goal.goal_status = "Successful"
+				if goal.goal_start_date + timedelta(days=7) < datetime.date(datetime.utcnow()) and goal.current_metric_value < goal.goal_target:
+					goal.goal_status = "Missed"
+
+	db.session.commit()
+
+def legacy_evaluate_all_running_goals(week, user):
+	legacy_evaluate_running_goals(week, "Runs Completed Over Distance", None, user)
+	legacy_evaluate_running_goals(week, "Weekly Distance", None, user)
+	legacy_evaluate_running_goals(week, "Weekly Moving Time", None, user)
+	legacy_evaluate_running_goals(week, "Weekly Elevation Gain", None, user)
+	legacy_evaluate_running_goals(week, "Time Spent Above Cadence", analysis.calculate_weekly_cadence_aggregations, user)
+	legacy_evaluate_running_goals(week, "Distance Climbing Above Gradient", analysis.calculate_weekly_gradient_aggregations, user)
+
+class QueryCounter:
+	def __init__(self, engine):
+		self.engine = engine
+		self.count = 0
+
+	def count_query(self, *args):
+		self.count += 1
+
+	def __enter__(self):
+		event.listen(self.engine, "before_cursor_execute", self.count_query)
+		return self
+
+	def __exit__(self, *args):
+		event.remove(self.engine, "before_cursor_execute", self.count_query)
+
+def measure(evaluate, user):
+	reset_goals(user)
+	db.session.expire_all()
+	start_time = time.time()
+	with QueryCounter(db.engine) as counter:
+		evaluate()
+	return counter.count, time.time() - start_time, goal_values(user)
+
+if __name__ == "__main__":
+	with app.app_context():
+		for weeks in [1, 4, 12]:
+			user, current_week = seed_user(weeks=weeks, runs_per_week=5)
+			try:
+				legacy_queries, legacy_seconds, legacy_goals = measure(lambda: legacy_evaluate_all_running_goals(current_week, user), user)
+				batched_queries, batched_seconds, batched_goals = measure(lambda: analysis.evaluate_running_goals(week=current_week, user=user), user)
+
+				assert legacy_goals == batched_goals, "Goal values differ between one metric at a time and batched evaluation"
+				print("{weeks} weeks of in progress goals: {legacy_queries} queries in {legacy:.3f}s one metric at a time, {batched_queries} queries in {batched:.3f}s batched".format(
+					weeks=weeks, legacy_queries=legacy_queries, legacy=legacy_seconds, batched_queries=batched_queries, batched=batched_seconds))
+			finally:
+				remove_user(user)
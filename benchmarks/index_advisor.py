@@ -0,0 +1,88 @@
+# Replays the queries run by each of User's query methods and reports any sequential scans in their plans. The seeded
+# data is far too small for the planner to prefer an index on its own, so the plans are worked out with enable_seqscan
+# turned off, which leaves a Seq Scan only where there's no usable index at all. Needs the database from config.py.
+# Run from the project root with: python -m benchmarks.index_advisor [user_id]
+# Without a user_id a user is seeded with benchmarks.goal_evaluation_benchmark and removed again afterwards.
+import calendar
+import inspect
+import json
+import sys
+from datetime import date, timedelta
+from sqlalchemy import event
+from sqlalchemy.orm import Query
+from app import app, db, utils
+from app.models import User
+from benchmarks.goal_evaluation_benchmark import seed_user, remove_user
+
+# Not query methods, or need more than a user to run
+SKIPPED_METHODS = ["load_user", "generate_hash", "verify_password", "get_reset_password_token", "verify_reset_password_token"]
+
+def method_arguments():
+	week = utils.week_start_date(date.today())
+	return dict(selected_date=date.today(), scheduled_day=calendar.day_abbr[date.today().weekday()], week=week, year=date.today().year,
+				startDate=week, endDate=week + timedelta(days=6), start_date=week - timedelta(weeks=12), end_date=week + timedelta(days=6))
+
+def query_methods():
+	return [(name, method) for name, method in sorted(User.__dict__.items())
+			if inspect.isfunction(method) and not name.startswith("_") and name not in SKIPPED_METHODS]
+
+def captured_statements(method, user, arguments):
+	statements = []
+	def capture(conn, cursor, statement, parameters, context, executemany):
+		if statement.lstrip().upper().startswith("SELECT"):
+			statements.append((statement, parameters))
+
+	parameter_names = list(inspect.signature(method).parameters)[1:]
+	event.listen(db.engine, "before_cursor_execute", capture)
+	try:
+		result = method(user, **dict([(name, arguments[name]) for name in parameter_names if name in arguments]))
+		if isinstance(result, Query):
+			result.all()
+	finally:
+		event.remove(db.engine, "before_cursor_execute", capture)
+	return statements
+
+def sequential_scans(plan_node):
+	scans = []
+	if plan_node["Node Type"] == "Seq Scan":
+		scans.append("{relation}{filter}".format(relation=plan_node["Relation Name"],
+												 filter=" filtering on {filter}".format(filter=plan_node["Filter"]) if "Filter" in plan_node else ""))
+	for child_plan_node in plan_node.get("Plans", []):
+		scans += sequential_scans(child_plan_node)
+	return scans
+
+def explain(statement, parameters):
+	connection = db.session.connection()
+	connection.execute("SET LOCAL enable_seqscan = off")
+	plan = connection.execute("EXPLAIN (FORMAT JSON) " + statement, parameters).scalar()
+	plan = json.loads(plan) if isinstance(plan, str) else plan
+	return plan[0]["Plan"]
+
+def advise(user):
+	arguments = method_arguments()
+	for name, method in query_methods():
+		try:
+			statements = captured_statements(method, user, arguments)
+		except Exception as e:
+			db.session.rollback()
+			print("{name}: couldn't be replayed ({error})".format(name=name, error=e))
+			continue
+
+		scans = []
+		for statement, parameters in statements:
+			scans += [scan for scan in sequential_scans(explain(statement, parameters)) if scan not in scans]
+		db.session.rollback()
+
+		print("{name}: {count} queries, {result}".format(name=name, count=len(statements),
+															 result="sequential scans of " + "; ".join(scans) if scans else "no sequential scans"))
+
+if __name__ == "__main__":
+	with app.app_context():
+		if len(sys.argv) > 1:
+			advise(User.query.get(int(sys.argv[1])))
+		else:
+			user, current_week = seed_user(weeks=12, runs_per_week=5)
+			try:
+				advise(user)
+			finally:
+				remove_user(user)
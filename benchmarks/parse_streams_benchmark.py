@@ -0,0 +1,139 @@
+# Compares the columnar stream parsing and histogram aggregation in analysis with the original row by row approach.
+# Run from the project root with: python -m benchmarks.parse_streams_benchmark
+import math
+import timeit
+import numpy as np
+import pandas as pd
+from app import utils
+from app.analysis import stream_samples, stream_aggregate_values, STREAM_AGGREGATIONS
+
+def synthetic_streams(duration_seconds=3*60*60, seed=1):
+	random = np.random.RandomState(seed)
+
+	# Mostly 1 second recording with the odd gap and a few long stops at traffic lights
+	intervals = random.choice([1, 1, 1, 1, 2, 3], size=duration_seconds)
+	intervals[random.randint(0, duration_seconds, size=20)] = random.randint(11, 90, size=20)
+	time_data = np.cumsum(intervals) - intervals[0]
+
+	velocity = np.clip(random.normal(3.2, 0.4, size=duration_seconds), 0, None)
+	velocity[random.randint(0, duration_seconds, size=50)] = 0
+	distance = np.cumsum(velocity * intervals)
+	altitude = 50 + np.cumsum(random.normal(0, 0.3, size=duration_seconds))
+	grade_smooth = np.round(random.normal(0, 4, size=duration_seconds), 1)
+	cadence = random.randint(78, 95, size=duration_seconds)
+
+	return dict(time=time_data.tolist(),
+				distance=np.round(distance, 1).tolist(),
+				altitude=np.round(altitude, 1).tolist(),
+				velocity_smooth=np.round(velocity, 3).tolist(),
+				grade_smooth=grade_smooth.tolist(),
+				cadence=cadence.tolist())
+
+def legacy_data_points(stream_data):
+	data_points_df = pd.DataFrame(columns=["start_time", "duration", "distance_travelled", "elevation_gained", "pace_seconds", "cadence", "gradient"])
+	dp_ind = 0
+	df_ind = 0
+
+	for time_data_point in stream_data["time"]:
+		if dp_ind > 1:
+			duration = (time_data_point - stream_data["time"][dp_ind-1])
+			distance_travelled = (stream_data["distance"][dp_ind] - stream_data["distance"][dp_ind-1])
+			elevation_gained = (stream_data["altitude"][dp_ind] - stream_data["altitude"][dp_ind-1]) if "altitude" in stream_data else None
+			pace_seconds = math.ceil(utils.convert_mps_to_km_pace(stream_data["velocity_smooth"][dp_ind]).total_seconds() / 5) * 5 if "velocity_smooth" in stream_data and stream_data["velocity_smooth"][dp_ind] > 0 else None
+			gradient = math.floor(stream_data["grade_smooth"][dp_ind]) if "grade_smooth" in stream_data else None
+
+			gradient = None if time_data_point < 60 and gradient > 10 else gradient
+			elevation_gained = None if elevation_gained and ((time_data_point < 60 and elevation_gained > 1) or elevation_gained < 0) else elevation_gained
+
+			if duration <= 10:
+				data_points_df.loc[df_ind] = [stream_data["time"][dp_ind-1],
+											  duration,
+											  distance_travelled,
+											  elevation_gained,
+											  pace_seconds,
+											  stream_data["cadence"][dp_ind] if "cadence" in stream_data else None,
+											  gradient]
+				df_ind += 1
+		dp_ind += 1
+
+	return data_points_df
+
+def legacy_aggregate_stream_data(data_points_df, groupby_field, sort_order="DESC"):
+	duration_aggregation = data_points_df.groupby([groupby_field])["duration"].sum()
+	distance_aggregation = data_points_df.groupby([groupby_field])["distance_travelled"].sum().round(decimals=1)
+	grouped_data = list(zip(duration_aggregation.index, duration_aggregation, distance_aggregation))
+
+	if sort_order == "DESC":
+		grouped_data.reverse()
+
+	return grouped_data
+
+def legacy_aggregates(stream_data):
+	data_points_df = legacy_data_points(stream_data)
+	aggregates = dict(cadence=[], pace_seconds=[], gradient=[])
+
+	running_total = 0
+	this_aggregate_total = 0
+	for cadence_group in legacy_aggregate_stream_data(data_points_df, groupby_field="cadence"):
+		running_total += cadence_group[1]
+		this_aggregate_total += cadence_group[1]
+		if this_aggregate_total > 10:
+			aggregates["cadence"].append((cadence_group[0]*2, this_aggregate_total, running_total))
+			this_aggregate_total = 0
+
+	running_total = 0
+	this_aggregate_total = 0
+	for pace_group in legacy_aggregate_stream_data(data_points_df, groupby_field="pace_seconds", sort_order="ASC"):
+		running_total += pace_group[1]
+		this_aggregate_total += pace_group[1]
+		if this_aggregate_total > 10:
+			aggregates["pace_seconds"].append((pace_group[0], this_aggregate_total, running_total))
+			this_aggregate_total = 0
+
+	running_total_duration = 0
+	running_total_distance = 0
+	this_aggregate_total_duration = 0
+	this_aggregate_total_distance = 0
+	for gradient_group in legacy_aggregate_stream_data(data_points_df, groupby_field="gradient"):
+		running_total_duration += gradient_group[1]
+		running_total_distance += gradient_group[2]
+		this_aggregate_total_duration += gradient_group[1]
+		this_aggregate_total_distance += gradient_group[2]
+		if gradient_group[0] < 2:
+			break
+		if this_aggregate_total_duration > 5:
+			aggregates["gradient"].append((gradient_group[0], this_aggregate_total_duration, running_total_duration,
+										   round(this_aggregate_total_distance, 6), round(running_total_distance, 6)))
+			this_aggregate_total_duration = 0
+			this_aggregate_total_distance = 0
+
+	aggregates["elevation_gain"] = round(float(data_points_df["elevation_gained"].sum()), 6)
+	aggregates["median_cadence"] = float(data_points_df["cadence"].median())*2
+	return aggregates
+
+def columnar_aggregates(stream_data):
+	samples = stream_samples(stream_data)
+	aggregates = dict(cadence=[], pace_seconds=[], gradient=[])
+
+	for aggregation in STREAM_AGGREGATIONS:
+		for aggregate_values in stream_aggregate_values(samples, aggregation):
+			values = tuple(aggregate_values[column] for column in aggregation["columns"].values())
+			values = values[:3] + tuple(round(value, 6) for value in values[3:])
+			aggregates[aggregation["sample_field"]].append(values)
+
+	aggregates["elevation_gain"] = round(float(np.nansum(samples["elevation_gained"])), 6)
+	aggregates["median_cadence"] = float(np.nanmedian(samples["cadence"]))*2
+	return aggregates
+
+if __name__ == "__main__":
+	stream_data = synthetic_streams()
+	print("Synthetic run with {points} data points".format(points=len(stream_data["time"])))
+
+	assert legacy_aggregates(stream_data) == columnar_aggregates(stream_data), "Aggregates differ between row by row and columnar parsing"
+	print("Cadence, pace and gradient aggregates are identical")
+
+	legacy_seconds = timeit.timeit(lambda: legacy_aggregates(stream_data), number=1)
+	columnar_seconds = min(timeit.repeat(lambda: columnar_aggregates(stream_data), number=1, repeat=5))
+	print("Row by row: {legacy:.3f}s, columnar: {columnar:.4f}s, speedup: {speedup:.0f}x".format(legacy=legacy_seconds,
+																					 columnar=columnar_seconds,
+																					 speedup=legacy_seconds/columnar_seconds))
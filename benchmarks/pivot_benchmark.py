@@ -0,0 +1,67 @@
+# Compares pivoting category chart rows with pivot_utils against the pandas read_sql, pivot and fillna(0) that dataviz
+# used to do, on synthetic rows shaped like exercises_by_category_and_day and weekly_activity_summary. Doesn't need the
+# database. Run from the project root with:
+# python -m benchmarks.pivot_benchmark
+import random
+import subprocess
+import sys
+import time
+from datetime import date, timedelta
+import numpy as np
+import pandas as pd
+from app.pivot_utils import pivot_rows
+
+CATEGORIES = ["cat_green", "cat_green_outline", "cat_blue", "cat_blue_outline", "cat_red", "cat_red_outline", "cat_yellow", "cat_yellow_outline", "Uncategorised"]
+KEYS = ["day", "category_key", "total"]
+REPEATS = 200
+
+def synthetic_rows(days, categories):
+	start = date(2019, 1, 7)
+	rows = []
+	for day_number in range(days):
+		for category_key in random.sample(CATEGORIES[:categories], random.randint(1, categories)):
+			rows.append((start + timedelta(days=day_number), category_key, random.randint(1, 50) if random.random() > 0.05 else None))
+	random.shuffle(rows)
+	return rows
+
+
+def pandas_pivot(rows, cumulative):
+	data = pd.DataFrame.from_records(rows, columns=KEYS).pivot(index="day", columns="category_key", values="total").fillna(0)
+	return data.cumsum() if cumulative else data
+
+
+def timed(pivot):
+	started = time.perf_counter()
+	for i in range(REPEATS):
+		pivot()
+	return (time.perf_counter() - started) * 1000000 / REPEATS
+
+
+def pandas_import_time():
+	# In a fresh interpreter, as that's what a worker pays the first time a chart is drawn
+	started = time.perf_counter()
+	subprocess.check_call([sys.executable, "-c", "import pandas"])
+	pandas_started = time.perf_counter() - started
+	started = time.perf_counter()
+	subprocess.check_call([sys.executable, "-c", "pass"])
+	return (pandas_started - (time.perf_counter() - started)) * 1000
+
+if __name__ == "__main__":
+	random.seed(1)
+	for label, days, categories in [("one week", 7, 9), ("one year of weeks", 52, 9), ("ten years of days", 3650, 9)]:
+		rows = synthetic_rows(days, categories)
+		for cumulative in [False, True]:
+			expected = pandas_pivot(rows, cumulative)
+			pivot = pivot_rows(rows, KEYS, "day", "category_key", "total", cumulative=cumulative)
+			assert list(pivot.index) == list(expected.index)
+			for category_key, column in pivot.columns.items():
+				assert np.allclose(column, expected[category_key].values)
+
+			pandas_time = timed(lambda: pandas_pivot(rows, cumulative))
+			pivot_time = timed(lambda: pivot_rows(rows, KEYS, "day", "category_key", "total", cumulative=cumulative))
+			print("{label} ({rows} rows{cumulative}): {pandas:.0f}us with pandas, {pivot:.0f}us with pivot_utils".format(label=label,
+																														 rows=len(rows),
+																														 cumulative=", cumulative" if cumulative else "",
+																														 pandas=pandas_time,
+																														 pivot=pivot_time))
+	print("importing pandas: {import_time:.0f}ms".format(import_time=pandas_import_time()))
@@ -0,0 +1,215 @@
+# Checks app.plan_expander against the original CalendarDay OR-join queries and the plan_occurrence table on randomly
+# generated plans (random recurrence, planning periods, skipped dates and completions, queried over random date ranges),
+# then times the join against the expander over 52 weeks. Fails if any range differs. Needs the database from config.py
+# (migrated, with calendar_day populated) and cleans up after itself. benchmarks.plan_expander_checks covers the date
+# handling without the database.
+# Run from the project root with: python -m benchmarks.plan_expander_benchmark [plans to check]
+import calendar
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+from sqlalchemy import and_, or_, func
+from app import app, db
+from app.models import User, Activity, Exercise, ExerciseCategory, ExerciseType, CalendarDay, ScheduledActivity, ScheduledActivitySkippedDate, ScheduledExercise, ScheduledExerciseSkippedDate, PlanOccurrence
+from app.plan_expander import PlanExpander
+
+PLANS_TO_CHECK = 20
+RANGES_PER_PLAN = 10
+TIMING_REPEATS = 20
+
+# The queries as they were before plan_occurrence, expanding the plan by joining CalendarDay on either date or day
+def legacy_planned_activities(user, startDate, endDate):
+	return db.session.query(
+						ScheduledActivity.id,
+						ScheduledActivity.planning_period,
+						ScheduledActivity.recurrence,
+						CalendarDay.calendar_date.label("planned_date"),
+						ScheduledActivity.activity_type,
+						ScheduledActivity.activity_subtype,
+						ScheduledActivity.scheduled_day,
+						ScheduledActivity.description,
+						ScheduledActivity.planned_distance,
+						ExerciseCategory.category_key
+			).join(CalendarDay, or_(ScheduledActivity.scheduled_date==CalendarDay.calendar_date, ScheduledActivity.scheduled_day==CalendarDay.day_of_week)
+			).outerjoin(ExerciseCategory, and_(ScheduledActivity.activity_type==ExerciseCategory.category_name, ExerciseCategory.user_id==ScheduledActivity.user_id)
+			).outerjoin(ScheduledActivitySkippedDate, and_(ScheduledActivity.id==ScheduledActivitySkippedDate.scheduled_activity_id, CalendarDay.calendar_date==ScheduledActivitySkippedDate.skipped_date)
+			).outerjoin(Activity, and_((ScheduledActivity.id == Activity.scheduled_activity_id),
+									   or_(Activity.activity_date == CalendarDay.calendar_date,
+											and_(ScheduledActivity.planning_period=="week", Activity.activity_date >= CalendarDay.calendar_week_start_date)))
+			).filter(ScheduledActivity.owner == user
+			).filter(ScheduledActivity.is_removed == False
+			).filter(ScheduledActivitySkippedDate.id == None
+			).filter(Activity.id == None
+			).filter(or_(CalendarDay.calendar_date >= date.today(), and_(ScheduledActivity.planning_period=="week", CalendarDay.calendar_date >= (date.today() - timedelta(days=6))))
+			).filter(CalendarDay.calendar_date >= startDate
+			).filter(CalendarDay.calendar_date <= endDate
+			).order_by(ScheduledActivity.id)
+
+def legacy_planned_exercises(user, startDate, endDate):
+	return db.session.query(
+						ScheduledExercise.id,
+						ScheduledExercise.exercise_type_id,
+						ExerciseType.name.label("exercise_name"),
+						ScheduledExercise.planning_period,
+						ScheduledExercise.recurrence,
+						CalendarDay.calendar_date.label("planned_date"),
+						func.coalesce(ExerciseCategory.category_name, "Uncategorised").label("category_name"),
+						ScheduledExercise.scheduled_day,
+						ScheduledExercise.sets,
+						ExerciseType.measured_by,
+						ScheduledExercise.reps,
+						ScheduledExercise.seconds,
+						func.coalesce(ExerciseCategory.category_key, "uncategorised").label("category_key"),
+						func.count(Exercise.id).label("completed_sets")
+			).join(CalendarDay, or_(ScheduledExercise.scheduled_date==CalendarDay.calendar_date, ScheduledExercise.scheduled_day == CalendarDay.day_of_week)
+			).join(ExerciseType, (ExerciseType.id == ScheduledExercise.exercise_type_id)
+			).outerjoin(ExerciseCategory, ExerciseCategory.id == ExerciseType.exercise_category_id
+			).outerjoin(ScheduledExerciseSkippedDate, and_(ScheduledExercise.id==ScheduledExerciseSkippedDate.scheduled_exercise_id, CalendarDay.calendar_date==ScheduledExerciseSkippedDate.skipped_date)
+			).outerjoin(Exercise, and_((ScheduledExercise.id == Exercise.scheduled_exercise_id),
+									   Exercise.exercise_date >= CalendarDay.calendar_date,
+									   Exercise.exercise_date <= CalendarDay.calendar_date + timedelta(days=6))
+			).filter(ExerciseType.owner == user
+			).filter(ScheduledExercise.is_removed == False
+			).filter(ScheduledExerciseSkippedDate.id == None
+			).filter(or_(CalendarDay.calendar_date >= date.today(), and_(ScheduledExercise.planning_period=="week", CalendarDay.calendar_date >= (date.today() - timedelta(days=6))))
+			).filter(CalendarDay.calendar_date >= startDate
+			).filter(CalendarDay.calendar_date <= endDate
+			).group_by(
+					ScheduledExercise.id,
+					ScheduledExercise.exercise_type_id,
+					ExerciseType.name,
+					ScheduledExercise.planning_period,
+					ScheduledExercise.recurrence,
+					CalendarDay.calendar_date,
+					ExerciseCategory.category_name,
+					ScheduledExercise.scheduled_day,
+					ScheduledExercise.sets,
+					ExerciseType.measured_by,
+					ScheduledExercise.reps,
+					ScheduledExercise.seconds,
+					ExerciseCategory.category_key
+			).having((ScheduledExercise.sets - func.count(Exercise.id)) > 0)
+
+def random_day(randomiser, first_offset, last_offset):
+	return date.today() + timedelta(days=randomiser.randint(first_offset, last_offset))
+
+def random_schedule(randomiser):
+	# (recurrence, scheduled_date, scheduled_day), including the odd plan with both a date and a different day
+	recurrence = randomiser.choice(["weekly", "once", "once", "both"])
+	scheduled_date = random_day(randomiser, -21, 120) if recurrence != "weekly" else None
+	scheduled_day = randomiser.choice(list(calendar.day_abbr)) if recurrence != "once" else None
+	return ("weekly" if recurrence == "both" else recurrence), scheduled_date, scheduled_day
+
+def seed_plan(scheduled_items, seed):
+	randomiser = random.Random(seed)
+	user = User(email="plan_benchmark_{seed}_{time}@example.com".format(seed=seed, time=int(time.time())), distance_uom_preference="km")
+	db.session.add(user)
+	category = ExerciseCategory(owner=user, category_name="Run", category_key="cat1")
+	db.session.add(category)
+	exercise_types = [ExerciseType(owner=user, name="Exercise {i}".format(i=i), measured_by=randomiser.choice(["reps", "seconds"]),
+								   exercise_category=category if i % 2 == 0 else None) for i in range(3)]
+	db.session.add_all(exercise_types)
+
+	for i in range(scheduled_items):
+		recurrence, scheduled_date, scheduled_day = random_schedule(randomiser)
+		scheduled_activity = ScheduledActivity(owner=user, activity_type=randomiser.choice(["Run", "Ride"]), activity_subtype=None,
+											   planning_period=randomiser.choice(["day", "week"]), recurrence=recurrence,
+											   scheduled_date=scheduled_date, scheduled_day=scheduled_day, description="Activity {i}".format(i=i),
+											   planned_distance=randomiser.randint(1000, 20000), is_removed=randomiser.random() < 0.1)
+		db.session.add(scheduled_activity)
+		for j in range(randomiser.randint(0, 3)):
+			db.session.add(ScheduledActivitySkippedDate(scheduled_activity=scheduled_activity, skipped_date=scheduled_date if scheduled_date and j == 0 else random_day(randomiser, -7, 60)))
+		for j in range(randomiser.randint(0, 3)):
+			db.session.add(Activity(owner=user, scheduled_activity=scheduled_activity, external_source="Benchmark", external_id="{i}-{j}".format(i=i, j=j),
+									name="Activity", activity_type=scheduled_activity.activity_type, distance=5000, moving_time=timedelta(minutes=30),
+									start_datetime=datetime.combine(random_day(randomiser, -14, 60), datetime.min.time()) + timedelta(hours=7)))
+
+		recurrence, scheduled_date, scheduled_day = random_schedule(randomiser)
+		scheduled_exercise = ScheduledExercise(type=randomiser.choice(exercise_types), planning_period=randomiser.choice(["day", "week"]),
+											   recurrence=recurrence, scheduled_date=scheduled_date, scheduled_day=scheduled_day,
+											   sets=randomiser.choice([None, 1, 2, 3, 5]), reps=10, seconds=None, is_removed=randomiser.random() < 0.1)
+		db.session.add(scheduled_exercise)
+		for j in range(randomiser.randint(0, 3)):
+			db.session.add(ScheduledExerciseSkippedDate(scheduled_exercise=scheduled_exercise, skipped_date=random_day(randomiser, -7, 60)))
+		for j in range(randomiser.randint(0, 8)):
+			db.session.add(Exercise(type=scheduled_exercise.type, scheduled_exercise=scheduled_exercise, reps=10,
+									exercise_datetime=datetime.combine(random_day(randomiser, -14, 60), datetime.min.time()) + timedelta(hours=18)))
+
+	db.session.commit()
+	return user
+
+def remove_plan(user):
+	scheduled_activity_ids = [row.id for row in ScheduledActivity.query.filter(ScheduledActivity.user_id == user.id).all()]
+	exercise_type_ids = [row.id for row in ExerciseType.query.filter(ExerciseType.user_id == user.id).all()]
+	scheduled_exercise_ids = [row.id for row in ScheduledExercise.query.filter(ScheduledExercise.exercise_type_id.in_(exercise_type_ids)).all()]
+	Activity.query.filter(Activity.user_id == user.id).delete(synchronize_session=False)
+	Exercise.query.filter(Exercise.exercise_type_id.in_(exercise_type_ids)).delete(synchronize_session=False)
+	ScheduledActivitySkippedDate.query.filter(ScheduledActivitySkippedDate.scheduled_activity_id.in_(scheduled_activity_ids)).delete(synchronize_session=False)
+	ScheduledExerciseSkippedDate.query.filter(ScheduledExerciseSkippedDate.scheduled_exercise_id.in_(scheduled_exercise_ids)).delete(synchronize_session=False)
+	PlanOccurrence.query.filter(PlanOccurrence.user_id == user.id).delete(synchronize_session=False)
+	ScheduledActivity.query.filter(ScheduledActivity.user_id == user.id).delete(synchronize_session=False)
+	ScheduledExercise.query.filter(ScheduledExercise.exercise_type_id.in_(exercise_type_ids)).delete(synchronize_session=False)
+	ExerciseType.query.filter(ExerciseType.user_id == user.id).delete(synchronize_session=False)
+	ExerciseCategory.query.filter(ExerciseCategory.user_id == user.id).delete(synchronize_session=False)
+	db.session.delete(user)
+	db.session.commit()
+
+def rows(results):
+	return sorted([tuple(row) for row in results])
+
+def check_plan(user, randomiser):
+	expander = PlanExpander(user)
+	mismatches = 0
+	for i in range(RANGES_PER_PLAN):
+		start_date = random_day(randomiser, -14, 90)
+		end_date = start_date + timedelta(days=randomiser.choice([0, 6, 27, 90]))
+		expected_activities = rows(legacy_planned_activities(user, start_date, end_date).all())
+		expected_exercises = rows(legacy_planned_exercises(user, start_date, end_date).all())
+		candidates = [("expander", rows(expander.planned_activities(start_date, end_date)), rows(expander.planned_exercises(start_date, end_date)))]
+		if user.plan_occurrences_until is not None and end_date <= user.plan_occurrences_until:
+			candidates.append(("plan_occurrence", rows(user.planned_activities_filtered(start_date, end_date).all()), rows(user.planned_exercises_filtered(start_date, end_date).all())))
+		for label, activities, exercises in candidates:
+			if activities != expected_activities or exercises != expected_exercises:
+				mismatches += 1
+				print("  {label} differs from the join for {start} to {end}".format(label=label, start=start_date, end=end_date))
+				print("    activities only in the join: {rows}".format(rows=[row for row in expected_activities if row not in activities]))
+				print("    activities only in {label}: {rows}".format(label=label, rows=[row for row in activities if row not in expected_activities]))
+				print("    exercises only in the join: {rows}".format(rows=[row for row in expected_exercises if row not in exercises]))
+				print("    exercises only in {label}: {rows}".format(label=label, rows=[row for row in exercises if row not in expected_exercises]))
+	return mismatches
+
+def timed(function):
+	started = time.perf_counter()
+	for i in range(TIMING_REPEATS):
+		function()
+	return (time.perf_counter() - started) * 1000 / TIMING_REPEATS
+
+if __name__ == "__main__":
+	plans_to_check = int(sys.argv[1]) if len(sys.argv) > 1 else PLANS_TO_CHECK
+	with app.app_context():
+		mismatches = 0
+		for seed in range(plans_to_check):
+			user = seed_plan(scheduled_items=8, seed=seed)
+			try:
+				mismatches += check_plan(user, random.Random(seed))
+			finally:
+				db.session.rollback()
+				remove_plan(user)
+		print("{plans} random plans checked over {ranges} date ranges each, {mismatches} mismatches".format(
+			plans=plans_to_check, ranges=RANGES_PER_PLAN, mismatches=mismatches))
+		assert mismatches == 0, "The expander or plan_occurrence differs from the CalendarDay join for {mismatches} date ranges".format(mismatches=mismatches)
+
+		user = seed_plan(scheduled_items=40, seed=plans_to_check)
+		try:
+			expander = PlanExpander(user)
+			start_date = date.today()
+			end_date = start_date + timedelta(weeks=52)
+			print("52 weeks of planned activities and exercises for {count} scheduled items".format(count=80))
+			print("  CalendarDay join: {time:.2f}ms".format(time=timed(lambda: (legacy_planned_activities(user, start_date, end_date).all(),
+																				legacy_planned_exercises(user, start_date, end_date).all()))))
+			print("  in-memory expander: {time:.2f}ms".format(time=timed(lambda: (expander.planned_activities(start_date, end_date),
+																				  expander.planned_exercises(start_date, end_date)))))
+		finally:
+			db.session.rollback()
+			remove_plan(user)
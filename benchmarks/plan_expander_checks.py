@@ -0,0 +1,81 @@
+# Randomised checks of the date handling in app.plan_expander against the rules the CalendarDay joins in
+# benchmarks.plan_expander_benchmark apply, written out day by day. Doesn't need the database, so it can run anywhere
+# the app imports. Fails on the first difference. Run from the project root with:
+# python -m benchmarks.plan_expander_checks [cases to check]
+import calendar
+import random
+import sys
+from array import array
+from datetime import date, timedelta
+from app.plan_expander import PlanExpander, DAYS_OF_WEEK, weekday, week_start_ordinal, occurrence_ordinals, is_activity_completed, completed_set_count
+
+CASES_TO_CHECK = 5000
+
+def days(first_ordinal, last_ordinal):
+	return [date.fromordinal(ordinal) for ordinal in range(first_ordinal, last_ordinal + 1)]
+
+# What joining CalendarDay on scheduled_date == calendar_date or scheduled_day == day_of_week gives
+def joined_ordinals(scheduled_date, scheduled_day, first_ordinal, last_ordinal):
+	return [day.toordinal() for day in days(first_ordinal, last_ordinal) if day == scheduled_date or calendar.day_abbr[day.weekday()] == scheduled_day]
+
+# calendar_week_start_date, i.e. the Monday of the week
+def joined_week_start(day):
+	return day - timedelta(days=day.weekday())
+
+# The outer join onto Activity: the same day, or from the start of the week for weekly plans
+def joined_activity_completed(completion_dates, day, is_weekly):
+	return any([completion_date == day or (is_weekly and completion_date >= joined_week_start(day)) for completion_date in completion_dates])
+
+# The outer join onto Exercise: from the planned day to six days after
+def joined_completed_sets(completion_dates, day):
+	return len([completion_date for completion_date in completion_dates if day <= completion_date <= day + timedelta(days=6)])
+
+# The filter on calendar_date that keeps weekly plans for the rest of their week
+def joined_first_ordinal(start_ordinal, end_ordinal, planning_period):
+	today = date.today()
+	matching_days = [day for day in days(start_ordinal, end_ordinal) if day >= today or (planning_period == "week" and day >= today - timedelta(days=6))]
+	return matching_days[0].toordinal() if len(matching_days) > 0 else None
+
+def check(case_number, label, actual, expected, inputs):
+	assert actual == expected, "Case {case_number}, {label} with {inputs}: expander gave {actual}, the join gives {expected}".format(
+		case_number=case_number, label=label, inputs=inputs, actual=actual, expected=expected)
+
+def random_day(randomiser):
+	return date.today() + timedelta(days=randomiser.randint(-60, 400))
+
+if __name__ == "__main__":
+	cases_to_check = int(sys.argv[1]) if len(sys.argv) > 1 else CASES_TO_CHECK
+	expander = PlanExpander(user=None)
+	for case_number in range(cases_to_check):
+		randomiser = random.Random(case_number)
+		first_day = random_day(randomiser)
+		last_day = first_day + timedelta(days=randomiser.choice([0, 1, 6, 7, 27, 90, randomiser.randint(-3, 200)]))
+		first_ordinal = first_day.toordinal()
+		last_ordinal = last_day.toordinal()
+
+		check(case_number, "weekday", DAYS_OF_WEEK[weekday(first_ordinal)], calendar.day_abbr[first_day.weekday()], first_day)
+		check(case_number, "week_start_ordinal", date.fromordinal(week_start_ordinal(first_ordinal)), joined_week_start(first_day), first_day)
+
+		# Including days that aren't valid and plans with both a date and a (possibly different) day
+		scheduled_date = randomiser.choice([None, random_day(randomiser), first_day, last_day])
+		scheduled_day = randomiser.choice([None, "", "Funday"] + DAYS_OF_WEEK)
+		check(case_number, "occurrence_ordinals", occurrence_ordinals(scheduled_date, scheduled_day, first_ordinal, last_ordinal),
+			  joined_ordinals(scheduled_date, scheduled_day, first_ordinal, last_ordinal), (scheduled_date, scheduled_day, first_day, last_day))
+
+		planning_period = randomiser.choice(["day", "week"])
+		expected_first_ordinal = joined_first_ordinal(first_ordinal, last_ordinal, planning_period)
+		actual_first_ordinal = expander.first_ordinal(first_ordinal, planning_period)
+		check(case_number, "first_ordinal", actual_first_ordinal if actual_first_ordinal <= last_ordinal else None, expected_first_ordinal,
+			  (first_day, last_day, planning_period))
+
+		# Completions are loaded sorted by date, with repeats when more than one is on the same day
+		completion_dates = sorted([first_day + timedelta(days=randomiser.randint(-14, 21)) for i in range(randomiser.randint(0, 12))])
+		completed_ordinals = array("l", [completion_date.toordinal() for completion_date in completion_dates])
+		for day in days(first_ordinal, min(last_ordinal, first_ordinal + 13)):
+			for is_weekly in [False, True]:
+				check(case_number, "is_activity_completed", is_activity_completed(completed_ordinals, day.toordinal(), is_weekly),
+					  joined_activity_completed(completion_dates, day, is_weekly), (completion_dates, day, is_weekly))
+			check(case_number, "completed_set_count", completed_set_count(completed_ordinals, day.toordinal()),
+				  joined_completed_sets(completion_dates, day), (completion_dates, day))
+
+	print("{cases} random cases checked, the expander matches the joins".format(cases=cases_to_check))
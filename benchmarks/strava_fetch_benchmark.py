@@ -0,0 +1,31 @@
+# Fetches streams for a batch of activities from a fake Strava API, comparing serial and concurrent fetching and checking
+# that the rate limiter keeps us inside the quota. Run from the project root with: python -m benchmarks.strava_fetch_benchmark
+import time
+from app.strava_fetch import StravaStreamFetcher, StravaRateLimiter, TokenBucket
+from benchmarks.fake_strava import FakeStravaAdapter, fake_strava_session
+
+def fetch_streams(adapter, activity_count, max_workers, rate_limiter=None):
+	fetcher = StravaStreamFetcher(max_workers=max_workers,
+								  rate_limiter=rate_limiter,
+								  requests_session_factory=lambda: fake_strava_session(adapter))
+	start_time = time.time()
+	results = fetcher.fetch_all([(str(activity_id), "fake_token") for activity_id in range(1, activity_count + 1)])
+	elapsed_seconds = time.time() - start_time
+
+	assert all([isinstance(result, dict) and "cadence" in result for result in results]), "Some streams weren't fetched"
+	return elapsed_seconds, fetcher
+
+if __name__ == "__main__":
+	activity_count = 200
+
+	for max_workers in [1, 8, 16]:
+		elapsed_seconds, fetcher = fetch_streams(FakeStravaAdapter(latency_seconds=0.05), activity_count, max_workers)
+		print("{workers} threads: {count} activities in {seconds:.2f}s ({rate:.0f} activities/s)".format(
+			workers=max_workers, count=activity_count, seconds=elapsed_seconds, rate=activity_count / elapsed_seconds))
+
+	# A 10 second window with room for 40 requests. The limiter should spread the requests out so none are rejected
+	adapter = FakeStravaAdapter(latency_seconds=0.01, short_limit=40, short_window_seconds=10)
+	rate_limiter = StravaRateLimiter(buckets=[TokenBucket(40, 10), TokenBucket(30000, 86400)])
+	elapsed_seconds, fetcher = fetch_streams(adapter, 100, 8, rate_limiter=rate_limiter)
+	print("Quota of 40 per 10s: 100 activities in {seconds:.1f}s with {requests} requests, {rejected} rejected, {waited:.1f} thread seconds spent waiting".format(
+		seconds=elapsed_seconds, requests=adapter.request_count, rejected=adapter.rate_limited_count, waited=rate_limiter.waited_seconds))
@@ -0,0 +1,111 @@
+# Counts the queries it takes to put together (and read, the way weekly_activity.html does) the days of the weekly
+# activity page for users with a short and a long history, using the original whole-history approach and
+# analysis.weekly_activity_dataset. Fails unless the latter comes out the same for both. Needs the database from
+# config.py and cleans up after itself. Run from the project root with: python -m benchmarks.weekly_activity_query_count
+from datetime import datetime, date, timedelta
+from sqlalchemy import event
+from app import app, db, analysis
+from app.models import User, Exercise, ExerciseType, ExerciseCategory, CalendarDay
+from benchmarks.goal_evaluation_benchmark import seed_user, remove_user
+
+HISTORY_WEEKS = [2, 52]
+
+def seed_exercises(user, weeks):
+	category = ExerciseCategory(owner=user, category_name="Strength", category_key="cat2")
+	exercise_types = [ExerciseType(owner=user, name="Exercise {i}".format(i=i), measured_by="reps", exercise_category=category if i % 2 == 0 else None) for i in range(4)]
+	db.session.add_all([category] + exercise_types)
+	for day_number in range(weeks * 7):
+		for exercise_type in exercise_types:
+			db.session.add(Exercise(type=exercise_type, reps=10, exercise_datetime=datetime.combine(date.today() - timedelta(days=day_number), datetime.min.time()) + timedelta(hours=18)))
+	db.session.commit()
+
+def remove_exercises(user):
+	exercise_type_ids = [exercise_type.id for exercise_type in user.exercise_types.all()]
+	Exercise.query.filter(Exercise.exercise_type_id.in_(exercise_type_ids)).delete(synchronize_session=False)
+	ExerciseType.query.filter(ExerciseType.user_id == user.id).delete(synchronize_session=False)
+	ExerciseCategory.query.filter(ExerciseCategory.user_id == user.id).delete(synchronize_session=False)
+	db.session.commit()
+
+# The day by day loop from routes.weekly_activity before weekly_activity_dataset
+def legacy_weekly_activity_dataset(week, user):
+	days = CalendarDay.query.filter_by(calendar_week_start_date=week).order_by(CalendarDay.calendar_date.desc()).all()
+	all_exercises = user.exercises().all()
+	all_activities = user.activities.all()
+	categories = user.exercise_categories.all()
+
+	current_week_dataset = []
+	current_week_activity_count = 0
+	for day in days:
+		exercises_by_category = []
+		for category in categories:
+			category_exercises = [exercise for exercise in all_exercises if exercise.exercise_date==day.calendar_date and exercise.type.exercise_category==category]
+			if len(category_exercises) > 0:
+				exercises_by_category.append(dict(category=category, exercise_count=len(category_exercises), exercises=category_exercises))
+				current_week_activity_count += 1
+		uncategorised_exercises = [exercise for exercise in all_exercises if exercise.exercise_date==day.calendar_date and exercise.type.exercise_category is None]
+		if len(uncategorised_exercises) > 0:
+			exercises_by_category.append(dict(category=None, exercise_count=len(uncategorised_exercises), exercises=uncategorised_exercises))
+			current_week_activity_count += 1
+		day_activities = [activity for activity in all_activities if activity.activity_date==day.calendar_date]
+		current_week_activity_count += len(day_activities)
+
+		if day.calendar_date > date.today():
+			scheduled_activities = user.scheduled_activities_filtered(day.day_of_week).all()
+			scheduled_exercise_categories = user.scheduled_exercise_categories(day.day_of_week).all()
+		else:
+			scheduled_activities = []
+			scheduled_exercise_categories = []
+
+		current_week_dataset.append(dict(day=day, exercises_by_category=exercises_by_category, activities=day_activities,
+										 scheduled_activities=scheduled_activities, scheduled_exercise_categories=scheduled_exercise_categories))
+	return current_week_dataset, current_week_activity_count
+
+def render_attributes(dataset):
+	# What weekly_activity.html and _activity_summary.html read for each day
+	for day_detail in dataset:
+		for activity in day_detail["activities"]:
+			activity.category.category_key if activity.category is not None else None
+		for category_group in day_detail["exercises_by_category"]:
+			for exercise in category_group["exercises"]:
+				exercise.scheduled_exercise, exercise.type.name, exercise.type.measured_by
+
+def count_queries(build_dataset):
+	statements = []
+	def count(conn, cursor, statement, parameters, context, executemany):
+		statements.append(statement)
+
+	event.listen(db.engine, "before_cursor_execute", count)
+	try:
+		dataset, activity_count = build_dataset()
+		render_attributes(dataset)
+	finally:
+		event.remove(db.engine, "before_cursor_execute", count)
+	return len(statements), activity_count
+
+if __name__ == "__main__":
+	with app.app_context():
+		dataset_query_counts = {}
+		for weeks in HISTORY_WEEKS:
+			user, current_week = seed_user(weeks=weeks, runs_per_week=5)
+			try:
+				seed_exercises(user, weeks)
+				user_id = user.id
+				results = []
+				for label, build_dataset in [("whole history", lambda: legacy_weekly_activity_dataset(current_week, user)),
+											 ("weekly_activity_dataset", lambda: analysis.weekly_activity_dataset(current_week, user=user))]:
+					# Start each from an empty session so nothing is already loaded
+					db.session.expunge_all()
+					user = User.query.get(user_id)
+					query_count, activity_count = count_queries(build_dataset)
+					results.append(activity_count)
+					if label == "weekly_activity_dataset":
+						dataset_query_counts[weeks] = query_count
+					print("{weeks} weeks of history, {label}: {count} queries".format(weeks=weeks, label=label, count=query_count))
+				if results[0] != results[1]:
+					print("  activity counts differ: {results}".format(results=results))
+			finally:
+				db.session.rollback()
+				remove_exercises(user)
+				remove_user(user)
+
+		assert len(set(dataset_query_counts.values())) == 1, "weekly_activity_dataset query count grows with history: {counts}".format(counts=dataset_query_counts)
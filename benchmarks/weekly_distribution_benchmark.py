@@ -0,0 +1,52 @@
+# Times summarising cadence stats with the original row by row loop against analysis.summarise_weekly_cadence_stats
+# (backed by WeeklyDistribution) on synthetic stats for a week and for a 16 week training block, and checks they agree.
+# Doesn't touch the database. Run from the project root with: python -m benchmarks.weekly_distribution_benchmark
+import random
+import time
+from collections import namedtuple
+from app import analysis
+from app.app_classes import TempCadenceAggregate
+
+CadenceStat = namedtuple("CadenceStat", ["cadence", "total_seconds_at_cadence"])
+REPEATS = 200
+
+def synthetic_cadence_stats(weeks, seed=1):
+	# One row per cadence per week in descending order, with the odd cadence missing so there are gaps to fill
+	randomiser = random.Random(seed)
+	return [CadenceStat(cadence=cadence, total_seconds_at_cadence=randomiser.randint(0, 900))
+			for week in range(weeks) for cadence in range(200, 100, -1) if randomiser.random() < 0.6]
+
+# The loop from analysis before WeeklyDistribution, summing each cadence across weeks first so it can cover a block
+def legacy_summary(weekly_cadence_stats):
+	totals_at_cadence = {}
+	for cadence_aggregate in weekly_cadence_stats:
+		totals_at_cadence[cadence_aggregate.cadence] = totals_at_cadence.get(cadence_aggregate.cadence, 0) + cadence_aggregate.total_seconds_at_cadence
+
+	previous_cadence = 0
+	weekly_running_total = 0
+	weekly_cadence_summary = []
+	for cadence in sorted(totals_at_cadence, reverse=True):
+		if cadence < previous_cadence - 2:
+			gap_cadence = previous_cadence - 2
+			while gap_cadence > cadence:
+				weekly_cadence_summary.append(TempCadenceAggregate(cadence=gap_cadence, total_seconds_above_cadence=weekly_running_total))
+				gap_cadence -= 2
+		weekly_running_total += totals_at_cadence[cadence]
+		weekly_cadence_summary.append(TempCadenceAggregate(cadence=cadence, total_seconds_above_cadence=weekly_running_total))
+		previous_cadence = cadence
+	return weekly_cadence_summary
+
+def timed(function):
+	started = time.perf_counter()
+	for i in range(REPEATS):
+		function()
+	return (time.perf_counter() - started) * 1000 / REPEATS
+
+if __name__ == "__main__":
+	for weeks in [1, 16]:
+		stats = synthetic_cadence_stats(weeks)
+		expected = [(row.cadence, row.total_seconds_above_cadence) for row in legacy_summary(stats)]
+		actual = [(row.cadence, row.total_seconds_above_cadence) for row in analysis.summarise_weekly_cadence_stats(stats)["summary"]]
+		print("{weeks} weeks, {rows} rows: {result}".format(weeks=weeks, rows=len(stats), result="same summary" if expected == actual else "summaries differ"))
+		print("  row by row loop: {time:.3f}ms".format(time=timed(lambda: legacy_summary(stats))))
+		print("  WeeklyDistribution: {time:.3f}ms".format(time=timed(lambda: analysis.summarise_weekly_cadence_stats(stats))))
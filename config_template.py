@@ -56,4 +56,43 @@ class Config(object):
     GA_TRACKING_ID = os.environ.get('GA_TRACKING_ID') or '<ga_id>'
 
     # Custom app settings
-    EXERCISES_PER_PAGE = 5
\ No newline at end of file
+    EXERCISES_PER_PAGE = 5
+    STREAM_RESPONSE_BATCH_SIZE = 500 # rows fetched at a time for API responses requested with stream=true
+
+    # Background stream parsing, see `flask parse_stream_jobs`
+    STREAM_PARSE_WORKER_PROCESSES = 4
+    STREAM_PARSE_MAX_ATTEMPTS = 5
+    STREAM_PARSE_RETRY_SECONDS = 60
+    STREAM_PARSE_POLL_SECONDS = 5
+    STREAM_PARSE_BATCH_SIZE = 8
+
+    # Strava API quotas for the whole app, shared between the stream parsing workers
+    STRAVA_RATE_LIMIT_15_MIN = 600
+    STRAVA_RATE_LIMIT_DAILY = 30000
+    STRAVA_FETCH_THREADS = 8
+    STRAVA_SYNC_PAGE_SIZE = 200 # activities upserted and checkpointed at a time when syncing from Strava
+
+    # Strava webhook events, see `flask create_strava_webhook_subscription` and `flask process_strava_webhook_events`
+    STRAVA_WEBHOOK_VERIFY_TOKEN = '<random_string_strava_echoes_back>'
+    STRAVA_WEBHOOK_SUBSCRIPTION_ID = None
+    STRAVA_WEBHOOK_BATCH_SIZE = 50
+    STRAVA_WEBHOOK_MAX_ATTEMPTS = 5
+    STRAVA_WEBHOOK_RETRY_SECONDS = 60
+    STRAVA_WEBHOOK_POLL_SECONDS = 5
+
+    # Nightly goal evaluation, see `flask evaluate_goals`
+    GOAL_EVALUATION_PROCESSES = 4
+
+    # Number of weeks ahead that recurring plans are expanded into plan_occurrence, see `flask extend_plan_occurrences`
+    PLAN_OCCURRENCE_HORIZON_WEEKS = 26
+
+    # Cached API responses, see app/response_cache.py. 'lru' keeps them in each process, 'redis' shares them between
+    # processes and anything else turns caching off
+    RESPONSE_CACHE_BACKEND = 'lru'
+    RESPONSE_CACHE_MAX_ENTRIES = 10000
+    RESPONSE_CACHE_TTL_SECONDS = 300
+    RESPONSE_CACHE_REDIS_URL = None
+
+    # Bokeh charts drawn for the weekly activity and activity analysis pages, kept in each process, see app/chart_cache.py
+    CHART_CACHE_MAX_ENTRIES = 2000
+    CHART_CACHE_TTL_SECONDS = 86400